@@ -1,32 +1,15 @@
-import sqlite3
+from db_connection import get_read_connection
+from queries import FREQUENZA_ARBITRI, FREQUENZA_MENSILE, FREQUENZA_DISTRIBUZIONE
 import pandas as pd
 
 def analyze_arbitration_frequency():
     """Analizza la frequenza di arbitraggio per aprile-maggio 2025"""
-    conn = sqlite3.connect('arbitri.db')
-    
     print("📊 ANALISI FREQUENZA ARBITRAGGIO APRILE-MAGGIO 2025")
     print("="*60)
     
     # Frequenza arbitraggio per arbitro nel periodo esteso
-    frequency_query = """
-        SELECT 
-            a.cognome,
-            a.nome,
-            a.cod_mecc,
-            COUNT(g.numero_gara) as numero_gare,
-            GROUP_CONCAT(DISTINCT g.categoria || ' ' || g.girone) as categorie_arbitrate,
-            MIN(g.data_gara) as prima_gara,
-            MAX(g.data_gara) as ultima_gara
-        FROM arbitri a
-        LEFT JOIN gare g ON a.cod_mecc = g.cod_mecc
-        WHERE g.data_gara BETWEEN '2025-04-01' AND '2025-05-31'
-        AND g.ruolo = 'AR'
-        GROUP BY a.cod_mecc, a.cognome, a.nome
-        ORDER BY numero_gare DESC, a.cognome
-    """
-    
-    frequency_df = pd.read_sql_query(frequency_query, conn)
+    with get_read_connection() as conn:
+        frequency_df = pd.read_sql_query(FREQUENZA_ARBITRI, conn, params=['2025-04-01', '2025-05-31'])
     
     print(f"🏃 TOP 15 ARBITRI PIÙ ATTIVI (Aprile-Maggio):")
     print("-" * 60)
@@ -38,39 +21,11 @@ def analyze_arbitration_frequency():
         print()
     
     # Statistiche per mese
-    april_stats = pd.read_sql_query("""
-        SELECT 
-            COUNT(DISTINCT g.cod_mecc) as arbitri_attivi,
-            COUNT(g.numero_gara) as totale_gare,
-            AVG(gare_per_arbitro.numero_gare) as media_gare_per_arbitro
-        FROM (
-            SELECT cod_mecc, COUNT(*) as numero_gare
-            FROM gare 
-            WHERE data_gara BETWEEN '2025-04-01' AND '2025-04-30' 
-            AND ruolo = 'AR'
-            GROUP BY cod_mecc
-        ) as gare_per_arbitro
-        JOIN gare g ON gare_per_arbitro.cod_mecc = g.cod_mecc
-        WHERE g.data_gara BETWEEN '2025-04-01' AND '2025-04-30'
-        AND g.ruolo = 'AR'
-    """, conn)
+    with get_read_connection() as conn:
+        april_stats = pd.read_sql_query(FREQUENZA_MENSILE, conn, params=['2025-04-01', '2025-04-30'] * 2)
     
-    may_stats = pd.read_sql_query("""
-        SELECT 
-            COUNT(DISTINCT g.cod_mecc) as arbitri_attivi,
-            COUNT(g.numero_gara) as totale_gare,
-            AVG(gare_per_arbitro.numero_gare) as media_gare_per_arbitro
-        FROM (
-            SELECT cod_mecc, COUNT(*) as numero_gare
-            FROM gare 
-            WHERE data_gara BETWEEN '2025-05-01' AND '2025-05-31' 
-            AND ruolo = 'AR'
-            GROUP BY cod_mecc
-        ) as gare_per_arbitro
-        JOIN gare g ON gare_per_arbitro.cod_mecc = g.cod_mecc
-        WHERE g.data_gara BETWEEN '2025-05-01' AND '2025-05-31'
-        AND g.ruolo = 'AR'
-    """, conn)
+    with get_read_connection() as conn:
+        may_stats = pd.read_sql_query(FREQUENZA_MENSILE, conn, params=['2025-05-01', '2025-05-31'] * 2)
     
     print("📅 CONFRONTO MENSILE:")
     print("-" * 30)
@@ -85,29 +40,14 @@ def analyze_arbitration_frequency():
     print(f"  📈 Media gare/arbitro: {may_stats.iloc[0, 2]:.1f}" if not may_stats.empty and may_stats.iloc[0, 2] else "N/A")
     
     # Distribuzione gare
-    distribution_query = """
-        SELECT 
-            numero_gare,
-            COUNT(*) as num_arbitri
-        FROM (
-            SELECT cod_mecc, COUNT(*) as numero_gare
-            FROM gare 
-            WHERE data_gara BETWEEN '2025-04-01' AND '2025-05-31' 
-            AND ruolo = 'AR'
-            GROUP BY cod_mecc
-        )
-        GROUP BY numero_gare
-        ORDER BY numero_gare DESC
-    """
-    
-    distribution_df = pd.read_sql_query(distribution_query, conn)
+    with get_read_connection() as conn:
+        distribution_df = pd.read_sql_query(FREQUENZA_DISTRIBUZIONE, conn, params=['2025-04-01', '2025-05-31'])
     
     print(f"\n📊 DISTRIBUZIONE FREQUENZA:")
     print("-" * 30)
     for _, row in distribution_df.head(10).iterrows():
         print(f"  {row['numero_gare']:2d} gare: {row['num_arbitri']:3d} arbitri")
     
-    conn.close()
     return frequency_df
 
 if __name__ == "__main__":
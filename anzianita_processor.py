@@ -2,9 +2,10 @@
 Processore per file di anzianità arbitri
 """
 import pandas as pd
-import pdfplumber
 import re
 from database import update_arbitro_anzianita, get_arbitri
+from pdf_extraction import extract_pdf_pages, iter_pdf_lines
+from file_processors import read_excel_format
 
 def process_anzianita_file(uploaded_file):
     """Processa file con anzianità arbitri"""
@@ -24,31 +25,19 @@ def process_anzianita_file(uploaded_file):
 def process_anzianita_excel(uploaded_file):
     """Processa file Excel con anzianità"""
     try:
-        # Leggi il file Excel
-        df = pd.read_excel(uploaded_file)
-        
-        # Cerca le colonne rilevanti (flessibile per diverse strutture)
-        column_mapping = {}
-        
-        for col in df.columns:
-            col_lower = str(col).lower()
-            if any(word in col_lower for word in ['cognome', 'surname']):
-                column_mapping['cognome'] = col
-            elif any(word in col_lower for word in ['nome', 'name']):
-                column_mapping['nome'] = col
-            elif any(word in col_lower for word in ['anzianita', 'anzianità', 'anno', 'year', 'esperienza']):
-                column_mapping['anzianita'] = col
-        
-        if 'cognome' not in column_mapping or 'anzianita' not in column_mapping:
+        # Leggi il file Excel: colonne riconosciute dall'intestazione, lette solo quelle necessarie
+        chunks, error = read_excel_format(uploaded_file, 'anzianita')
+        if chunks is None:
             return {'success': False, 'message': 'Colonne cognome e anzianità non trovate nel file'}
+        df = pd.concat(chunks)
         
         # Processa i dati
         arbitri_db = get_arbitri()
         updated_count = 0
         
         for _, row in df.iterrows():
-            cognome = str(row[column_mapping['cognome']]).strip().upper()
-            anzianita = row[column_mapping['anzianita']]
+            cognome = str(row['cognome']).upper()
+            anzianita = row['anzianita']
             
             # Cerca l'arbitro nel database
             arbitro_match = arbitri_db[arbitri_db['cognome'].str.upper() == cognome]
@@ -56,14 +45,10 @@ def process_anzianita_excel(uploaded_file):
             if not arbitro_match.empty:
                 cod_mecc = arbitro_match.iloc[0]['cod_mecc']
                 
-                # Converti anzianità in numero
+                # Anzianità già convertita in intero in lettura (vuota se non numerica)
                 if pd.notna(anzianita):
-                    try:
-                        anno_anzianita = int(float(anzianita))
-                        if update_arbitro_anzianita(cod_mecc, anno_anzianita):
-                            updated_count += 1
-                    except (ValueError, TypeError):
-                        continue
+                    if update_arbitro_anzianita(cod_mecc, int(anzianita)):
+                        updated_count += 1
         
         return {
             'success': True, 
@@ -76,22 +61,15 @@ def process_anzianita_excel(uploaded_file):
 def process_anzianita_pdf(uploaded_file):
     """Processa file PDF con anzianità dalla graduatoria"""
     try:
-        # Leggi il PDF
-        with pdfplumber.open(uploaded_file) as pdf:
-            full_text = ''
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    full_text += page_text + '\n'
-        
-        lines = full_text.split('\n')
+        # Leggi il PDF: testo estratto pagina per pagina, in parallelo sui documenti lunghi
+        pages = extract_pdf_pages(uploaded_file)
         arbitri_db = get_arbitri()
         updated_count = 0
         
-        print(f"Processando {len(lines)} righe del PDF graduatoria...")
+        print(f"Processando {len(pages)} pagine del PDF graduatoria...")
         
         # Pattern per la graduatoria: Pos COGNOME_NOME SEZIONE ... Età Anz
-        for line in lines:
+        for line in iter_pdf_lines(pages):
             line = line.strip()
             if not line:
                 continue
@@ -1,13 +1,24 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
 from datetime import datetime, timedelta
-from database import init_database, get_arbitri
-from file_processors import process_gare_file, process_voti_pdf, process_indisponibilita_file
+from database import init_database, bump_data_version, get_ingest_job, INGEST_JOB_ACTIVE
+from db_connection import get_connection, get_read_connection
+from queries import (
+    CONTEGGIO_GARE_AR, CONTEGGIO_VOTI_AR, CONTEGGIO_VOTI_TOTALI, CONTEGGIO_VOTI_AR_OT,
+    CONTEGGIO_VOTI_OA, CONTEGGIO_VOTI_OT, OT_GARE_PER_COGNOME, OT_VOTI_PER_ARBITRO,
+    ARBITRO_PER_CODICE, AGGIORNA_REGIONI_ARBITRO, REGIONI_APPARTENENZA, REGIONI_PARTENZA,
+    PARTENZE_ARBITRI, PARTENZE_FILTRO_APPARTENENZA, PARTENZE_FILTRO_PARTENZA,
+    PARTENZE_FILTRO_SEZIONE, PARTENZE_ORDINAMENTO,
+    SALVA_NOTA_SETTIMANALE, ELIMINA_NOTA_SETTIMANALE, NOTA_SETTIMANALE, TUTTE_LE_NOTE, DASHBOARD_CATEGORIE
+)
+from ingest_worker import submit_ingest_job
+from weekly_grid import referee_week_keys, refresh_referee_week
 
-from data_loader import ensure_anagrafica_loaded
-from populate_complete_db import populate_complete_database_if_empty
-from export_utils import export_all_data_to_excel, get_arbitration_stats_by_category
+from data_cache import (
+    data_token, invalidate_cache, anagrafica_signature, cached_startup, cached_arbitri, cached_arbitri_labels,
+    cached_query, cached_weekly_count, cached_weekly_page, cached_arbitration_stats, cached_career_data
+)
+from export_utils import export_all_data_to_excel
 from utils import get_week_ranges, format_date_range
 from pdf_export import create_arbitri_dashboard_html, get_html_download_link
 import os
@@ -26,53 +37,67 @@ init_database()
 
 # Funzioni per gestire le note settimanali
 def save_nota_settimanale(cod_mecc, settimana_inizio, settimana_fine, nota):
-    conn = sqlite3.connect('arbitri.db')
-    cursor = conn.cursor()
-    
-    # Crea la tabella se non esiste
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS note_settimanali (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            cod_mecc TEXT NOT NULL,
-            settimana_inizio TEXT NOT NULL,
-            settimana_fine TEXT NOT NULL,
-            nota TEXT NOT NULL,
-            data_modifica TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(cod_mecc, settimana_inizio, settimana_fine)
-        )
-    ''')
-    
-    cursor.execute('''
-        INSERT OR REPLACE INTO note_settimanali 
-        (cod_mecc, settimana_inizio, settimana_fine, nota, data_modifica)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (cod_mecc, settimana_inizio, settimana_fine, nota, datetime.now()))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute(SALVA_NOTA_SETTIMANALE, (cod_mecc, settimana_inizio, settimana_fine, nota, datetime.now()))
+        refresh_referee_week(conn, referee_week_keys([(cod_mecc, settimana_inizio, settimana_fine)]))
+        bump_data_version(conn)
+    invalidate_cache()
 
 def delete_nota_settimanale(cod_mecc, settimana_inizio, settimana_fine):
-    conn = sqlite3.connect('arbitri.db')
-    cursor = conn.cursor()
-    
-    # Crea la tabella se non esiste
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS note_settimanali (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            cod_mecc TEXT NOT NULL,
-            settimana_inizio TEXT NOT NULL,
-            settimana_fine TEXT NOT NULL,
-            nota TEXT NOT NULL,
-            data_modifica TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(cod_mecc, settimana_inizio, settimana_fine)
-        )
-    ''')
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute(ELIMINA_NOTA_SETTIMANALE, (cod_mecc, settimana_inizio, settimana_fine))
+        refresh_referee_week(conn, referee_week_keys([(cod_mecc, settimana_inizio, settimana_fine)]))
+        bump_data_version(conn)
+    invalidate_cache()
+
+# Funzioni per i caricamenti elaborati in background
+def show_ingest_job(job):
+    """Mostra stato e avanzamento di un caricamento"""
+    if job['stato'] in INGEST_JOB_ACTIVE:
+        st.progress(job['progresso'] or 0.0, text=job['messaggio'] or "In coda...")
+    elif job['stato'] == 'completato':
+        st.success(job['messaggio'])
+    else:
+        st.error(job['messaggio'])
+
+@st.fragment(run_every=1)
+def follow_ingest_job(job_id):
+    """Aggiorna ogni secondo lo stato di un caricamento in corso; alla conclusione svuota la cache e
+    ricarica la pagina perché le dashboard mostrino i nuovi dati"""
+    job = get_ingest_job(job_id)
+    if job is None:
+        return
+    show_ingest_job(job)
+    if job['stato'] not in INGEST_JOB_ACTIVE:
+        invalidate_cache()
+        st.rerun()
+
+def handle_upload(uploaded_file, tipo):
+    """Accoda il file caricato una sola volta per upload e ne mostra lo stato: i rerun successivi
+    seguono il job già creato invece di rielaborare il file. L'esito di un job concluso viene
+    conservato nella sessione e non viene più riletto dal database."""
+    jobs = st.session_state.setdefault('ingest_jobs', {})
+    if uploaded_file.file_id not in jobs:
+        jobs[uploaded_file.file_id] = submit_ingest_job(uploaded_file, tipo)
+    submitted = jobs[uploaded_file.file_id]
     
-    cursor.execute('''
-        DELETE FROM note_settimanali 
-        WHERE cod_mecc = ? AND settimana_inizio = ? AND settimana_fine = ?
-    ''', (cod_mecc, settimana_inizio, settimana_fine))
-    conn.commit()
-    conn.close()
+    if submitted.get('skipped'):
+        st.info(submitted['message'])
+    elif submitted['job_id'] is None:
+        st.error(submitted['message'])
+    elif 'job' in submitted:
+        show_ingest_job(submitted['job'])
+    else:
+        job = get_ingest_job(submitted['job_id'])
+        if job is not None and job['stato'] in INGEST_JOB_ACTIVE:
+            follow_ingest_job(submitted['job_id'])
+        elif job is not None:
+            submitted['job'] = job
+            show_ingest_job(job)
 
 # Funzione per caricare il logo come base64
 def get_logo_base64():
@@ -94,11 +119,12 @@ def get_logo_base64():
     </svg>"""
     return base64.b64encode(svg_logo.encode()).decode()
 
-# Carica automaticamente l'anagrafica se non presente
-anagrafica_result = ensure_anagrafica_loaded()
+# Carica automaticamente l'anagrafica se non presente e popola il database completo se vuoto
+# (per Streamlit Cloud): i controlli si ripetono solo se cambiano i dati o il file anagrafica
+anagrafica_result, populate_result = cached_startup(data_token(), anagrafica_signature())
 
-# Popola il database completo se vuoto (per Streamlit Cloud)
-populate_result = populate_complete_database_if_empty()
+# Versione dei dati usata come chiave della cache per tutte le letture della pagina
+versione = data_token()
 
 # Testata professionale con CSS semplificato
 st.markdown(f"""
@@ -128,6 +154,9 @@ with st.sidebar:
     
     st.markdown("### File da caricare:")
     
+    # I file vengono elaborati in background: il widget mantiene il file tra un rerun e l'altro,
+    # handle_upload accoda ogni upload una sola volta e ne segue l'avanzamento
+    
     # Upload CRA01 (Gare)
     uploaded_gare = st.file_uploader(
         "📋 File Gare (CRA01)", 
@@ -136,12 +165,7 @@ with st.sidebar:
     )
     
     if uploaded_gare is not None:
-        with st.spinner("Elaborazione gare..."):
-            result = process_gare_file(uploaded_gare)
-            if result['success']:
-                st.success(result['message'])
-            else:
-                st.error(result['message'])
+        handle_upload(uploaded_gare, 'gare')
     
     # Upload PDF Voti
     uploaded_voti = st.file_uploader(
@@ -151,12 +175,7 @@ with st.sidebar:
     )
     
     if uploaded_voti is not None:
-        with st.spinner("Elaborazione voti..."):
-            result = process_voti_pdf(uploaded_voti)
-            if result['success']:
-                st.success(result['message'])
-            else:
-                st.error(result['message'])
+        handle_upload(uploaded_voti, 'voti')
     
     # Upload Indisponibilità
     uploaded_indisponibilita = st.file_uploader(
@@ -166,12 +185,7 @@ with st.sidebar:
     )
     
     if uploaded_indisponibilita is not None:
-        with st.spinner("Elaborazione indisponibilità..."):
-            result = process_indisponibilita_file(uploaded_indisponibilita)
-            if result['success']:
-                st.success(result['message'])
-            else:
-                st.error(result['message'])
+        handle_upload(uploaded_indisponibilita, 'indisponibilita')
     
     st.markdown("---")
     
@@ -265,9 +279,9 @@ with tab1:
         st.session_state['end_date'] = data_fine
     with col3:
         # Ottieni la lista degli arbitri per il filtro
-        arbitri_temp = get_arbitri()
-        if not arbitri_temp.empty:
-            arbitri_options = ["Tutti gli arbitri"] + [f"{row['cognome']} {row['nome']}" for _, row in arbitri_temp.iterrows()]
+        arbitri_labels = cached_arbitri_labels(versione)
+        if arbitri_labels:
+            arbitri_options = ["Tutti gli arbitri"] + arbitri_labels
             arbitro_selezionato = st.selectbox(
                 "Filtro arbitro",
                 options=arbitri_options,
@@ -284,19 +298,7 @@ with tab1:
         st.stop()
     
     # Ottieni i dati
-    arbitri_df = get_arbitri()
-    
-    # Applica filtro arbitro se selezionato
-    if not arbitri_df.empty and arbitro_selezionato != "Tutti gli arbitri":
-        # Estrai cognome e nome dal filtro selezionato
-        cognome_nome = arbitro_selezionato.split(" ", 1)
-        if len(cognome_nome) >= 2:
-            cognome_filtro = cognome_nome[0]
-            nome_filtro = cognome_nome[1]
-            arbitri_df = arbitri_df[
-                (arbitri_df['cognome'] == cognome_filtro) & 
-                (arbitri_df['nome'] == nome_filtro)
-            ]
+    arbitri_df = cached_arbitri(versione)
     
     if not arbitri_df.empty:
         # Filtra le settimane in base alle date selezionate
@@ -318,198 +320,53 @@ with tab1:
             st.warning("Nessuna settimana trovata per il periodo selezionato")
             st.stop()
         
-        # Query per ottenere tutti i dati necessari
-        conn = sqlite3.connect('arbitri.db')
-        
-        # Gare con categoria e girone filtrate per periodo - esclude ruolo QU
-        gare_query = '''
-            SELECT g.cod_mecc, g.categoria, g.girone, g.data_gara, g.numero_gara,
-                   a.cognome, a.nome, a.anno_anzianita
-            FROM gare g
-            JOIN arbitri a ON g.cod_mecc = a.cod_mecc
-            WHERE g.data_gara IS NOT NULL 
-            AND g.data_gara BETWEEN ? AND ?
-            AND g.ruolo != 'QU'
-        '''
-        gare_df = pd.read_sql_query(gare_query, conn, params=[data_inizio, data_fine])
-        
-        # Voti filtrati per periodo con cognome OT - esclude ruolo QU
-        voti_query = '''
-            SELECT v.numero_gara, v.voto_oa, v.voto_ot, g.data_gara, g.cod_mecc,
-                   ot.cognome_ot
-            FROM voti v
-            JOIN gare g ON v.numero_gara = g.numero_gara
-            LEFT JOIN organi_tecnici ot ON v.numero_gara = ot.numero_gara
-            WHERE g.data_gara IS NOT NULL
-            AND g.data_gara BETWEEN ? AND ?
-            AND g.ruolo != 'QU'
-        '''
-        voti_df = pd.read_sql_query(voti_query, conn, params=[data_inizio, data_fine])
-        
-        # Indisponibilità con matching migliorato filtrate per periodo
-        indisponibilita_query = '''
-            SELECT i.cod_mecc, i.data_indisponibilita, i.motivo,
-                   a.cod_mecc as arbitro_cod_mecc, a.cognome, a.nome
-            FROM indisponibilita i
-            JOIN arbitri a ON (
-                i.cod_mecc = a.cod_mecc OR
-                CAST(SUBSTR(a.cod_mecc, -5) AS INTEGER) = CAST(i.cod_mecc AS INTEGER) OR
-                CAST(SUBSTR(a.cod_mecc, -6) AS INTEGER) = CAST(i.cod_mecc AS INTEGER) OR
-                CAST(SUBSTR(a.cod_mecc, -7) AS INTEGER) = CAST(i.cod_mecc AS INTEGER) OR
-                CAST(SUBSTR(a.cod_mecc, -4) AS INTEGER) = CAST(i.cod_mecc AS INTEGER) OR
-                CAST(SUBSTR(a.cod_mecc, -3) AS INTEGER) = CAST(i.cod_mecc AS INTEGER)
+        # Filtri della tabella, applicati nella query degli arbitri
+        col4, col5, col6 = st.columns(3)
+        with col4:
+            sezioni = sorted(arbitri_df['sezione'].dropna().astype(str).unique())
+            sezione_selezionata = st.selectbox(
+                "Sezione",
+                options=["Tutte le sezioni"] + sezioni,
+                index=0,
+                help="Mostra solo gli arbitri della sezione selezionata"
+            )
+        with col5:
+            categorie = cached_query(versione, DASHBOARD_CATEGORIE, (data_inizio, data_fine))['categoria'].tolist()
+            categoria_selezionata = st.selectbox(
+                "Categoria",
+                options=["Tutte le categorie"] + categorie,
+                index=0,
+                help="Mostra solo gli arbitri con almeno una gara della categoria nel periodo"
+            )
+        with col6:
+            solo_attivi = st.toggle(
+                "Solo arbitri con attività",
+                help="Nasconde gli arbitri senza gare, voti, indisponibilità o note nelle settimane mostrate"
             )
-            WHERE i.data_indisponibilita BETWEEN ? AND ?
-        '''
-        indisponibilita_df = pd.read_sql_query(indisponibilita_query, conn, params=[data_inizio, data_fine])
-        conn.close()
         
-        # Converti date
-        if not gare_df.empty:
-            gare_df['data_gara'] = pd.to_datetime(gare_df['data_gara']).dt.date
-        if not voti_df.empty:
-            voti_df['data_gara'] = pd.to_datetime(voti_df['data_gara']).dt.date
-        if not indisponibilita_df.empty:
-            indisponibilita_df['data_indisponibilita'] = pd.to_datetime(indisponibilita_df['data_indisponibilita']).dt.date
+        filtri = (
+            arbitro_selezionato if arbitro_selezionato != "Tutti gli arbitri" else None,
+            sezione_selezionata if sezione_selezionata != "Tutte le sezioni" else None,
+            categoria_selezionata if categoria_selezionata != "Tutte le categorie" else None,
+            solo_attivi,
+        )
+        totale = cached_weekly_count(versione, data_inizio, data_fine, *filtri, week_ranges)
         
-        # Prepara dati tabella
-        table_data = []
+        # Paginazione: la griglia viene calcolata e inviata al browser solo per gli arbitri della pagina
+        col7, col8, col9 = st.columns(3)
+        with col7:
+            per_pagina = st.selectbox("Arbitri per pagina", options=[25, 50, 100, 200], index=1)
+        pagine = max(1, -(-totale // per_pagina))
+        with col8:
+            pagina = st.selectbox("Pagina", options=range(1, pagine + 1), format_func=lambda p: f"{p} di {pagine}")
+        with col9:
+            primo = (pagina - 1) * per_pagina
+            st.markdown(f"**Arbitri {min(primo + 1, totale)}-{min(primo + per_pagina, totale)} di {totale}**")
         
-        for _, arbitro in arbitri_df.iterrows():
-            # Calcola anzianità se presente
-            anzianita_display = ""
-            if pd.notna(arbitro.get('anno_anzianita')) and str(arbitro.get('anno_anzianita', '')) != '':
-                try:
-                    anno_inizio = int(arbitro['anno_anzianita'])
-                    anni_esperienza = 2025 - anno_inizio
-                    anzianita_display = str(anni_esperienza) if anni_esperienza > 0 else "0"
-                except (ValueError, TypeError):
-                    anzianita_display = ""
-            
-            row = {
-                'Arbitro': f"{arbitro['cognome']} {arbitro['nome']}",
-                'Sez.': arbitro.get('sezione', ''),
-                'Età': arbitro.get('eta', ''),
-                'Anz.': anzianita_display
-            }
-            
-            # Per ogni settimana
-            for week_num, (week_start, week_end) in enumerate(week_ranges, 1):
-                week_start_date = week_start.date()
-                week_end_date = week_end.date()
-                # Crea etichetta con date invece di numero settimana
-                week_label = f"{week_start_date.strftime('%d/%m')} - {week_end_date.strftime('%d/%m')}"
-                
-                # Gare per questo arbitro in questa settimana
-                arbitro_gare = gare_df[
-                    (gare_df['cod_mecc'] == arbitro['cod_mecc']) &
-                    (gare_df['data_gara'] >= week_start_date) &
-                    (gare_df['data_gara'] <= week_end_date)
-                ] if not gare_df.empty else pd.DataFrame()
-                
-                # Categoria + Girone - Mostra ogni singola gara
-                categoria_girone_list = []
-                if not arbitro_gare.empty:
-                    for _, gara in arbitro_gare.iterrows():
-                        categoria = gara.get('categoria', '')
-                        girone = gara.get('girone', '')
-                        numero_gara = gara.get('numero_gara', '')
-                        data_gara = gara.get('data_gara')
-                        
-                        if categoria and girone:
-                            # Includi solo categoria, girone e data per distinguere le gare multiple
-                            gara_info = f"{categoria} {girone}"
-                            if data_gara:
-                                gara_info += f" {data_gara.strftime('%d/%m')}"
-                            categoria_girone_list.append(gara_info)
-                
-                categoria_girone_str = " • ".join(categoria_girone_list) if categoria_girone_list else ""
-                
-                # Voti per questo arbitro in questa settimana
-                arbitro_voti = voti_df[
-                    (voti_df['cod_mecc'] == arbitro['cod_mecc']) &
-                    (voti_df['data_gara'] >= week_start_date) &
-                    (voti_df['data_gara'] <= week_end_date)
-                ] if not voti_df.empty else pd.DataFrame()
-                
-                voti_str = ""
-                if not arbitro_voti.empty:
-                    voti_list = []
-                    for _, voto in arbitro_voti.iterrows():
-                        voto_parts = []
-                        if pd.notna(voto.get('voto_oa')) and voto.get('voto_oa') is not None:
-                            voto_parts.append(f"OA:{voto['voto_oa']}")
-                        if pd.notna(voto.get('voto_ot')) and voto.get('voto_ot') is not None:
-                            # Aggiungi cognome OT tra parentesi se disponibile
-                            voto_ot_str = f"OT:{voto['voto_ot']}"
-                            if pd.notna(voto.get('cognome_ot')) and voto.get('cognome_ot') is not None:
-                                voto_ot_str += f" ({voto['cognome_ot']})"
-                            voto_parts.append(voto_ot_str)
-                        if voto_parts:
-                            voti_list.append(" ".join(voto_parts))
-                    voti_str = ", ".join(voti_list)
-                
-                # Indisponibilità per questo arbitro in questa settimana
-                # Usa il codice arbitro matchato dalla query invece del codice originale
-                arbitro_indisponibilita = indisponibilita_df[
-                    (indisponibilita_df['arbitro_cod_mecc'] == arbitro['cod_mecc']) &
-                    (indisponibilita_df['data_indisponibilita'] >= week_start_date) &
-                    (indisponibilita_df['data_indisponibilita'] <= week_end_date)
-                ] if not indisponibilita_df.empty else pd.DataFrame()
-                
-                indisponibilita_str = ""
-                if not arbitro_indisponibilita.empty:
-                    motivi_series = arbitro_indisponibilita['motivo'].dropna()
-                    motivi = motivi_series.unique() if hasattr(motivi_series, 'unique') else []
-                    indisponibilita_str = ", ".join(motivi) if len(motivi) > 0 else "Indisponibile"
-                
-                # Note settimanali per questo arbitro - cerca con sovrapposizione flessibile
-                conn_note = sqlite3.connect('arbitri.db')
-                note_query = '''
-                    SELECT nota, settimana_inizio, settimana_fine FROM note_settimanali 
-                    WHERE cod_mecc = ? AND (
-                        (settimana_inizio <= ? AND settimana_fine >= ?) OR
-                        (settimana_inizio >= ? AND settimana_inizio <= ?) OR
-                        (settimana_fine >= ? AND settimana_fine <= ?) OR
-                        (? >= settimana_inizio AND ? <= settimana_fine)
-                    )
-                '''
-                note_result = pd.read_sql_query(note_query, conn_note, params=[
-                    arbitro['cod_mecc'], 
-                    week_start_date.strftime('%Y-%m-%d'), week_start_date.strftime('%Y-%m-%d'),
-                    week_start_date.strftime('%Y-%m-%d'), week_end_date.strftime('%Y-%m-%d'),
-                    week_start_date.strftime('%Y-%m-%d'), week_end_date.strftime('%Y-%m-%d'),
-                    week_start_date.strftime('%Y-%m-%d'), week_end_date.strftime('%Y-%m-%d')
-                ])
-                conn_note.close()
-                
-                nota_str = ""
-                if not note_result.empty and pd.notna(note_result.iloc[0]['nota']) and note_result.iloc[0]['nota'].strip():
-                    nota_str = note_result.iloc[0]['nota'].strip()
-                
-                # Combina informazioni per la settimana
-                week_info = []
-                if categoria_girone_str:
-                    week_info.append(f"🏃‍♂️ {categoria_girone_str}")
-                if voti_str:
-                    week_info.append(f"⭐ {voti_str}")
-                if indisponibilita_str:
-                    week_info.append(f"❌ {indisponibilita_str}")
-                if nota_str:
-                    week_info.append(f"📝 {nota_str}")
-                
-                # Usa separatori che permettono il wrapping per celle più leggibili
-                if week_info:
-                    # Separa con • per permettere un migliore wrapping
-                    row[week_label] = " • ".join(week_info)
-                else:
-                    row[week_label] = ""
-            
-            table_data.append(row)
+        # Griglia arbitri x settimane della pagina, ricalcolata solo quando cambiano dati, periodo, filtri o pagina
+        df_display = cached_weekly_page(versione, data_inizio, data_fine, *filtri, pagina, per_pagina, week_ranges)
         
-        if table_data:
-            df_display = pd.DataFrame(table_data)
-            
+        if not df_display.empty:
             # Visualizza la tabella con dimensionamento automatico e colonna Arbitro fissa
             st.dataframe(
                 df_display,
@@ -541,14 +398,14 @@ with tab1:
                 st.markdown("📝 **Note** - Note personalizzate settimanali")
                 
         else:
-            st.info("Nessun dato da visualizzare. Carica i file necessari.")
+            st.info("Nessun arbitro corrisponde ai filtri selezionati.")
     else:
         st.warning("📊 Carica l'anagrafica arbitri per visualizzare i dati")
 
 with tab2:
     st.subheader("📊 Statistiche Generali")
     
-    arbitri_df = get_arbitri()
+    arbitri_df = cached_arbitri(versione)
     
     if not arbitri_df.empty:
         # Prima riga di statistiche
@@ -559,9 +416,7 @@ with tab2:
         
         with col2:
             # Conteggio gare AR (Arbitro)
-            conn = sqlite3.connect('arbitri.db')
-            gare_count = pd.read_sql_query("SELECT COUNT(*) as count FROM gare WHERE ruolo = 'AR'", conn).iloc[0]['count']
-            conn.close()
+            gare_count = cached_query(versione, CONTEGGIO_GARE_AR).iloc[0]['count']
             st.metric("🏃‍♂️ Gare AR", gare_count)
         
         with col3:
@@ -575,39 +430,17 @@ with tab2:
         
         with col4:
             # Conteggio voti per gare AR escludendo QU
-            conn = sqlite3.connect('arbitri.db')
-            voti_ar_count = pd.read_sql_query("""
-                SELECT COUNT(*) as count 
-                FROM voti v 
-                JOIN gare g ON v.numero_gara = g.numero_gara 
-                WHERE g.ruolo = 'AR' AND g.ruolo != 'QU' AND (v.voto_oa IS NOT NULL OR v.voto_ot IS NOT NULL)
-            """, conn).iloc[0]['count']
-            conn.close()
+            voti_ar_count = cached_query(versione, CONTEGGIO_VOTI_AR).iloc[0]['count']
             st.metric("⭐ Voti AR (esclusi QU)", voti_ar_count)
         
         with col5:
             # Conteggio voti per tutti i ruoli con gara associata - esclusione QU
-            conn = sqlite3.connect('arbitri.db')
-            voti_totali_count = pd.read_sql_query("""
-                SELECT COUNT(*) as count 
-                FROM voti v 
-                JOIN gare g ON v.numero_gara = g.numero_gara
-                WHERE (v.voto_oa IS NOT NULL OR v.voto_ot IS NOT NULL)
-                AND g.ruolo != 'QU'
-            """, conn).iloc[0]['count']
-            conn.close()
+            voti_totali_count = cached_query(versione, CONTEGGIO_VOTI_TOTALI).iloc[0]['count']
             st.metric("⭐ Voti (esclusi QU)", voti_totali_count)
         
         with col6:
             # Conteggio voti OT per gare AR escludendo QU
-            conn = sqlite3.connect('arbitri.db')
-            voti_ar_ot_count = pd.read_sql_query("""
-                SELECT COUNT(*) as count 
-                FROM voti v 
-                JOIN gare g ON v.numero_gara = g.numero_gara
-                WHERE v.voto_ot IS NOT NULL AND g.ruolo = 'AR' AND g.ruolo != 'QU'
-            """, conn).iloc[0]['count']
-            conn.close()
+            voti_ar_ot_count = cached_query(versione, CONTEGGIO_VOTI_AR_OT).iloc[0]['count']
             st.metric("📋 Voti AR OT (esclusi QU)", voti_ar_ot_count)
         
         # Terza riga - Statistiche voti OA e OT
@@ -616,26 +449,12 @@ with tab2:
         
         with col7:
             # Conteggio voti OA (Osservatore Arbitrale) - esclusione QU
-            conn = sqlite3.connect('arbitri.db')
-            voti_oa_count = pd.read_sql_query("""
-                SELECT COUNT(*) as count 
-                FROM voti v 
-                JOIN gare g ON v.numero_gara = g.numero_gara
-                WHERE v.voto_oa IS NOT NULL AND g.ruolo != 'QU'
-            """, conn).iloc[0]['count']
-            conn.close()
+            voti_oa_count = cached_query(versione, CONTEGGIO_VOTI_OA).iloc[0]['count']
             st.metric("📋 Voti OA (esclusi QU)", voti_oa_count)
         
         with col8:
             # Conteggio voti OT (Organo Tecnico) - esclusione QU
-            conn = sqlite3.connect('arbitri.db')
-            voti_ot_count = pd.read_sql_query("""
-                SELECT COUNT(*) as count 
-                FROM voti v 
-                JOIN gare g ON v.numero_gara = g.numero_gara
-                WHERE v.voto_ot IS NOT NULL AND g.ruolo != 'QU'
-            """, conn).iloc[0]['count']
-            conn.close()
+            voti_ot_count = cached_query(versione, CONTEGGIO_VOTI_OT).iloc[0]['count']
             st.metric("📋 Voti OT (esclusi QU)", voti_ot_count)
         
         with col9:
@@ -666,7 +485,7 @@ with tab2:
 with tab3:
     st.subheader("🏆 Statistiche Arbitraggio per Categoria/Girone")
     
-    stats_df = get_arbitration_stats_by_category()
+    stats_df = cached_arbitration_stats(versione)
     
     if not stats_df.empty:
         # Tabella riassuntiva
@@ -704,29 +523,9 @@ with tab4:
     st.subheader("👨‍⚖️ Gare per Organo Tecnico")
     
     # Ottieni i dati degli organi tecnici dai voti
-    conn = sqlite3.connect('arbitri.db')
-    
     try:
-        # Query per estrarre cognomi OT dai voti solo per gare con ruolo OT
-        ot_query = '''
-            SELECT 
-                CASE 
-                    WHEN g.cognome_arbitro LIKE '%(%' 
-                    THEN TRIM(SUBSTR(g.cognome_arbitro, INSTR(g.cognome_arbitro, '(') + 1, INSTR(g.cognome_arbitro, ')') - INSTR(g.cognome_arbitro, '(') - 1))
-                    ELSE g.cognome_arbitro
-                END as cognome_ot,
-                COUNT(*) as numero_gare
-            FROM voti v
-            JOIN gare g ON v.numero_gara = g.numero_gara
-            WHERE v.voto_ot IS NOT NULL 
-                AND g.cognome_arbitro IS NOT NULL
-                AND g.cognome_arbitro != ''
-                AND g.ruolo = 'OT'
-            GROUP BY cognome_ot
-            ORDER BY numero_gare DESC, cognome_ot
-        '''
-        
-        ot_stats = pd.read_sql_query(ot_query, conn)
+        # Cognomi OT dai voti solo per gare con ruolo OT
+        ot_stats = cached_query(versione, OT_GARE_PER_COGNOME)
         
         if not ot_stats.empty:
             # Tabella dettagliata
@@ -740,25 +539,7 @@ with tab4:
             # Tabella voti OT ricevuti da ogni arbitro
             st.subheader("📊 Voti OT Ricevuti per Arbitro")
             
-            arbitri_voti_query = '''
-                SELECT 
-                    a.cognome as cognome,
-                    a.nome as nome,
-                    a.sezione as sezione,
-                    COUNT(v.voto_ot) as numero_voti_ot
-                FROM gare g
-                JOIN voti v ON g.numero_gara = v.numero_gara
-                JOIN arbitri a ON g.cod_mecc = a.cod_mecc
-                WHERE v.voto_ot IS NOT NULL 
-                    AND g.ruolo = 'AR'
-                    AND g.ruolo != 'QU'
-                    AND g.cognome_arbitro IS NOT NULL
-                    AND g.cognome_arbitro != ''
-                GROUP BY a.cognome, a.nome, a.sezione, g.cod_mecc
-                ORDER BY numero_voti_ot DESC, cognome, nome
-            '''
-            
-            arbitri_voti_stats = pd.read_sql_query(arbitri_voti_query, conn)
+            arbitri_voti_stats = cached_query(versione, OT_VOTI_PER_ARBITRO)
             
             if not arbitri_voti_stats.empty:
                 arbitri_voti_display = arbitri_voti_stats.copy()
@@ -769,48 +550,22 @@ with tab4:
         
         else:
             st.info("Nessun dato disponibile per gli Organi Tecnici")
-    
+        
     except Exception as e:
         st.error(f"Errore nel caricamento dati OT: {e}")
-    
-    finally:
-        conn.close()
 
 with tab5:
     st.subheader("🚗 Gestione Partenze")
     
-    # Verifica e aggiunge colonne regioni se mancanti
-    conn = sqlite3.connect('arbitri.db')
-    cursor = conn.cursor()
-    
-    try:
-        # Controlla se le colonne esistono
-        cursor.execute("PRAGMA table_info(arbitri)")
-        columns = [row[1] for row in cursor.fetchall()]
-        
-        if 'regione_appartenenza' not in columns:
-            cursor.execute('ALTER TABLE arbitri ADD COLUMN regione_appartenenza TEXT')
-            st.info("Colonna regione_appartenenza aggiunta al database")
-            
-        if 'regione_partenza' not in columns:
-            cursor.execute('ALTER TABLE arbitri ADD COLUMN regione_partenza TEXT')
-            st.info("Colonna regione_partenza aggiunta al database")
-            
-        conn.commit()
-    except Exception as e:
-        st.warning(f"Informazione: {e}")
-    finally:
-        conn.close()
-    
     # Sezione inserimento/modifica regioni
     st.markdown("### ✏️ Gestione Regioni Arbitri")
     
     # Ottieni lista arbitri
-    arbitri_df = get_arbitri()
+    arbitri_df = cached_arbitri(versione)
     
     if not arbitri_df.empty:
         # Selectbox per scegliere arbitro
-        arbitri_list = [f"{row['cognome']} {row['nome']} ({row['cod_mecc']})" for _, row in arbitri_df.iterrows()]
+        arbitri_list = cached_arbitri_labels(versione, con_codice=True)
         selected_arbitro = st.selectbox(
             "Seleziona Arbitro",
             options=arbitri_list,
@@ -822,13 +577,7 @@ with tab5:
             cod_mecc = selected_arbitro.split('(')[1].split(')')[0]
             
             # Ottieni dati attuali dell'arbitro
-            conn = sqlite3.connect('arbitri.db')
-            arbitro_data = pd.read_sql_query(
-                "SELECT * FROM arbitri WHERE cod_mecc = ?", 
-                conn, 
-                params=[cod_mecc]
-            )
-            conn.close()
+            arbitro_data = cached_query(versione, ARBITRO_PER_CODICE, (cod_mecc,))
             
             if not arbitro_data.empty:
                 current_app = arbitro_data.iloc[0].get('regione_appartenenza', '')
@@ -874,29 +623,21 @@ with tab5:
                     
                     if submitted:
                         # Aggiorna database
-                        conn = sqlite3.connect('arbitri.db')
-                        cursor = conn.cursor()
-                        
                         try:
                             # Converti "Seleziona..." in None
                             reg_app = regione_app if regione_app != 'Seleziona...' else None
                             reg_part = regione_part if regione_part != 'Seleziona...' else None
                             
-                            cursor.execute('''
-                                UPDATE arbitri 
-                                SET regione_appartenenza = ?, regione_partenza = ?, updated_at = CURRENT_TIMESTAMP
-                                WHERE cod_mecc = ?
-                            ''', (reg_app, reg_part, cod_mecc))
+                            with get_connection() as conn:
+                                conn.execute(AGGIORNA_REGIONI_ARBITRO, (reg_app, reg_part, cod_mecc))
+                                bump_data_version(conn)
+                            invalidate_cache()
                             
-                            conn.commit()
                             st.success(f"Regioni aggiornate per {selected_arbitro.split(' (')[0]}")
                             st.rerun()
                         
                         except Exception as e:
                             st.error(f"Errore nell'aggiornamento: {e}")
-                        
-                        finally:
-                            conn.close()
     
     st.markdown("---")
     
@@ -909,12 +650,7 @@ with tab5:
     with col1:
         # Filtro per regione appartenenza
         try:
-            conn = sqlite3.connect('arbitri.db')
-            regioni_app = pd.read_sql_query(
-                "SELECT DISTINCT regione_appartenenza FROM arbitri WHERE regione_appartenenza IS NOT NULL AND regione_appartenenza != ''", 
-                conn
-            )['regione_appartenenza'].tolist()
-            conn.close()
+            regioni_app = cached_query(versione, REGIONI_APPARTENENZA)['regione_appartenenza'].tolist()
         except Exception:
             regioni_app = []
         
@@ -927,12 +663,7 @@ with tab5:
     with col2:
         # Filtro per regione partenza
         try:
-            conn = sqlite3.connect('arbitri.db')
-            regioni_part = pd.read_sql_query(
-                "SELECT DISTINCT regione_partenza FROM arbitri WHERE regione_partenza IS NOT NULL AND regione_partenza != ''", 
-                conn
-            )['regione_partenza'].tolist()
-            conn.close()
+            regioni_part = cached_query(versione, REGIONI_PARTENZA)['regione_partenza'].tolist()
         except Exception:
             regioni_part = []
         
@@ -951,55 +682,26 @@ with tab5:
             index=0
         )
     
-    # Query con filtri (gestisce colonne mancanti)
-    try:
-        conn = sqlite3.connect('arbitri.db')
-        cursor = conn.cursor()
-        cursor.execute("PRAGMA table_info(arbitri)")
-        columns = [row[1] for row in cursor.fetchall()]
-        conn.close()
-        
-        if 'regione_appartenenza' in columns and 'regione_partenza' in columns:
-            query = """
-                SELECT cognome, nome, sezione, 
-                       regione_appartenenza, regione_partenza
-                FROM arbitri 
-                WHERE regione_partenza IS NOT NULL AND regione_partenza != ''
-            """
-        else:
-            query = """
-                SELECT cognome, nome, sezione, 
-                       NULL as regione_appartenenza, NULL as regione_partenza
-                FROM arbitri 
-                WHERE 1=0
-            """
-    except Exception:
-        query = """
-            SELECT cognome, nome, sezione, 
-                   NULL as regione_appartenenza, NULL as regione_partenza
-            FROM arbitri 
-            WHERE 1=0
-        """
+    # Query con filtri (le colonne regioni sono garantite dalle migrazioni dello schema)
+    query = PARTENZE_ARBITRI
     params = []
     
     if filtro_app != 'Tutte':
-        query += " AND regione_appartenenza = ?"
+        query += PARTENZE_FILTRO_APPARTENENZA
         params.append(filtro_app)
     
     if filtro_part != 'Tutte':
-        query += " AND regione_partenza = ?"
+        query += PARTENZE_FILTRO_PARTENZA
         params.append(filtro_part)
     
     if filtro_sezione != 'Tutte':
-        query += " AND sezione = ?"
+        query += PARTENZE_FILTRO_SEZIONE
         params.append(filtro_sezione)
     
-    query += " ORDER BY cognome, nome"
+    query += PARTENZE_ORDINAMENTO
     
     # Mostra dati filtrati
-    conn = sqlite3.connect('arbitri.db')
-    filtered_data = pd.read_sql_query(query, conn, params=params)
-    conn.close()
+    filtered_data = cached_query(versione, query, tuple(params))
     
     if not filtered_data.empty:
         st.markdown(f"### 📋 Arbitri Trovati: {len(filtered_data)}")
@@ -1022,7 +724,6 @@ with tab6:
     # Try to import timeline functions
     try:
         from career_timeline import (
-            get_referee_career_data, 
             create_career_timeline_chart, 
             calculate_career_metrics,
             display_career_summary,
@@ -1038,13 +739,10 @@ with tab6:
     # Only show interface if timeline is available
     if timeline_available:
         # Referee selection
-        arbitri_df = get_arbitri()
+        arbitri_df = cached_arbitri(versione)
         if not arbitri_df.empty:
             # Create referee options with full name
-            referee_options = [
-                f"{row['cognome']} {row['nome']}" 
-                for _, row in arbitri_df.iterrows()
-            ]
+            referee_options = cached_arbitri_labels(versione)
             
             selected_referee = st.selectbox(
                 "Seleziona Arbitro per Timeline Carriera",
@@ -1069,7 +767,7 @@ with tab6:
                         
                         # Get career data
                         with st.spinner("Caricamento dati carriera..."):
-                            referee_info, games_data, unavail_data = get_referee_career_data(cod_mecc)
+                            referee_info, games_data, unavail_data = cached_career_data(versione, cod_mecc)
                             metrics = calculate_career_metrics(referee_info, games_data)
                         
                         if not referee_info.empty:
@@ -1164,7 +862,7 @@ with tab7:
     st.markdown("### ✏️ Aggiungi/Modifica Nota")
     
     # Ottieni lista arbitri
-    arbitri_df = get_arbitri()
+    arbitri_df = cached_arbitri(versione)
     
     if not arbitri_df.empty:
         # Aiuto per le settimane del sistema
@@ -1197,7 +895,7 @@ with tab7:
             
             with col1:
                 # Selectbox per scegliere arbitro
-                arbitri_list = [f"{row['cognome']} {row['nome']} ({row['cod_mecc']})" for _, row in arbitri_df.iterrows()]
+                arbitri_list = cached_arbitri_labels(versione, con_codice=True)
                 selected_arbitro_nota = st.selectbox(
                     "Seleziona Arbitro",
                     options=arbitri_list,
@@ -1261,16 +959,13 @@ with tab7:
         
         if preview_button:
             # Mostra anteprima della nota esistente se presente
-            conn = sqlite3.connect('arbitri.db')
             try:
-                existing_note = pd.read_sql_query('''
-                    SELECT nota, data_modifica FROM note_settimanali 
-                    WHERE cod_mecc = ? AND settimana_inizio = ? AND settimana_fine = ?
-                ''', conn, params=[
-                    cod_mecc_nota, 
-                    settimana_inizio.strftime('%Y-%m-%d'), 
-                    settimana_fine.strftime('%Y-%m-%d')
-                ])
+                with get_read_connection() as conn:
+                    existing_note = pd.read_sql_query(NOTA_SETTIMANALE, conn, params=[
+                        cod_mecc_nota, 
+                        settimana_inizio.strftime('%Y-%m-%d'), 
+                        settimana_fine.strftime('%Y-%m-%d')
+                    ])
                 
                 if not existing_note.empty and pd.notna(existing_note.iloc[0]['nota']):
                     st.info(f"📝 **Nota esistente:** {existing_note.iloc[0]['nota']}")
@@ -1279,29 +974,16 @@ with tab7:
                     st.info("📝 **Nessuna nota esistente per questa settimana**")
             except Exception as e:
                 st.info("📝 **Nessuna nota esistente per questa settimana**")
-            finally:
-                conn.close()
         
         # Sezione visualizzazione note esistenti
         st.markdown("---")
         st.markdown("### 📋 Note Esistenti")
         
         # Query per ottenere tutte le note
-        conn = sqlite3.connect('arbitri.db')
         try:
-            all_notes_query = '''
-                SELECT n.cod_mecc, a.cognome, a.nome, n.settimana_inizio, n.settimana_fine, 
-                       n.nota, n.data_modifica
-                FROM note_settimanali n
-                JOIN arbitri a ON n.cod_mecc = a.cod_mecc
-                WHERE n.nota IS NOT NULL AND n.nota != ''
-                ORDER BY n.settimana_inizio DESC, a.cognome, a.nome
-            '''
-            all_notes = pd.read_sql_query(all_notes_query, conn)
+            all_notes = cached_query(versione, TUTTE_LE_NOTE)
         except Exception as e:
             all_notes = pd.DataFrame()  # DataFrame vuoto se la tabella non esiste
-        finally:
-            conn.close()
         
         if not all_notes.empty:
             st.info(f"📊 Totale note salvate: {len(all_notes)}")
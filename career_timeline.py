@@ -4,7 +4,8 @@ Provides detailed career progression analysis for individual referees
 """
 
 import pandas as pd
-import sqlite3
+from db_connection import get_read_connection
+from queries import CARRIERA_ARBITRO, CARRIERA_GARE, CARRIERA_INDISPONIBILITA
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
@@ -13,38 +14,15 @@ from plotly.subplots import make_subplots
 
 def get_referee_career_data(cod_mecc):
     """Get comprehensive career data for a specific referee"""
-    conn = sqlite3.connect('arbitri.db')
-    
-    # Basic referee info
-    referee_query = """
-        SELECT a.cod_mecc, a.cognome, a.nome, a.sezione, a.eta, a.anno_anzianita
-        FROM arbitri a
-        WHERE a.cod_mecc = ?
-    """
-    referee_info = pd.read_sql_query(referee_query, conn, params=[cod_mecc])
-    
-    # Career games with detailed info
-    games_query = """
-        SELECT g.numero_gara, g.data_gara, g.categoria, g.girone, g.ruolo,
-               g.squadra_casa, g.squadra_trasferta, g.campionato,
-               v.voto_oa, v.voto_ot
-        FROM gare g
-        LEFT JOIN voti v ON g.numero_gara = v.numero_gara
-        WHERE g.cod_mecc = ?
-        ORDER BY g.data_gara ASC
-    """
-    games_data = pd.read_sql_query(games_query, conn, params=[cod_mecc])
-    
-    # Unavailability periods
-    unavail_query = """
-        SELECT data_indisponibilita, motivo
-        FROM indisponibilita
-        WHERE cod_mecc = ?
-        ORDER BY data_indisponibilita ASC
-    """
-    unavail_data = pd.read_sql_query(unavail_query, conn, params=[cod_mecc])
-    
-    conn.close()
+    with get_read_connection() as conn:
+        # Basic referee info
+        referee_info = pd.read_sql_query(CARRIERA_ARBITRO, conn, params=[cod_mecc])
+        
+        # Career games with detailed info
+        games_data = pd.read_sql_query(CARRIERA_GARE, conn, params=[cod_mecc])
+        
+        # Unavailability periods
+        unavail_data = pd.read_sql_query(CARRIERA_INDISPONIBILITA, conn, params=[cod_mecc])
     
     return referee_info, games_data, unavail_data
 
@@ -1,112 +1,62 @@
 """
 Script per contare i periodi di indisponibilità invece dei singoli giorni
 """
-import sqlite3
+from db_connection import get_read_connection
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import timedelta
 
-def count_indisponibilita_periods():
+def _load_merged_periods():
     """
-    Conta i periodi di indisponibilità raggruppando giorni consecutivi
+    Carica i periodi di indisponibilità e unisce quelli dello stesso arbitro e motivo
+    che si sovrappongono o sono consecutivi
     """
-    conn = sqlite3.connect('arbitri.db')
-    
-    # Ottieni tutte le indisponibilità ordinate
     query = '''
-        SELECT cod_mecc, data_indisponibilita, motivo
-        FROM indisponibilita 
-        ORDER BY cod_mecc, motivo, data_indisponibilita
+        SELECT cod_mecc, motivo, data_inizio, data_fine
+        FROM indisponibilita_periodi
+        WHERE motivo IS NOT NULL
+        ORDER BY cod_mecc, motivo, data_inizio, data_fine
     '''
     
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+    with get_read_connection() as conn:
+        df = pd.read_sql_query(query, conn)
     
     if df.empty:
-        return 0
+        return df
     
-    # Converti date
-    df['data_indisponibilita'] = pd.to_datetime(df['data_indisponibilita'])
+    df['data_inizio'] = pd.to_datetime(df['data_inizio'])
+    df['data_fine'] = pd.to_datetime(df['data_fine'])
     
-    periods = 0
+    # Fine più lontana tra i periodi precedenti dello stesso arbitro e motivo
+    gruppi = [df['cod_mecc'], df['motivo']]
+    fine_precedente = df.groupby(gruppi)['data_fine'].cummax().groupby(gruppi).shift()
     
-    # Raggruppa per arbitro e motivo
-    for (cod_mecc, motivo), group in df.groupby(['cod_mecc', 'motivo']):
-        dates = sorted(group['data_indisponibilita'].tolist())
-        
-        if not dates:
-            continue
-            
-        # Conta periodi consecutivi
-        current_period_start = dates[0]
-        
-        for i in range(1, len(dates)):
-            # Se la data non è consecutiva alla precedente, inizia un nuovo periodo
-            if dates[i] - dates[i-1] > timedelta(days=1):
-                periods += 1
-                current_period_start = dates[i]
-        
-        # Aggiungi l'ultimo periodo
-        periods += 1
+    # Un nuovo periodo inizia quando c'è almeno un giorno scoperto dopo la fine precedente
+    nuovo_periodo = fine_precedente.isna() | (df['data_inizio'] - fine_precedente > timedelta(days=1))
     
-    return periods
+    return df.groupby(nuovo_periodo.cumsum()).agg(
+        cod_mecc=('cod_mecc', 'first'),
+        motivo=('motivo', 'first'),
+        inizio=('data_inizio', 'min'),
+        fine=('data_fine', 'max'),
+    )
+
+def count_indisponibilita_periods():
+    """
+    Conta i periodi di indisponibilità raggruppando giorni consecutivi
+    """
+    return len(_load_merged_periods())
 
 def get_detailed_periods():
     """
     Ottieni dettagli sui periodi di indisponibilità
     """
-    conn = sqlite3.connect('arbitri.db')
+    periods = _load_merged_periods()
     
-    query = '''
-        SELECT cod_mecc, data_indisponibilita, motivo
-        FROM indisponibilita 
-        ORDER BY cod_mecc, motivo, data_indisponibilita
-    '''
-    
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    
-    if df.empty:
+    if periods.empty:
         return []
     
-    df['data_indisponibilita'] = pd.to_datetime(df['data_indisponibilita'])
-    
-    periods = []
-    
-    for (cod_mecc, motivo), group in df.groupby(['cod_mecc', 'motivo']):
-        dates = sorted(group['data_indisponibilita'].tolist())
-        
-        if not dates:
-            continue
-            
-        current_start = dates[0]
-        current_end = dates[0]
-        
-        for i in range(1, len(dates)):
-            if dates[i] - dates[i-1] <= timedelta(days=1):
-                # Continua il periodo corrente
-                current_end = dates[i]
-            else:
-                # Finisce il periodo corrente e inizia uno nuovo
-                periods.append({
-                    'cod_mecc': cod_mecc,
-                    'motivo': motivo,
-                    'inizio': current_start,
-                    'fine': current_end,
-                    'giorni': (current_end - current_start).days + 1
-                })
-                current_start = dates[i]
-                current_end = dates[i]
-        
-        # Aggiungi l'ultimo periodo
-        periods.append({
-            'cod_mecc': cod_mecc,
-            'motivo': motivo,
-            'inizio': current_start,
-            'fine': current_end,
-            'giorni': (current_end - current_start).days + 1
-        })
-    
-    return periods
+    periods['giorni'] = (periods['fine'] - periods['inizio']).dt.days + 1
+    return periods[['cod_mecc', 'motivo', 'inizio', 'fine', 'giorni']].to_dict('records')
 
 if __name__ == "__main__":
     total_periods = count_indisponibilita_periods()
@@ -0,0 +1,123 @@
+"""
+Cache dei risultati delle letture usate dalle pagine Streamlit.
+
+Le funzioni cached_* ricevono come primo argomento la versione dei dati restituita da data_token():
+finché nessuno scrive sul database i rerun dovuti ai widget leggono i risultati dalla memoria senza
+interrogare SQLite. La versione viene riletta da sistema_config solo quando cambia la firma economica
+del database (database_signature), quindi anche le scritture di un altro processo o dei caricamenti
+in background invalidano la cache. Dopo caricamenti, note e modifiche delle regioni invalidate_cache()
+la svuota in modo esplicito.
+"""
+import os
+import threading
+
+import pandas as pd
+import streamlit as st
+
+from database import get_arbitri, get_data_version
+from db_connection import database_signature, get_read_connection
+from data_loader import ANAGRAFICA_FILE, ensure_anagrafica_loaded
+from export_utils import get_arbitration_stats_by_category
+from populate_complete_db import populate_complete_database_if_empty
+from weekly_grid import count_dashboard_arbitri, load_weekly_page
+
+# Ultima coppia (firma del database, versione dei dati) letta da data_token()
+_ultimo_token = (None, None)
+_token_lock = threading.Lock()
+
+
+def data_token():
+    """Versione corrente dei dati da usare come chiave della cache.
+    Interroga sistema_config solo se la firma del database è cambiata dall'ultima lettura:
+    gli aggiornamenti di stato dei job non cambiano la versione e non invalidano la cache."""
+    global _ultimo_token
+
+    # La firma va letta prima della versione: una scrittura nel frattempo cambia la firma successiva
+    firma = database_signature()
+    with _token_lock:
+        if _ultimo_token[0] == firma:
+            return _ultimo_token[1]
+
+    versione = get_data_version()
+    if versione is not None:
+        with _token_lock:
+            _ultimo_token = (firma, versione)
+    return versione
+
+
+def invalidate_cache():
+    """Svuota la cache dei risultati dopo una modifica ai dati fatta dalla pagina"""
+    global _ultimo_token
+
+    with _token_lock:
+        _ultimo_token = (None, None)
+    st.cache_data.clear()
+
+
+def anagrafica_signature():
+    """Data di modifica del file anagrafica incluso nel progetto, None se assente"""
+    try:
+        return os.stat(ANAGRAFICA_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def cached_startup(versione, anagrafica_mtime):
+    """Caricamento dell'anagrafica e popolamento del database vuoto, ripetuti solo quando cambiano
+    i dati o il file anagrafica. Restituisce gli esiti delle due operazioni."""
+    return ensure_anagrafica_loaded(), populate_complete_database_if_empty()
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_arbitri(versione):
+    """Anagrafica completa degli arbitri (get_arbitri)"""
+    return get_arbitri()
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_arbitri_labels(versione, con_codice=False):
+    """Etichette 'Cognome Nome' degli arbitri per le selectbox, con ' (cod_mecc)' se con_codice"""
+    arbitri_df = cached_arbitri(versione)
+    if arbitri_df.empty:
+        return []
+    etichette = arbitri_df['cognome'].astype(str) + ' ' + arbitri_df['nome'].astype(str)
+    if con_codice:
+        etichette = etichette + ' (' + arbitri_df['cod_mecc'].astype(str) + ')'
+    return etichette.tolist()
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_query(versione, sql, params=()):
+    """Risultato di una query del catalogo con i parametri indicati (tupla)"""
+    with get_read_connection() as conn:
+        return pd.read_sql_query(sql, conn, params=list(params))
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_weekly_count(versione, data_inizio, data_fine, arbitro, sezione, categoria, solo_attivi, _week_ranges):
+    """Numero di arbitri della Dashboard Settimanale con i filtri indicati (count_dashboard_arbitri).
+    Le settimane dipendono solo dal periodo, per questo restano fuori dalla chiave della cache."""
+    return count_dashboard_arbitri(_week_ranges, data_inizio, data_fine, arbitro, sezione, categoria, solo_attivi)
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_weekly_page(versione, data_inizio, data_fine, arbitro, sezione, categoria, solo_attivi, pagina, per_pagina,
+                       _week_ranges):
+    """Pagina della griglia della Dashboard Settimanale (load_weekly_page)"""
+    return load_weekly_page(_week_ranges, data_inizio, data_fine, pagina, per_pagina, arbitro, sezione, categoria,
+                            solo_attivi)
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_arbitration_stats(versione):
+    """Statistiche di arbitraggio per categoria/girone (get_arbitration_stats_by_category)"""
+    return get_arbitration_stats_by_category()
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_career_data(versione, cod_mecc):
+    """Dati della timeline carriera di un arbitro (get_referee_career_data)"""
+    # Import locale: la timeline richiede plotly, che è opzionale
+    from career_timeline import get_referee_career_data
+    return get_referee_career_data(cod_mecc)
@@ -2,12 +2,18 @@
 Modulo per il caricamento automatico dei dati dell'anagrafica arbitri
 """
 import pandas as pd
-from file_processors import process_arbitri_file
+from file_processors import process_arbitri_file, file_sha256
 import os
 
+ANAGRAFICA_FILE = 'arbitri_anagrafica.xlsx'
+
+# Chiavi di sistema_config con la firma dell'ultimo file anagrafica caricato
+ANAGRAFICA_SHA256_KEY = 'anagrafica_sha256'
+ANAGRAFICA_MTIME_KEY = 'anagrafica_mtime'
+
 def load_arbitri_anagrafica():
     """Carica automaticamente l'anagrafica arbitri dal file incluso nel progetto"""
-    anagrafica_file = 'arbitri_anagrafica.xlsx'
+    anagrafica_file = ANAGRAFICA_FILE
     
     if os.path.exists(anagrafica_file):
         try:
@@ -20,29 +26,34 @@ def load_arbitri_anagrafica():
         return {'success': False, 'message': 'File anagrafica arbitri non trovato'}
 
 def ensure_anagrafica_loaded():
-    """Assicura che l'anagrafica sia caricata nel database"""
-    from database import get_arbitri
+    """Assicura che l'anagrafica sia caricata nel database.
+    Il file incluso viene riletto solo se la tabella è vuota o se è cambiato rispetto all'ultimo
+    caricamento (data di modifica e, se diversa, hash SHA-256 registrati in sistema_config).
+    Il ricaricamento aggiorna gli arbitri senza cancellare la tabella: regioni e anzianità restano."""
+    from database import count_arbitri, get_sistema_config, set_sistema_config
     
-    # Controlla se ci sono già arbitri nel database
-    arbitri_df = get_arbitri()
+    # Controlli economici a ogni rerun: conteggio righe e data di modifica del file
+    count = count_arbitri()
+    if not os.path.exists(ANAGRAFICA_FILE):
+        if count:
+            return {'success': True, 'message': f'Anagrafica già caricata: {count} arbitri'}
+        return load_arbitri_anagrafica()
     
-    # Controlla se l'anagrafrica è già stata caricata correttamente
-    # (deve avere almeno 200 arbitri per essere considerata completa)
-    if len(arbitri_df) >= 200:
-        return {'success': True, 'message': f'Anagrafica già caricata: {len(arbitri_df)} arbitri'}
-    else:
-        # Pulisci eventuali dati parziali e ricarica
-        import sqlite3
-        conn = sqlite3.connect('arbitri.db')
-        cursor = conn.cursor()
-        try:
-            cursor.execute('DELETE FROM arbitri')
-            conn.commit()
-        except:
-            pass
-        finally:
-            conn.close()
-        
-        # Carica l'anagrafica
-        result = load_arbitri_anagrafica()
-        return result
\ No newline at end of file
+    mtime = str(os.stat(ANAGRAFICA_FILE).st_mtime_ns)
+    if count and get_sistema_config(ANAGRAFICA_MTIME_KEY) == mtime:
+        return {'success': True, 'message': f'Anagrafica già caricata: {count} arbitri'}
+    
+    # Data di modifica diversa: il contenuto decide se serve ricaricare
+    with open(ANAGRAFICA_FILE, 'rb') as f:
+        sha256 = file_sha256(f)
+    firma = {ANAGRAFICA_SHA256_KEY: sha256, ANAGRAFICA_MTIME_KEY: mtime}
+    
+    if count and get_sistema_config(ANAGRAFICA_SHA256_KEY) == sha256:
+        set_sistema_config(firma, 'Firma del file anagrafica caricato')
+        return {'success': True, 'message': f'Anagrafica già caricata: {count} arbitri'}
+    
+    # Carica l'anagrafica
+    result = load_arbitri_anagrafica()
+    if result['success']:
+        set_sistema_config(firma, 'Firma del file anagrafica caricato')
+    return result
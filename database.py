@@ -1,10 +1,21 @@
-import sqlite3
+import itertools
+import json
+import threading
 import pandas as pd
 from datetime import datetime
+import db_connection
+from db_connection import get_connection, get_read_connection, begin_immediate
+from queries import create_query_indexes
+from weekly_grid import referee_week_keys, refresh_referee_week
 
-def init_database():
-    """Inizializza il database SQLite con le tabelle necessarie"""
-    conn = sqlite3.connect('arbitri.db')
+# Chiave di sistema_config con la versione dello schema applicata al database
+SCHEMA_VERSION_KEY = 'schema_version'
+
+_schema_lock = threading.Lock()
+_schema_ready_for = None
+
+def _migration_schema_base(conn):
+    """Tabelle di base, comprese le colonne aggiunte nel tempo ai database esistenti"""
     cursor = conn.cursor()
     
     # Tabella arbitri (anagrafica)
@@ -52,7 +63,7 @@ def init_database():
         cursor.execute('ALTER TABLE gare ADD COLUMN ruolo TEXT')
     if 'cognome_arbitro' not in existing_columns:
         cursor.execute('ALTER TABLE gare ADD COLUMN cognome_arbitro TEXT')
-        
+    
     # Aggiungi colonna anzianità alla tabella arbitri se non esiste
     cursor.execute("PRAGMA table_info(arbitri)")
     arbitri_columns = [column[1] for column in cursor.fetchall()]
@@ -60,6 +71,12 @@ def init_database():
     if 'anno_anzianita' not in arbitri_columns:
         cursor.execute('ALTER TABLE arbitri ADD COLUMN anno_anzianita INTEGER')
     
+    # Colonne regioni usate dalla gestione partenze
+    if 'regione_appartenenza' not in arbitri_columns:
+        cursor.execute('ALTER TABLE arbitri ADD COLUMN regione_appartenenza TEXT')
+    if 'regione_partenza' not in arbitri_columns:
+        cursor.execute('ALTER TABLE arbitri ADD COLUMN regione_partenza TEXT')
+    
     # Tabella voti
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS voti (
@@ -74,51 +91,499 @@ def init_database():
         )
     ''')
     
-    # Tabella indisponibilità
+    # Tabella organi_tecnici per gestire gli OT con i loro cognomi
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS organi_tecnici (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            numero_gara TEXT NOT NULL,
+            cod_ot TEXT NOT NULL,
+            cognome_ot TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(numero_gara, cod_ot)
+        )
+    ''')
+    
+    # Note settimanali della dashboard
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS note_settimanali (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cod_mecc TEXT NOT NULL,
+            settimana_inizio TEXT NOT NULL,
+            settimana_fine TEXT NOT NULL,
+            nota TEXT NOT NULL,
+            data_modifica TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(cod_mecc, settimana_inizio, settimana_fine)
+        )
+    ''')
+
+def _migration_indisponibilita_periodi(conn):
+    """Indisponibilità memorizzate per periodo, con vista di compatibilità giornaliera"""
+    cursor = conn.cursor()
+    
+    # Tabella indisponibilità: un record per periodo (estremi inclusi).
+    # arbitro_cod_mecc è il codice dell'anagrafica risolto in fase di caricamento, usato da tutte le join
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS indisponibilita (
+        CREATE TABLE IF NOT EXISTS indisponibilita_periodi (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             cod_mecc TEXT NOT NULL,
-            data_indisponibilita DATE NOT NULL,
+            data_inizio DATE NOT NULL,
+            data_fine DATE NOT NULL,
             motivo TEXT,
+            qualifica TEXT,
+            arbitro_cod_mecc TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (cod_mecc) REFERENCES arbitri (cod_mecc),
-            UNIQUE(cod_mecc, data_indisponibilita)
+            UNIQUE(cod_mecc, data_inizio, data_fine)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_indisponibilita_periodi_date
+        ON indisponibilita_periodi (data_inizio, data_fine)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_indisponibilita_periodi_arbitro
+        ON indisponibilita_periodi (arbitro_cod_mecc, data_inizio, data_fine)
+    ''')
+    
+    # Converte la vecchia tabella con un record per giorno nei periodi equivalenti
+    cursor.execute("SELECT type FROM sqlite_master WHERE name = 'indisponibilita'")
+    existing = cursor.fetchone()
+    if existing and existing[0] == 'table':
+        _migrate_indisponibilita_giorni(conn)
+    
+    # Vista di compatibilità con un record per giorno, come la vecchia tabella indisponibilita.
+    # Se più periodi coprono lo stesso giorno prevale quello inserito per ultimo.
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS indisponibilita AS
+        WITH RECURSIVE giorni (id, giorno) AS (
+            SELECT id, data_inizio FROM indisponibilita_periodi
+            UNION ALL
+            SELECT g.id, DATE(g.giorno, '+1 day')
+            FROM giorni g
+            JOIN indisponibilita_periodi p ON p.id = g.id
+            WHERE g.giorno < p.data_fine
         )
+        SELECT MAX(p.id) AS id, p.cod_mecc, g.giorno AS data_indisponibilita, p.motivo, p.qualifica,
+               p.arbitro_cod_mecc, p.created_at, p.updated_at
+        FROM giorni g
+        JOIN indisponibilita_periodi p ON p.id = g.id
+        GROUP BY p.cod_mecc, g.giorno
     ''')
+
+def _migration_arbitri_alias(conn):
+    """Mappa degli alias dei codici meccanografici e codice arbitro risolto sulle indisponibilità"""
+    cursor = conn.cursor()
     
-    # Tabella organi_tecnici per gestire gli OT con i loro cognomi
+    # Tabella alias: mappa i codici abbreviati di CRA01 e indisponibilità sul cod_mecc dell'anagrafica
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS organi_tecnici (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+        CREATE TABLE IF NOT EXISTS arbitri_alias (
+            tipo TEXT NOT NULL,
+            alias TEXT NOT NULL,
+            cod_mecc TEXT NOT NULL,
+            PRIMARY KEY (tipo, alias)
+        ) WITHOUT ROWID
+    ''')
+    
+    # Popola gli alias per i database creati prima dell'introduzione della tabella
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM arbitri_alias)")
+    if not cursor.fetchone()[0]:
+        _rebuild_arbitri_alias(conn)
+    
+    # Completa il codice arbitro per le indisponibilità caricate prima della sua introduzione
+    _resolve_indisponibilita_arbitri(conn, only_missing=True)
+
+def _migration_valutazioni(conn):
+    """Voti per assegnazione (numero_gara, cod_mecc) con ruolo e OT risolto, più la vista con i dettagli della gara"""
+    cursor = conn.cursor()
+    
+    # Una riga per ogni arbitro designato su una gara votata: le query leggono il voto
+    # dell'assegnazione senza moltiplicare voti e organi tecnici con il join su numero_gara
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS valutazioni (
             numero_gara TEXT NOT NULL,
-            cod_ot TEXT NOT NULL,
-            cognome_ot TEXT NOT NULL,
+            cod_mecc TEXT NOT NULL,
+            ruolo TEXT,
+            data_gara DATE,
+            voto_oa REAL,
+            voto_ot REAL,
+            cognome_ot TEXT,
+            PRIMARY KEY (numero_gara, cod_mecc)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_valutazioni_arbitro
+        ON valutazioni (cod_mecc, data_gara)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_valutazioni_data_ruolo
+        ON valutazioni (data_gara, ruolo)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_valutazioni_ruolo
+        ON valutazioni (ruolo)
+    ''')
+    
+    # Valutazioni con categoria, girone e cognome dalla riga gare della stessa assegnazione
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS valutazioni_gare AS
+        SELECT f.numero_gara, f.cod_mecc, f.ruolo, f.data_gara, f.voto_oa, f.voto_ot, f.cognome_ot,
+               g.categoria, g.girone, g.cognome_arbitro, g.squadra_casa, g.squadra_trasferta
+        FROM valutazioni f
+        JOIN gare g ON g.numero_gara = f.numero_gara AND g.cod_mecc = f.cod_mecc
+    ''')
+    
+    _refresh_valutazioni(conn)
+
+def _migration_ingest_runs(conn):
+    """Registro dei file caricati, identificati dall'hash SHA-256 del contenuto"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            file_name TEXT,
+            righe INTEGER,
+            messaggio TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(numero_gara, cod_ot)
+            UNIQUE (tipo, sha256)
         )
     ''')
+
+def _migration_ingest_jobs(conn):
+    """Coda dei caricamenti elaborati in background, con stato e avanzamento"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            file_name TEXT,
+            stato TEXT NOT NULL DEFAULT 'in_coda',
+            progresso REAL NOT NULL DEFAULT 0,
+            messaggio TEXT,
+            righe INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ingest_jobs_contenuto
+        ON ingest_jobs (tipo, sha256, stato)
+    ''')
+
+def _migration_referee_week(conn):
+    """Celle della Dashboard già composte per arbitro e settimana, popolate dai dati esistenti"""
+    # Una riga per arbitro e lunedì con almeno una parte; il testo di ogni parte è senza prefisso
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS referee_week (
+            cod_mecc TEXT NOT NULL,
+            settimana_inizio DATE NOT NULL,
+            gare TEXT,
+            voti TEXT,
+            indisponibilita TEXT,
+            nota TEXT,
+            PRIMARY KEY (cod_mecc, settimana_inizio)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_referee_week_settimana
+        ON referee_week (settimana_inizio, cod_mecc)
+    ''')
+    
+    refresh_referee_week(conn)
+
+# Migrazioni dello schema in ordine di versione. Ogni migrazione deve poter essere applicata
+# anche a database creati prima dell'introduzione del versionamento.
+SCHEMA_MIGRATIONS = [
+    (1, 'Tabelle arbitri, gare, voti, organi tecnici e note settimanali', _migration_schema_base),
+    (2, 'Indisponibilità per periodo con vista giornaliera', _migration_indisponibilita_periodi),
+    (3, 'Alias dei codici meccanografici', _migration_arbitri_alias),
+    (4, 'Indici composti per le query del catalogo', create_query_indexes),
+    (5, 'Voti per assegnazione', _migration_valutazioni),
+    (6, 'Registro dei caricamenti', _migration_ingest_runs),
+    (7, 'Coda dei caricamenti in background', _migration_ingest_jobs),
+    (8, 'Celle settimanali della Dashboard per arbitro', _migration_referee_week),
+]
+
+def run_migrations():
+    """Applica al database le migrazioni non ancora eseguite, ciascuna in una propria transazione.
+    Restituisce la versione dello schema risultante."""
+    with get_connection() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sistema_config (
+                chiave TEXT PRIMARY KEY,
+                valore TEXT NOT NULL,
+                descrizione TEXT,
+                aggiornato_il TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+        
+        version = 0
+        for target, descrizione, migration in SCHEMA_MIGRATIONS:
+            # Il lock in scrittura evita che due processi applichino la stessa migrazione
+            begin_immediate(conn)
+            row = conn.execute('SELECT valore FROM sistema_config WHERE chiave = ?', (SCHEMA_VERSION_KEY,)).fetchone()
+            version = int(row[0]) if row else 0
+            if version >= target:
+                conn.commit()
+                continue
+            
+            migration(conn)
+            conn.execute('''
+                INSERT OR REPLACE INTO sistema_config (chiave, valore, descrizione, aggiornato_il)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (SCHEMA_VERSION_KEY, str(target), descrizione))
+            bump_data_version(conn)
+            conn.commit()
+            version = target
+        return version
+
+def init_database():
+    """Inizializza il database SQLite applicando le migrazioni mancanti.
+    Le migrazioni vengono eseguite una sola volta per processo e per percorso del database."""
+    global _schema_ready_for
+    
+    if _schema_ready_for == db_connection.DB_PATH:
+        return
+    with _schema_lock:
+        if _schema_ready_for != db_connection.DB_PATH:
+            run_migrations()
+            _schema_ready_for = db_connection.DB_PATH
+
+# Chiave di sistema_config con il contatore delle modifiche ai dati
+DATA_VERSION_KEY = 'data_version'
+
+def bump_data_version(conn):
+    """Incrementa la versione dei dati nella transazione della connessione fornita.
+    Va richiamata da ogni percorso che scrive su arbitri.db, tranne gli aggiornamenti di stato
+    della coda ingest_jobs che non modificano i dati mostrati."""
+    conn.execute('''
+        INSERT INTO sistema_config (chiave, valore, descrizione, aggiornato_il)
+        VALUES (?, '1', 'Contatore delle modifiche ai dati', CURRENT_TIMESTAMP)
+        ON CONFLICT (chiave) DO UPDATE SET
+            valore = CAST(valore AS INTEGER) + 1,
+            aggiornato_il = CURRENT_TIMESTAMP
+    ''', (DATA_VERSION_KEY,))
+
+def get_sistema_config(chiave):
+    """Valore di una chiave di sistema_config, None se assente o se il database non è leggibile"""
+    try:
+        with get_read_connection() as conn:
+            row = conn.execute('SELECT valore FROM sistema_config WHERE chiave = ?', (chiave,)).fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        print(f"Errore nel recupero configurazione {chiave}: {e}")
+        return None
+
+def set_sistema_config(valori, descrizione=None):
+    """Scrive in un'unica transazione le coppie chiave/valore del dizionario valori in sistema_config"""
+    try:
+        with get_connection() as conn:
+            conn.executemany('''
+                INSERT OR REPLACE INTO sistema_config (chiave, valore, descrizione, aggiornato_il)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ''', [(chiave, str(valore), descrizione) for chiave, valore in valori.items()])
+            bump_data_version(conn)
+        return True
+    except Exception as e:
+        print(f"Errore nel salvataggio configurazione: {e}")
+        return False
+
+def get_data_version():
+    """Restituisce la versione corrente dei dati: cambia a ogni scrittura sul database
+    e permette di capire se un risultato calcolato in precedenza è ancora valido.
+    Restituisce None se il database non è leggibile."""
+    try:
+        with get_read_connection() as conn:
+            row = conn.execute('SELECT valore FROM sistema_config WHERE chiave = ?', (DATA_VERSION_KEY,)).fetchone()
+        return int(row[0]) if row else 0
+    except Exception as e:
+        print(f"Errore nel recupero versione dati: {e}")
+        return None
+
+# Lunghezze dei suffissi del cod_mecc usati come codici abbreviati nei file indisponibilità,
+# dal più specifico al meno specifico
+ALIAS_SUFFIX_LENGTHS = (7, 6, 5, 4, 3)
+
+def normalize_cod_mecc(cod_mecc):
+    """Normalizza un codice meccanografico: rimuove spazi, il suffisso '.0' dei numeri letti da Excel
+    e gli zeri iniziali dei codici numerici"""
+    cod = str(cod_mecc).strip()
+    if cod.endswith('.0'):
+        cod = cod[:-2]
+    return str(int(cod)) if cod.isdigit() else cod
+
+def _rebuild_arbitri_alias(conn):
+    """Ricalcola la tabella arbitri_alias dall'anagrafica usando la connessione fornita
+    e riallinea il codice arbitro delle indisponibilità già caricate"""
+    codici = [row[0] for row in conn.execute('SELECT cod_mecc FROM arbitri ORDER BY rowid')]
+    aliases = {}
+    
+    # CRA01: codice completo oppure ultime 7 cifre (il match esatto ha la precedenza)
+    for cod_mecc in codici:
+        aliases.setdefault(('cra01', cod_mecc), cod_mecc)
+    for cod_mecc in codici:
+        aliases.setdefault(('cra01', cod_mecc[-7:]), cod_mecc)
+    
+    # Indisponibilità: codice completo o suffisso, confrontati come numeri (senza zeri iniziali).
+    # In caso di ambiguità vince l'arbitro con il suffisso più lungo coincidente.
+    for length in (None,) + ALIAS_SUFFIX_LENGTHS:
+        for cod_mecc in codici:
+            alias = normalize_cod_mecc(cod_mecc if length is None else cod_mecc[-length:])
+            aliases.setdefault(('indisponibilita', alias), cod_mecc)
+    
+    conn.execute('DELETE FROM arbitri_alias')
+    conn.executemany(
+        'INSERT INTO arbitri_alias (tipo, alias, cod_mecc) VALUES (?, ?, ?)',
+        [(tipo, alias, cod_mecc) for (tipo, alias), cod_mecc in aliases.items()]
+    )
+    _resolve_indisponibilita_arbitri(conn)
+    bump_data_version(conn)
+    return len(aliases)
+
+def _resolve_indisponibilita_arbitri(conn, only_missing=False):
+    """Valorizza indisponibilita_periodi.arbitro_cod_mecc a partire dagli alias, un aggiornamento per codice distinto.
+    Con only_missing=True considera solo le righe non ancora risolte."""
+    alias_map = dict(conn.execute("SELECT alias, cod_mecc FROM arbitri_alias WHERE tipo = 'indisponibilita'"))
+    query = 'SELECT DISTINCT cod_mecc FROM indisponibilita_periodi'
+    if only_missing:
+        query += ' WHERE arbitro_cod_mecc IS NULL'
     
-    conn.commit()
-    conn.close()
+    updates = [(alias_map.get(normalize_cod_mecc(cod)), cod) for (cod,) in conn.execute(query).fetchall()]
+    if only_missing:
+        updates = [update for update in updates if update[0] is not None]
+    conn.executemany('UPDATE indisponibilita_periodi SET arbitro_cod_mecc = ? WHERE cod_mecc = ?', updates)
+    return len(updates)
+
+# Valutazioni di un'assegnazione: voto della gara e cognome dell'OT (uno solo per gara)
+_VALUTAZIONI_SELECT = '''
+    INSERT INTO valutazioni (numero_gara, cod_mecc, ruolo, data_gara, voto_oa, voto_ot, cognome_ot)
+    SELECT g.numero_gara, g.cod_mecc, g.ruolo, g.data_gara, v.voto_oa, v.voto_ot,
+           (SELECT MIN(ot.cognome_ot) FROM organi_tecnici ot WHERE ot.numero_gara = g.numero_gara)
+    FROM gare g
+    JOIN voti v ON v.numero_gara = g.numero_gara
+'''
+
+def _refresh_valutazioni(conn, numeri_gara=None):
+    """Ricalcola le valutazioni delle gare indicate, o di tutte se numeri_gara è None.
+    Va chiamata nella stessa transazione che modifica gare, voti o organi tecnici."""
+    if numeri_gara is None:
+        conn.execute('DELETE FROM valutazioni')
+        conn.execute(_VALUTAZIONI_SELECT)
+        return
+    
+    keys = [(numero_gara,) for numero_gara in set(numeri_gara)]
+    conn.executemany('DELETE FROM valutazioni WHERE numero_gara = ?', keys)
+    conn.executemany(_VALUTAZIONI_SELECT + ' WHERE g.numero_gara = ?', keys)
+
+# Intervalli (arbitro, inizio, fine) delle righe di gare e indisponibilità che compongono referee_week,
+# per i numeri di gara e i codici di indisponibilità passati come liste JSON. Le valutazioni hanno
+# arbitro e data della riga gare da cui derivano.
+_REFEREE_WEEK_FONTI = '''
+    SELECT cod_mecc, data_gara, data_gara FROM gare
+    WHERE numero_gara IN (SELECT value FROM json_each(?))
+    UNION
+    SELECT arbitro_cod_mecc, data_inizio, data_fine FROM indisponibilita_periodi
+    WHERE cod_mecc IN (SELECT value FROM json_each(?))
+'''
+
+def _referee_week_sources(conn, numeri_gara=(), codici_indisponibilita=()):
+    """Intervalli delle righe sorgenti di referee_week per le gare e i codici di indisponibilità indicati"""
+    return conn.execute(_REFEREE_WEEK_FONTI, (
+        json.dumps([str(numero_gara) for numero_gara in set(numeri_gara)]),
+        json.dumps([str(cod_mecc) for cod_mecc in set(codici_indisponibilita)]),
+    )).fetchall()
+
+def _refresh_referee_week_sources(conn, prima, numeri_gara=(), codici_indisponibilita=()):
+    """Ricalcola referee_week per le settimane delle righe sorgenti lette con _referee_week_sources prima
+    della modifica (prima) e dopo: vanno aggiornate sia le settimane lasciate sia quelle nuove.
+    Va chiamata nella stessa transazione della modifica."""
+    dopo = _referee_week_sources(conn, numeri_gara, codici_indisponibilita)
+    refresh_referee_week(conn, referee_week_keys(prima + dopo))
+
+def _migrate_indisponibilita_giorni(conn):
+    """Raggruppa i giorni consecutivi della vecchia tabella indisponibilita (stesso codice, motivo e qualifica)
+    in indisponibilita_periodi ed elimina la tabella, che viene sostituita dalla vista di compatibilità"""
+    columns = [col[1] for col in conn.execute("PRAGMA table_info(indisponibilita)")]
+    qualifica = 'qualifica' if 'qualifica' in columns else 'NULL'
+    giorni = pd.read_sql_query(
+        f"SELECT cod_mecc, data_indisponibilita, motivo, {qualifica} AS qualifica FROM indisponibilita", conn
+    )
+    
+    if not giorni.empty:
+        keys = ['cod_mecc', 'motivo', 'qualifica']
+        giorni['data_indisponibilita'] = pd.to_datetime(giorni['data_indisponibilita'])
+        giorni = giorni.sort_values(keys + ['data_indisponibilita'])
+        
+        # Un nuovo periodo inizia quando cambia la chiave o c'è un salto di più di un giorno
+        chiave = giorni[keys].fillna('')
+        nuovo = (chiave != chiave.shift()).any(axis=1) | (giorni['data_indisponibilita'].diff() != pd.Timedelta(days=1))
+        periodi = giorni.groupby(nuovo.cumsum()).agg(
+            cod_mecc=('cod_mecc', 'first'),
+            data_inizio=('data_indisponibilita', 'min'),
+            data_fine=('data_indisponibilita', 'max'),
+            motivo=('motivo', 'first'),
+            qualifica=('qualifica', 'first'),
+        )
+        conn.executemany('''
+            INSERT OR REPLACE INTO indisponibilita_periodi (cod_mecc, data_inizio, data_fine, motivo, qualifica)
+            VALUES (?, ?, ?, ?, ?)
+        ''', _as_rows(periodi, ('cod_mecc', 'data_inizio', 'data_fine', 'motivo', 'qualifica')))
+    
+    conn.execute('DROP TABLE indisponibilita')
+
+# Arbitro risolto e date di ogni periodo di indisponibilità
+_PERIODI_ARBITRO = 'SELECT id, arbitro_cod_mecc, data_inizio, data_fine FROM indisponibilita_periodi'
+
+def rebuild_arbitri_alias():
+    """Ricostruisce la tabella degli alias dei codici meccanografici.
+    Va richiamata ogni volta che l'anagrafica arbitri viene caricata o modificata."""
+    try:
+        with get_connection() as conn:
+            # Un'indisponibilità che cambia arbitro risolto sposta le celle del vecchio e del nuovo arbitro
+            prima = set(conn.execute(_PERIODI_ARBITRO))
+            count = _rebuild_arbitri_alias(conn)
+            cambiati = prima ^ set(conn.execute(_PERIODI_ARBITRO))
+            refresh_referee_week(conn, referee_week_keys(
+                (arbitro, inizio, fine) for _, arbitro, inizio, fine in cambiati if arbitro is not None
+            ))
+            return count
+    except Exception as e:
+        print(f"Errore nella ricostruzione alias arbitri: {e}")
+        return 0
+
+def get_cod_mecc_alias_map(tipo='cra01'):
+    """Restituisce la mappa in memoria alias -> cod_mecc per il tipo di file indicato
+    ('cra01' o 'indisponibilita'). Per 'indisponibilita' le chiavi vanno cercate con normalize_cod_mecc()."""
+    try:
+        with get_read_connection() as conn:
+            return dict(conn.execute('SELECT alias, cod_mecc FROM arbitri_alias WHERE tipo = ?', (tipo,)))
+    except Exception as e:
+        print(f"Errore nel recupero alias arbitri: {e}")
+        return {}
 
 def get_arbitri():
     """Recupera tutti gli arbitri dal database"""
-    conn = sqlite3.connect('arbitri.db')
     try:
-        df = pd.read_sql_query("SELECT * FROM arbitri ORDER BY cognome, nome", conn)
-        return df
+        with get_read_connection() as conn:
+            return pd.read_sql_query("SELECT * FROM arbitri ORDER BY cognome, nome", conn)
     except Exception as e:
         print(f"Errore nel recupero arbitri: {e}")
         return pd.DataFrame()
-    finally:
-        conn.close()
+
+def count_arbitri():
+    """Numero di arbitri in anagrafica, senza leggere la tabella; None se il database non è leggibile"""
+    try:
+        with get_read_connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM arbitri').fetchone()[0]
+    except Exception as e:
+        print(f"Errore nel conteggio arbitri: {e}")
+        return None
 
 def get_gare_by_week(week_start, week_end):
     """Recupera le gare assegnate per una settimana specifica"""
-    conn = sqlite3.connect('arbitri.db')
     try:
         query = '''
             SELECT g.*, a.cognome, a.nome 
@@ -127,207 +592,574 @@ def get_gare_by_week(week_start, week_end):
             WHERE g.data_gara BETWEEN ? AND ?
             ORDER BY g.data_gara, g.numero_gara
         '''
-        df = pd.read_sql_query(query, conn, params=[week_start.date(), week_end.date()])
+        with get_read_connection() as conn:
+            df = pd.read_sql_query(query, conn, params=[week_start.date(), week_end.date()])
         if not df.empty and 'data_gara' in df.columns:
             df['data_gara'] = pd.to_datetime(df['data_gara'])
         return df
     except Exception as e:
         print(f"Errore nel recupero gare: {e}")
         return pd.DataFrame()
-    finally:
-        conn.close()
 
 def get_voti_by_week(week_start, week_end):
-    """Recupera i voti per una settimana specifica"""
-    conn = sqlite3.connect('arbitri.db')
+    """Recupera i voti per una settimana specifica, una riga per gara votata"""
     try:
         query = '''
             SELECT v.*, g.data_gara
             FROM voti v
-            JOIN gare g ON v.numero_gara = g.numero_gara
-            WHERE g.data_gara BETWEEN ? AND ?
+            JOIN (
+                SELECT numero_gara, MIN(data_gara) as data_gara
+                FROM valutazioni
+                WHERE data_gara BETWEEN ? AND ?
+                GROUP BY numero_gara
+            ) g ON v.numero_gara = g.numero_gara
             ORDER BY g.data_gara, v.numero_gara
         '''
-        df = pd.read_sql_query(query, conn, params=[week_start.date(), week_end.date()])
+        with get_read_connection() as conn:
+            df = pd.read_sql_query(query, conn, params=[week_start.date(), week_end.date()])
         if not df.empty and 'data_gara' in df.columns:
             df['data_gara'] = pd.to_datetime(df['data_gara'])
         return df
     except Exception as e:
         print(f"Errore nel recupero voti: {e}")
         return pd.DataFrame()
-    finally:
-        conn.close()
+
+def get_indisponibilita_periodi(data_inizio, data_fine, arbitro_cod_mecc=None):
+    """Recupera i periodi di indisponibilità che si sovrappongono all'intervallo [data_inizio, data_fine],
+    eventualmente per un solo arbitro dell'anagrafica"""
+    try:
+        query = '''
+            SELECT p.*, a.cognome, a.nome
+            FROM indisponibilita_periodi p
+            LEFT JOIN arbitri a ON p.arbitro_cod_mecc = a.cod_mecc
+            WHERE p.data_inizio <= ? AND p.data_fine >= ?
+        '''
+        params = [pd.Timestamp(data_fine).date(), pd.Timestamp(data_inizio).date()]
+        if arbitro_cod_mecc is not None:
+            query += ' AND p.arbitro_cod_mecc = ?'
+            params.append(arbitro_cod_mecc)
+        query += ' ORDER BY p.data_inizio, p.id'
+        
+        with get_read_connection() as conn:
+            df = pd.read_sql_query(query, conn, params=params)
+        if not df.empty:
+            df['data_inizio'] = pd.to_datetime(df['data_inizio'])
+            df['data_fine'] = pd.to_datetime(df['data_fine'])
+        return df
+    except Exception as e:
+        print(f"Errore nel recupero periodi di indisponibilità: {e}")
+        return pd.DataFrame()
 
 def get_indisponibilita_by_week(week_start, week_end):
     """Recupera le indisponibilità per una settimana specifica"""
-    conn = sqlite3.connect('arbitri.db')
     try:
         query = '''
             SELECT i.*, a.cognome, a.nome
             FROM indisponibilita i
-            JOIN arbitri a ON i.cod_mecc = a.cod_mecc
+            JOIN arbitri a ON i.arbitro_cod_mecc = a.cod_mecc
             WHERE i.data_indisponibilita BETWEEN ? AND ?
             ORDER BY i.data_indisponibilita, a.cognome
         '''
-        df = pd.read_sql_query(query, conn, params=[week_start.date(), week_end.date()])
+        with get_read_connection() as conn:
+            df = pd.read_sql_query(query, conn, params=[week_start.date(), week_end.date()])
         if not df.empty and 'data_indisponibilita' in df.columns:
             df['data_indisponibilita'] = pd.to_datetime(df['data_indisponibilita'])
         return df
     except Exception as e:
         print(f"Errore nel recupero indisponibilità: {e}")
         return pd.DataFrame()
-    finally:
-        conn.close()
+
+def _fetch_dict(cursor):
+    """Prima riga del cursore come dizionario colonna -> valore, o None"""
+    row = cursor.fetchone()
+    return dict(zip([col[0] for col in cursor.description], row)) if row else None
+
+def get_ingest_run(tipo, sha256):
+    """Restituisce il caricamento già registrato per il contenuto indicato (dizionario) o None"""
+    try:
+        with get_read_connection() as conn:
+            cursor = conn.execute('''
+                SELECT id, tipo, sha256, file_name, righe, messaggio, created_at
+                FROM ingest_runs WHERE tipo = ? AND sha256 = ?
+            ''', (tipo, sha256))
+            return _fetch_dict(cursor)
+    except Exception as e:
+        print(f"Errore nel recupero caricamento: {e}")
+        return None
+
+def record_ingest_run(tipo, sha256, file_name=None, righe=None, messaggio=None):
+    """Registra un caricamento completato; un contenuto già registrato viene aggiornato"""
+    try:
+        with get_connection() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO ingest_runs (tipo, sha256, file_name, righe, messaggio, created_at)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (tipo, sha256, file_name, righe, messaggio))
+            bump_data_version(conn)
+        return True
+    except Exception as e:
+        print(f"Errore nella registrazione caricamento: {e}")
+        return False
+
+# Stati dei caricamenti in background ancora da concludere
+INGEST_JOB_ACTIVE = ('in_coda', 'in_corso')
+
+def create_ingest_job(tipo, sha256, file_name=None):
+    """Accoda un caricamento e ne restituisce l'identificativo (None in caso di errore)"""
+    try:
+        with get_connection() as conn:
+            cursor = conn.execute(
+                'INSERT INTO ingest_jobs (tipo, sha256, file_name) VALUES (?, ?, ?)', (tipo, sha256, file_name)
+            )
+        return cursor.lastrowid
+    except Exception as e:
+        print(f"Errore nella creazione caricamento: {e}")
+        return None
+
+def update_ingest_job(job_id, stato=None, progresso=None, messaggio=None, righe=None):
+    """Aggiorna stato e avanzamento di un caricamento; i campi None restano invariati.
+    Il passaggio a 'in_corso' registra l'avvio, quello a 'completato' o 'errore' la conclusione."""
+    campi = {'stato': stato, 'progresso': progresso, 'messaggio': messaggio, 'righe': righe}
+    assegnazioni = [f"{campo} = ?" for campo, valore in campi.items() if valore is not None]
+    valori = [valore for valore in campi.values() if valore is not None]
+    if stato == 'in_corso':
+        assegnazioni.append('started_at = CURRENT_TIMESTAMP')
+    elif stato is not None and stato not in INGEST_JOB_ACTIVE:
+        assegnazioni.append('finished_at = CURRENT_TIMESTAMP')
+    if not assegnazioni:
+        return False
+    
+    try:
+        with get_connection() as conn:
+            conn.execute(f"UPDATE ingest_jobs SET {', '.join(assegnazioni)} WHERE id = ?", valori + [job_id])
+        return True
+    except Exception as e:
+        print(f"Errore nell'aggiornamento caricamento: {e}")
+        return False
+
+def get_ingest_job(job_id):
+    """Restituisce un caricamento in background (dizionario) o None"""
+    try:
+        with get_read_connection() as conn:
+            return _fetch_dict(conn.execute('SELECT * FROM ingest_jobs WHERE id = ?', (job_id,)))
+    except Exception as e:
+        print(f"Errore nel recupero caricamento: {e}")
+        return None
+
+def get_active_ingest_job(tipo, sha256):
+    """Restituisce il caricamento ancora in coda o in corso per il contenuto indicato, o None"""
+    try:
+        with get_read_connection() as conn:
+            return _fetch_dict(conn.execute('''
+                SELECT * FROM ingest_jobs
+                WHERE tipo = ? AND sha256 = ? AND stato IN (?, ?)
+                ORDER BY id DESC LIMIT 1
+            ''', (tipo, sha256) + INGEST_JOB_ACTIVE))
+    except Exception as e:
+        print(f"Errore nel recupero caricamento: {e}")
+        return None
+
+def fail_interrupted_ingest_jobs():
+    """Segna come falliti i caricamenti rimasti in coda o in corso da un processo terminato.
+    Restituisce il numero di caricamenti aggiornati."""
+    try:
+        with get_connection() as conn:
+            cursor = conn.execute('''
+                UPDATE ingest_jobs
+                SET stato = 'errore', messaggio = 'Caricamento interrotto dal riavvio del server', finished_at = CURRENT_TIMESTAMP
+                WHERE stato IN (?, ?)
+            ''', INGEST_JOB_ACTIVE)
+        return cursor.rowcount
+    except Exception as e:
+        print(f"Errore nell'aggiornamento caricamenti interrotti: {e}")
+        return 0
 
 def upsert_arbitro(cod_mecc, cognome, nome, sezione=None, eta=None, anno_anzianita=None):
     """Inserisce o aggiorna un arbitro"""
-    conn = sqlite3.connect('arbitri.db')
-    cursor = conn.cursor()
-    
     try:
-        cursor.execute('''
-            INSERT OR REPLACE INTO arbitri (cod_mecc, cognome, nome, sezione, eta, anno_anzianita, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-        ''', (cod_mecc, cognome, nome, sezione, eta, anno_anzianita))
-        
-        conn.commit()
+        with get_connection() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO arbitri (cod_mecc, cognome, nome, sezione, eta, anno_anzianita, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (cod_mecc, cognome, nome, sezione, eta, anno_anzianita))
+            bump_data_version(conn)
         return True
     except Exception as e:
         print(f"Errore nell'inserimento arbitro: {e}")
         return False
-    finally:
-        conn.close()
 
 def update_arbitro_anzianita(cod_mecc, anno_anzianita):
     """Aggiorna solo l'anno di anzianità di un arbitro"""
-    conn = sqlite3.connect('arbitri.db')
-    cursor = conn.cursor()
-    
     try:
-        cursor.execute('''
-            UPDATE arbitri 
-            SET anno_anzianita = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE cod_mecc = ?
-        ''', (anno_anzianita, cod_mecc))
-        
-        conn.commit()
+        with get_connection() as conn:
+            cursor = conn.execute('''
+                UPDATE arbitri 
+                SET anno_anzianita = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE cod_mecc = ?
+            ''', (anno_anzianita, cod_mecc))
+            if cursor.rowcount > 0:
+                bump_data_version(conn)
         return cursor.rowcount > 0
     except Exception as e:
         print(f"Errore nell'aggiornamento anzianità: {e}")
         return False
-    finally:
-        conn.close()
+
+def update_arbitri_anzianita_bulk(anzianita):
+    """Aggiorna in un'unica transazione l'anno di anzianità degli arbitri, passati come coppie
+    (cod_mecc, anno_anzianita). Restituisce il numero di aggiornamenti applicati."""
+    rows = [(anno_anzianita, cod_mecc) for cod_mecc, anno_anzianita in anzianita]
+    if not rows:
+        return 0
+    
+    try:
+        with get_connection() as conn:
+            cursor = conn.executemany('''
+                UPDATE arbitri 
+                SET anno_anzianita = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE cod_mecc = ?
+            ''', rows)
+            if cursor.rowcount > 0:
+                bump_data_version(conn)
+        return cursor.rowcount
+    except Exception as e:
+        print(f"Errore nell'aggiornamento massivo anzianità: {e}")
+        return 0
 
 def find_matching_arbitro_cod_mecc(cod_mecc_cra01):
     """Trova il codice meccanografico corrispondente nell'anagrafica arbitri.
     Il CRA01 contiene codici a 7 cifre, l'anagrafica ha codici a 8 cifre."""
-    conn = sqlite3.connect('arbitri.db')
-    cursor = conn.cursor()
-    
     try:
-        # Il CRA01 ha codici a 7 cifre, l'anagrafica a 8 cifre
-        # Cerca un arbitro il cui cod_mecc termina con il codice del CRA01
-        cursor.execute('''
-            SELECT cod_mecc FROM arbitri 
-            WHERE SUBSTR(cod_mecc, -7) = ? OR cod_mecc = ?
-            LIMIT 1
-        ''', (str(cod_mecc_cra01), str(cod_mecc_cra01)))
-        
-        result = cursor.fetchone()
+        # Il CRA01 ha codici a 7 cifre, l'anagrafica a 8 cifre:
+        # la corrispondenza è precalcolata nella tabella arbitri_alias
+        with get_read_connection() as conn:
+            result = conn.execute('''
+                SELECT cod_mecc FROM arbitri_alias 
+                WHERE tipo = 'cra01' AND alias = ?
+            ''', (str(cod_mecc_cra01),)).fetchone()
         return result[0] if result else cod_mecc_cra01  # Se non trova match, usa il codice originale
     except Exception as e:
         print(f"Errore nella ricerca codice arbitro: {e}")
         return cod_mecc_cra01  # Fallback al codice originale
-    finally:
-        conn.close()
 
 def upsert_gara(numero_gara, cod_mecc, data_gara=None, categoria=None, squadra_casa=None, squadra_trasferta=None, girone=None, ruolo=None, cognome_arbitro=None):
     """Inserisce o aggiorna una gara"""
-    conn = sqlite3.connect('arbitri.db')
-    cursor = conn.cursor()
-    
     try:
         # Trova il codice meccanografico corrispondente nell'anagrafica
         matched_cod_mecc = find_matching_arbitro_cod_mecc(cod_mecc)
         
-        cursor.execute('''
-            INSERT OR REPLACE INTO gare 
-            (numero_gara, cod_mecc, data_gara, categoria, girone, ruolo, cognome_arbitro, squadra_casa, squadra_trasferta, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-        ''', (numero_gara, matched_cod_mecc, data_gara, categoria, girone, ruolo, cognome_arbitro, squadra_casa, squadra_trasferta))
-        
-        conn.commit()
+        with get_connection() as conn:
+            prima = _referee_week_sources(conn, numeri_gara=[numero_gara])
+            conn.execute('''
+                INSERT OR REPLACE INTO gare 
+                (numero_gara, cod_mecc, data_gara, categoria, girone, ruolo, cognome_arbitro, squadra_casa, squadra_trasferta, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (numero_gara, matched_cod_mecc, data_gara, categoria, girone, ruolo, cognome_arbitro, squadra_casa, squadra_trasferta))
+            _refresh_valutazioni(conn, [numero_gara])
+            _refresh_referee_week_sources(conn, prima, numeri_gara=[numero_gara])
+            bump_data_version(conn)
         return True
     except Exception as e:
         print(f"Errore nell'inserimento gara: {e}")
         return False
-    finally:
-        conn.close()
 
 def upsert_voto(numero_gara, voto_oa=None, voto_ot=None, note=None):
     """Inserisce o aggiorna un voto"""
-    conn = sqlite3.connect('arbitri.db')
-    cursor = conn.cursor()
-    
     try:
-        cursor.execute('''
-            INSERT OR REPLACE INTO voti (numero_gara, voto_oa, voto_ot, note, updated_at)
-            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-        ''', (numero_gara, voto_oa, voto_ot, note))
-        
-        conn.commit()
+        with get_connection() as conn:
+            prima = _referee_week_sources(conn, numeri_gara=[numero_gara])
+            conn.execute('''
+                INSERT OR REPLACE INTO voti (numero_gara, voto_oa, voto_ot, note, updated_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (numero_gara, voto_oa, voto_ot, note))
+            _refresh_valutazioni(conn, [numero_gara])
+            _refresh_referee_week_sources(conn, prima, numeri_gara=[numero_gara])
+            bump_data_version(conn)
         return True
     except Exception as e:
         print(f"Errore nell'inserimento voto: {e}")
         return False
-    finally:
-        conn.close()
 
-def upsert_indisponibilita(cod_mecc, data_indisponibilita, motivo=None, qualifica=None):
-    """Inserisce o aggiorna un'indisponibilità"""
-    conn = sqlite3.connect('arbitri.db')
-    cursor = conn.cursor()
-    
+def upsert_indisponibilita(cod_mecc, data_indisponibilita, motivo=None, qualifica=None, data_fine=None):
+    """Inserisce o aggiorna un'indisponibilità dal giorno data_indisponibilita fino a data_fine (inclusa).
+    Senza data_fine l'indisponibilità riguarda il solo giorno indicato."""
     try:
-        # Verifica se la colonna qualifica esiste
-        cursor.execute("PRAGMA table_info(indisponibilita)")
-        columns = [col[1] for col in cursor.fetchall()]
-        has_qualifica = 'qualifica' in columns
-        
-        if has_qualifica:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Risolve il codice dell'arbitro in anagrafica
+            cursor.execute(
+                "SELECT cod_mecc FROM arbitri_alias WHERE tipo = 'indisponibilita' AND alias = ?",
+                (normalize_cod_mecc(cod_mecc),)
+            )
+            match = cursor.fetchone()
+            arbitro_cod_mecc = match[0] if match else None
+            
+            prima = _referee_week_sources(conn, codici_indisponibilita=[cod_mecc])
             cursor.execute('''
-                INSERT OR REPLACE INTO indisponibilita (cod_mecc, data_indisponibilita, motivo, qualifica, updated_at)
-                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (cod_mecc, data_indisponibilita, motivo, qualifica))
-        else:
-            cursor.execute('''
-                INSERT OR REPLACE INTO indisponibilita (cod_mecc, data_indisponibilita, motivo, updated_at)
-                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (cod_mecc, data_indisponibilita, motivo))
-        
-        conn.commit()
+                INSERT OR REPLACE INTO indisponibilita_periodi
+                (cod_mecc, data_inizio, data_fine, motivo, qualifica, arbitro_cod_mecc, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (cod_mecc, data_indisponibilita, data_fine or data_indisponibilita, motivo, qualifica, arbitro_cod_mecc))
+            _refresh_referee_week_sources(conn, prima, codici_indisponibilita=[cod_mecc])
+            bump_data_version(conn)
         return True
     except Exception as e:
         print(f"Errore nell'inserimento indisponibilità: {e}")
         return False
-    finally:
-        conn.close()
 
 def upsert_organo_tecnico(numero_gara, cod_ot, cognome_ot):
     """Inserisce o aggiorna un organo tecnico per una gara"""
-    conn = sqlite3.connect('arbitri.db')
-    cursor = conn.cursor()
-    
     try:
-        cursor.execute('''
-            INSERT OR REPLACE INTO organi_tecnici (numero_gara, cod_ot, cognome_ot, updated_at)
-            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-        ''', (numero_gara, cod_ot, cognome_ot))
-        
-        conn.commit()
+        with get_connection() as conn:
+            prima = _referee_week_sources(conn, numeri_gara=[numero_gara])
+            conn.execute('''
+                INSERT OR REPLACE INTO organi_tecnici (numero_gara, cod_ot, cognome_ot, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (numero_gara, cod_ot, cognome_ot))
+            _refresh_valutazioni(conn, [numero_gara])
+            _refresh_referee_week_sources(conn, prima, numeri_gara=[numero_gara])
+            bump_data_version(conn)
         return True
     except Exception as e:
         print(f"Errore nell'inserimento organo tecnico: {e}")
         return False
+
+# Colonne attese (in ordine) dalle funzioni di inserimento massivo
+ARBITRI_COLUMNS = ('cod_mecc', 'cognome', 'nome', 'sezione', 'eta', 'anno_anzianita')
+GARE_COLUMNS = ('numero_gara', 'cod_mecc', 'data_gara', 'categoria', 'girone', 'ruolo', 'cognome_arbitro', 'squadra_casa', 'squadra_trasferta')
+VOTI_COLUMNS = ('numero_gara', 'voto_oa', 'voto_ot', 'note')
+INDISPONIBILITA_COLUMNS = ('cod_mecc', 'data_inizio', 'data_fine', 'motivo', 'qualifica')
+ORGANI_TECNICI_COLUMNS = ('numero_gara', 'cod_ot', 'cognome_ot')
+
+def _as_rows(data, columns):
+    """Converte un DataFrame o un iterabile di tuple in una lista di tuple ordinate come columns.
+    Le colonne opzionali mancanti nel DataFrame vengono inserite come NULL."""
+    if isinstance(data, pd.DataFrame):
+        frame = data.reindex(columns=list(columns))
+        for col in frame.columns:
+            if pd.api.types.is_datetime64_any_dtype(frame[col]):
+                frame[col] = frame[col].dt.date
+        frame = frame.astype(object).where(frame.notna(), None)
+        return list(frame.itertuples(index=False, name=None))
+    
+    rows = []
+    for row in data:
+        row = tuple(row)
+        # Completa le tuple più corte con None per i campi opzionali
+        rows.append(row + (None,) * (len(columns) - len(row)))
+    return rows
+
+def upsert_arbitri_bulk(arbitri):
+    """Inserisce o aggiorna in un'unica transazione gli arbitri passati come DataFrame o iterabile di tuple
+    (nell'ordine di ARBITRI_COLUMNS). Gli arbitri già presenti vengono aggiornati solo se i dati anagrafici
+    cambiano; regioni e anzianità già impostate restano invariate (l'anzianità viene sovrascritta solo se
+    fornita). Restituisce il numero di righe elaborate."""
+    rows = _as_rows(arbitri, ARBITRI_COLUMNS)
+    if not rows:
+        return 0
+    
+    try:
+        with get_connection() as conn:
+            changes = conn.total_changes
+            conn.executemany('''
+                INSERT INTO arbitri (cod_mecc, cognome, nome, sezione, eta, anno_anzianita, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (cod_mecc) DO UPDATE SET
+                    cognome = excluded.cognome,
+                    nome = excluded.nome,
+                    sezione = excluded.sezione,
+                    eta = excluded.eta,
+                    anno_anzianita = COALESCE(excluded.anno_anzianita, arbitri.anno_anzianita),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE arbitri.cognome IS NOT excluded.cognome
+                   OR arbitri.nome IS NOT excluded.nome
+                   OR arbitri.sezione IS NOT excluded.sezione
+                   OR arbitri.eta IS NOT excluded.eta
+                   OR excluded.anno_anzianita IS NOT NULL AND arbitri.anno_anzianita IS NOT excluded.anno_anzianita
+            ''', rows)
+            if conn.total_changes > changes:
+                bump_data_version(conn)
+        return len(rows)
+    except Exception as e:
+        print(f"Errore nell'inserimento massivo arbitri: {e}")
+        return 0
+
+# Tabelle temporanee di staging dei caricamenti: nome -> (tabella pubblicata, colonne attese)
+STAGING_TABLES = {
+    'gare': ('gare', GARE_COLUMNS),
+    'organi_tecnici': ('organi_tecnici', ORGANI_TECNICI_COLUMNS),
+    'voti': ('voti', VOTI_COLUMNS),
+    'indisponibilita': ('indisponibilita_periodi', INDISPONIBILITA_COLUMNS),
+}
+
+# Identificativi delle sessioni di staging aperte nel processo
+_staging_ids = itertools.count(1)
+
+# Validazione insiemistica delle righe in staging: elimina le righe non pubblicabili e completa i campi derivati
+_STAGING_VALIDATION = {
+    'gare': [
+        "DELETE FROM {staging}gare WHERE COALESCE(TRIM(numero_gara), '') = '' OR COALESCE(TRIM(cod_mecc), '') = ''",
+    ],
+    'organi_tecnici': [
+        "DELETE FROM {staging}organi_tecnici WHERE COALESCE(TRIM(numero_gara), '') = '' OR COALESCE(TRIM(cod_ot), '') = ''",
+    ],
+    'voti': [
+        "DELETE FROM {staging}voti WHERE COALESCE(TRIM(numero_gara), '') = '' OR voto_oa IS NULL OR voto_oa NOT BETWEEN 0 AND 10",
+        "UPDATE {staging}voti SET voto_ot = NULL WHERE voto_ot NOT BETWEEN 0 AND 10",
+    ],
+    'indisponibilita': [
+        "DELETE FROM {staging}indisponibilita WHERE COALESCE(TRIM(cod_mecc), '') = '' OR data_inizio IS NULL",
+        # Senza una data fine valida l'indisponibilità riguarda solo la data inizio
+        "UPDATE {staging}indisponibilita SET data_fine = data_inizio WHERE data_fine IS NULL OR data_fine < data_inizio",
+    ],
+}
+
+# Pubblicazione nelle tabelle live nell'ordine di caricamento: a parità di chiave vale l'ultima riga
+_STAGING_PUBLISH = {
+    'gare': '''
+        INSERT OR REPLACE INTO gare
+        (numero_gara, cod_mecc, data_gara, categoria, girone, ruolo, cognome_arbitro, squadra_casa, squadra_trasferta, updated_at)
+        SELECT s.numero_gara, COALESCE(a.cod_mecc, s.cod_mecc), s.data_gara, s.categoria, s.girone, s.ruolo,
+               s.cognome_arbitro, s.squadra_casa, s.squadra_trasferta, CURRENT_TIMESTAMP
+        FROM {staging}gare s
+        LEFT JOIN arbitri_alias a ON a.tipo = 'cra01' AND a.alias = s.cod_mecc
+        ORDER BY s.rowid
+    ''',
+    'organi_tecnici': '''
+        INSERT OR REPLACE INTO organi_tecnici (numero_gara, cod_ot, cognome_ot, updated_at)
+        SELECT numero_gara, cod_ot, cognome_ot, CURRENT_TIMESTAMP
+        FROM {staging}organi_tecnici
+        ORDER BY rowid
+    ''',
+    'voti': '''
+        INSERT OR REPLACE INTO voti (numero_gara, voto_oa, voto_ot, note, updated_at)
+        SELECT numero_gara, voto_oa, voto_ot, note, CURRENT_TIMESTAMP
+        FROM {staging}voti
+        ORDER BY rowid
+    ''',
+    'indisponibilita': '''
+        INSERT OR REPLACE INTO indisponibilita_periodi
+        (cod_mecc, data_inizio, data_fine, motivo, qualifica, arbitro_cod_mecc, updated_at)
+        SELECT s.cod_mecc, s.data_inizio, s.data_fine, s.motivo, s.qualifica, a.cod_mecc, CURRENT_TIMESTAMP
+        FROM {staging}indisponibilita s
+        LEFT JOIN arbitri_alias a ON a.tipo = 'indisponibilita' AND a.alias = normalize_cod_mecc(s.cod_mecc)
+        ORDER BY s.rowid
+    ''',
+}
+
+def _staging_prefix(staging):
+    """Prefisso delle tabelle temporanee di una sessione di staging"""
+    return f"temp.staging_{int(staging)}_"
+
+def begin_staging():
+    """Apre una sessione di staging e ne restituisce l'identificativo. Le tabelle temporanee della sessione
+    vivono sulla connessione in scrittura, copiano i tipi delle colonne pubblicate e non sono visibili
+    alle letture. Più sessioni possono essere aperte contemporaneamente da caricamenti diversi."""
+    staging = next(_staging_ids)
+    with get_connection() as conn:
+        for nome, (tabella, columns) in STAGING_TABLES.items():
+            conn.execute(f"CREATE TEMP TABLE staging_{staging}_{nome} AS SELECT {', '.join(columns)} FROM {tabella} WHERE 0")
+    return staging
+
+def stage_rows(staging, nome, data):
+    """Aggiunge alla tabella di staging indicata le righe passate come DataFrame o iterabile di tuple
+    (nell'ordine delle colonne di STAGING_TABLES). Le tabelle live non vengono toccate: la transazione
+    tiene il lock in scrittura solo per il tempo dell'inserimento. Restituisce il numero di righe aggiunte."""
+    columns = STAGING_TABLES[nome][1]
+    rows = _as_rows(data, columns)
+    with get_connection() as conn:
+        conn.executemany(
+            f"INSERT INTO {_staging_prefix(staging)}{nome} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows
+        )
+    return len(rows)
+
+def publish_staging(staging):
+    """Valida le righe della sessione di staging e le pubblica nelle tabelle live in un'unica transazione,
+    aggiornando valutazioni, celle settimanali e versione dei dati una sola volta: le letture vedono il
+    caricamento per intero solo dopo il commit. Chiude la sessione e restituisce per ogni staging il numero di righe pubblicate."""
+    prefix = _staging_prefix(staging)
+    with get_connection() as conn:
+        conn.create_function('normalize_cod_mecc', 1, normalize_cod_mecc, deterministic=True)
+        
+        published = {}
+        for nome in STAGING_TABLES:
+            for statement in _STAGING_VALIDATION[nome]:
+                conn.execute(statement.format(staging=prefix))
+            published[nome] = conn.execute(f"SELECT COUNT(*) FROM {prefix}{nome}").fetchone()[0]
+        
+        # Gare e codici di indisponibilità toccati dal caricamento, con le settimane che occupano ora
+        numeri_gara = [row[0] for row in conn.execute(f'''
+            SELECT numero_gara FROM {prefix}gare
+            UNION SELECT numero_gara FROM {prefix}organi_tecnici
+            UNION SELECT numero_gara FROM {prefix}voti
+        ''')]
+        codici = [row[0] for row in conn.execute(f"SELECT DISTINCT cod_mecc FROM {prefix}indisponibilita")]
+        prima = _referee_week_sources(conn, numeri_gara, codici)
+        
+        for nome in STAGING_TABLES:
+            if published[nome]:
+                conn.execute(_STAGING_PUBLISH[nome].format(staging=prefix))
+        
+        # Valutazioni e celle settimanali delle sole gare e indisponibilità toccate dal caricamento
+        if numeri_gara:
+            _refresh_valutazioni(conn, numeri_gara)
+        if numeri_gara or codici:
+            _refresh_referee_week_sources(conn, prima, numeri_gara, codici)
+        if any(published.values()):
+            bump_data_version(conn)
+        
+        for nome in STAGING_TABLES:
+            conn.execute(f"DROP TABLE {prefix}{nome}")
+    return published
+
+def discard_staging(staging):
+    """Elimina le tabelle di una sessione di staging non pubblicata (nessun effetto se già pubblicata)"""
+    with get_connection() as conn:
+        for nome in STAGING_TABLES:
+            conn.execute(f"DROP TABLE IF EXISTS {_staging_prefix(staging)}{nome}")
+
+def _publish_bulk(nome, data):
+    """Carica in un'unica transazione le righe di una sola tabella passando dallo staging"""
+    staging = begin_staging()
+    try:
+        stage_rows(staging, nome, data)
+        return publish_staging(staging)[nome]
     finally:
-        conn.close()
+        discard_staging(staging)
+
+def upsert_gare_bulk(gare):
+    """Inserisce o aggiorna in un'unica transazione le gare passate come DataFrame o iterabile di tuple
+    (nell'ordine di GARE_COLUMNS). Restituisce il numero di righe scritte."""
+    try:
+        return _publish_bulk('gare', gare)
+    except Exception as e:
+        print(f"Errore nell'inserimento massivo gare: {e}")
+        return 0
+
+def upsert_voti_bulk(voti):
+    """Inserisce o aggiorna in un'unica transazione i voti passati come DataFrame o iterabile di tuple
+    (nell'ordine di VOTI_COLUMNS). Restituisce il numero di righe scritte."""
+    try:
+        return _publish_bulk('voti', voti)
+    except Exception as e:
+        print(f"Errore nell'inserimento massivo voti: {e}")
+        return 0
+
+def upsert_indisponibilita_bulk(indisponibilita):
+    """Inserisce o aggiorna in un'unica transazione i periodi di indisponibilità passati come DataFrame o iterabile
+    di tuple (nell'ordine di INDISPONIBILITA_COLUMNS). Una data_fine mancante indica un solo giorno.
+    Restituisce il numero di periodi scritti."""
+    try:
+        return _publish_bulk('indisponibilita', indisponibilita)
+    except Exception as e:
+        print(f"Errore nell'inserimento massivo indisponibilità: {e}")
+        return 0
+
+def upsert_organi_tecnici_bulk(organi_tecnici):
+    """Inserisce o aggiorna in un'unica transazione gli organi tecnici passati come DataFrame o iterabile
+    di tuple (nell'ordine di ORGANI_TECNICI_COLUMNS). Restituisce il numero di righe scritte."""
+    try:
+        return _publish_bulk('organi_tecnici', organi_tecnici)
+    except Exception as e:
+        print(f"Errore nell'inserimento massivo organi tecnici: {e}")
+        return 0
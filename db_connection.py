@@ -0,0 +1,194 @@
+"""
+Gestione centralizzata delle connessioni al database SQLite degli arbitri.
+
+Le letture usano connessioni in sola lettura da un pool: in modalità WAL leggono uno snapshot
+consistente senza attendere le scritture in corso. Le scritture passano tutte da un'unica
+connessione serializzata che acquisisce il lock del database all'inizio della transazione.
+"""
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Percorso del database, configurabile da variabile d'ambiente o con configure_database()
+DB_PATH = os.environ.get('ARBITRI_DB_PATH', 'arbitri.db')
+
+# Numero massimo di connessioni in lettura inattive mantenute nel pool
+POOL_SIZE = int(os.environ.get('ARBITRI_DB_POOL_SIZE', '4'))
+
+# Tentativi aggiuntivi per acquisire il lock in scrittura quando un altro processo lo detiene
+WRITE_RETRIES = int(os.environ.get('ARBITRI_DB_WRITE_RETRIES', '3'))
+
+# Attesa iniziale in secondi tra un tentativo e l'altro, raddoppiata a ogni tentativo
+WRITE_BACKOFF = 0.05
+
+# PRAGMA applicati una sola volta all'apertura di ogni connessione
+PRAGMAS = [
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', '-16000'),     # ~16 MB di page cache per connessione
+    ('mmap_size', '268435456'),   # 256 MB di memory-mapped I/O
+    ('busy_timeout', '5000'),     # attende fino a 5 secondi un lock in scrittura
+    ('temp_store', 'MEMORY'),
+]
+
+# PRAGMA delle connessioni in lettura: il journal WAL è già impostato dalla connessione in scrittura
+READ_PRAGMAS = [pragma for pragma in PRAGMAS if pragma[0] != 'journal_mode'] + [
+    ('query_only', 'ON'),
+]
+
+_pool = queue.LifoQueue()
+_pool_lock = threading.Lock()
+_generation = 0
+
+# Unica connessione in scrittura (generazione, connessione) e profondità dei blocchi annidati
+_writer = None
+_writer_lock = threading.RLock()
+_writer_depth = 0
+
+# Transazioni in scrittura confermate da questo processo
+_commits = 0
+
+
+def _open_connection(readonly=False):
+    """Apre una nuova connessione e applica i PRAGMA di configurazione"""
+    if readonly:
+        uri = Path(DB_PATH).absolute().as_uri() + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        pragmas = READ_PRAGMAS
+    else:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        pragmas = PRAGMAS
+    for name, value in pragmas:
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+def _is_busy(error):
+    """Indica se l'errore è dovuto al lock del database detenuto da un'altra connessione"""
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def begin_immediate(conn):
+    """Apre una transazione acquisendo subito il lock in scrittura.
+    Se il database resta occupato oltre busy_timeout ritenta fino a WRITE_RETRIES volte
+    con attesa esponenziale, poi solleva l'errore."""
+    for attempt in range(WRITE_RETRIES + 1):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            return
+        except sqlite3.OperationalError as e:
+            if attempt == WRITE_RETRIES or not _is_busy(e):
+                raise
+            time.sleep(WRITE_BACKOFF * 2 ** attempt * (1 + random.random()))
+
+
+def configure_database(db_path=None, pool_size=None):
+    """Cambia percorso del database e/o dimensione del pool chiudendo le connessioni esistenti"""
+    global DB_PATH, POOL_SIZE, _generation
+
+    with _pool_lock:
+        if db_path is not None:
+            DB_PATH = db_path
+        if pool_size is not None:
+            POOL_SIZE = pool_size
+        _generation += 1
+    close_all_connections()
+
+
+def close_all_connections():
+    """Chiude le connessioni in lettura inattive e la connessione in scrittura se non è in uso"""
+    global _writer
+
+    while True:
+        try:
+            _, conn = _pool.get_nowait()
+        except queue.Empty:
+            break
+        conn.close()
+
+    with _writer_lock:
+        if _writer is not None and not _writer_depth:
+            _writer[1].close()
+            _writer = None
+
+
+@contextmanager
+def get_connection():
+    """Fornisce l'unica connessione in scrittura, un thread alla volta.
+
+    All'apertura del blocco acquisisce il lock del database (BEGIN IMMEDIATE), alla chiusura
+    esegue il commit, oppure il rollback in caso di errore. Un blocco annidato nello stesso
+    thread partecipa alla transazione già aperta.
+    """
+    global _writer, _writer_depth, _commits
+
+    with _writer_lock:
+        if _writer_depth:
+            _writer_depth += 1
+            try:
+                yield _writer[1]
+            finally:
+                _writer_depth -= 1
+            return
+
+        if _writer is None or _writer[0] != _generation:
+            if _writer is not None:
+                _writer[1].close()
+            _writer = (_generation, _open_connection())
+        conn = _writer[1]
+
+        begin_immediate(conn)
+        _writer_depth = 1
+        try:
+            yield conn
+            conn.commit()
+            _commits += 1
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            _writer_depth = 0
+
+
+def database_signature():
+    """Firma dello stato del database ottenuta senza interrogare SQLite: transazioni confermate da
+    questo processo, dimensione e data di modifica del file del database e del WAL (che cambiano
+    anche con le scritture di altri processi). Se la firma cambia i dati potrebbero essere cambiati."""
+    firma = [_commits]
+    for path in (DB_PATH, DB_PATH + '-wal'):
+        try:
+            stat = os.stat(path)
+            firma.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            firma.append(None)
+    return tuple(firma)
+
+
+@contextmanager
+def get_read_connection():
+    """Fornisce una connessione in sola lettura dal pool.
+
+    Non attende le scritture in corso e non le blocca. Alla chiusura del blocco termina la
+    transazione di lettura e restituisce la connessione al pool invece di chiuderla.
+    """
+    try:
+        generation, conn = _pool.get_nowait()
+    except queue.Empty:
+        generation, conn = _generation, _open_connection(readonly=True)
+
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        with _pool_lock:
+            reusable = generation == _generation and _pool.qsize() < POOL_SIZE
+            if reusable:
+                _pool.put_nowait((generation, conn))
+        if not reusable:
+            conn.close()
@@ -4,6 +4,11 @@ Utilità per l'export dei dati in Excel
 import pandas as pd
 import io
 from database import get_arbitri, get_gare_by_week, get_voti_by_week, get_indisponibilita_by_week
+from db_connection import get_read_connection
+from queries import (
+    STATISTICHE_GARE_AR, EXPORT_GARE_PERIODO, EXPORT_VOTI_PERIODO
+)
+from weekly_grid import load_weekly_table
 from datetime import datetime, timedelta
 from utils import get_week_ranges
 
@@ -133,21 +138,10 @@ def get_arbitration_stats_by_category():
         return pd.DataFrame()
     
     # Ottieni tutte le gare dal database
-    import sqlite3
-    conn = sqlite3.connect('arbitri.db')
-    
     try:
-        # Query per ottenere solo le gare AR (Arbitro) con categoria e girone - esclude QU
-        query = '''
-            SELECT g.cod_mecc, g.categoria, g.girone, g.numero_gara,
-                   a.cognome, a.nome, a.sezione
-            FROM gare g
-            JOIN arbitri a ON g.cod_mecc = a.cod_mecc
-            WHERE g.categoria IS NOT NULL AND g.girone IS NOT NULL 
-            AND g.ruolo = 'AR' AND g.ruolo != 'QU'
-        '''
-        
-        gare_df = pd.read_sql_query(query, conn)
+        # Solo le gare AR (Arbitro) con categoria e girone - esclude QU
+        with get_read_connection() as conn:
+            gare_df = pd.read_sql_query(STATISTICHE_GARE_AR, conn)
         
         if gare_df.empty:
             return pd.DataFrame()
@@ -183,8 +177,6 @@ def get_arbitration_stats_by_category():
     except Exception as e:
         print(f"Errore nel calcolo statistiche: {e}")
         return pd.DataFrame()
-    finally:
-        conn.close()
 
 def create_complete_excel_export(data_inizio, data_fine, arbitro_selezionato=None):
     """
@@ -195,7 +187,6 @@ def create_complete_excel_export(data_inizio, data_fine, arbitro_selezionato=Non
     from database import get_arbitri
     from utils import get_week_dates
     from datetime import datetime
-    import sqlite3
     
     # Buffer per il file Excel
     buffer = BytesIO()
@@ -222,149 +213,68 @@ def create_complete_excel_export(data_inizio, data_fine, arbitro_selezionato=Non
                 ]
         
         # Connessione database per dati aggiuntivi
-        conn = sqlite3.connect('arbitri.db')
+        with get_read_connection() as conn:
         
-        # Foglio 1: Anagrafica arbitri con anzianità
-        anagrafica_export = arbitri_df.copy()
+            # Foglio 1: Anagrafica arbitri con anzianità
+            anagrafica_export = arbitri_df.copy()
         
-        # Calcola anzianità in anni se presente
-        anagrafica_export['anzianita_anni'] = anagrafica_export['anno_anzianita'].apply(
-            lambda x: 2025 - x if pd.notna(x) else None
-        )
+            # Calcola anzianità in anni se presente
+            anagrafica_export['anzianita_anni'] = anagrafica_export['anno_anzianita'].apply(
+                lambda x: 2025 - x if pd.notna(x) else None
+            )
         
-        # Seleziona e riordina colonne
-        cols_to_export = ['cod_mecc', 'cognome', 'nome', 'sezione', 'eta']
-        if 'anno_anzianita' in anagrafica_export.columns:
-            cols_to_export.extend(['anzianita_anni', 'anno_anzianita'])
+            # Seleziona e riordina colonne
+            cols_to_export = ['cod_mecc', 'cognome', 'nome', 'sezione', 'eta']
+            if 'anno_anzianita' in anagrafica_export.columns:
+                cols_to_export.extend(['anzianita_anni', 'anno_anzianita'])
         
-        anagrafica_export = anagrafica_export[cols_to_export]
-        anagrafica_export.columns = ['Cod_Mecc', 'Cognome', 'Nome', 'Sezione', 'Età'] + (['Anzianità_OT', 'Anno_Inizio_OT'] if 'anno_anzianita' in arbitri_df.columns else [])
+            anagrafica_export = anagrafica_export[cols_to_export]
+            anagrafica_export.columns = ['Cod_Mecc', 'Cognome', 'Nome', 'Sezione', 'Età'] + (['Anzianità_OT', 'Anno_Inizio_OT'] if 'anno_anzianita' in arbitri_df.columns else [])
         
-        anagrafica_export.to_excel(writer, sheet_name='Anagrafica', index=False)
+            anagrafica_export.to_excel(writer, sheet_name='Anagrafica', index=False)
         
-        # Foglio 2: Programmazione settimanale con anzianità
-        weeks = get_week_dates(data_inizio, data_fine)
-        export_data = []
+            # Foglio 2: Programmazione settimanale con anzianità
+            weeks = get_week_dates(data_inizio, data_fine)
+            export_data = []
         
-        for _, arbitro in arbitri_df.iterrows():
-            # Calcola anzianità display
-            anzianita_display = ""
-            if pd.notna(arbitro.get('anno_anzianita')):
-                anni_esperienza = 2025 - int(arbitro['anno_anzianita'])
-                anzianita_display = str(anni_esperienza) if anni_esperienza > 0 else "0"
-            
-            row_data = {
-                'Cod_Mecc': arbitro['cod_mecc'],
-                'Arbitro': f"{arbitro['cognome']} {arbitro['nome']}",
-                'Sezione': arbitro.get('sezione', ''),
-                'Anzianità': anzianita_display
-            }
+            for _, arbitro in arbitri_df.iterrows():
+                # Calcola anzianità display
+                anzianita_display = ""
+                if pd.notna(arbitro.get('anno_anzianita')):
+                    anni_esperienza = 2025 - int(arbitro['anno_anzianita'])
+                    anzianita_display = str(anni_esperienza) if anni_esperienza > 0 else "0"
             
-            # Per ogni settimana, aggiungi le informazioni
-            for i, (week_start, week_end) in enumerate(weeks, 1):
-                week_start_date = week_start.date() if hasattr(week_start, 'date') else week_start
-                week_end_date = week_end.date() if hasattr(week_end, 'date') else week_end
-                week_label = f"Settimana_{i}_{week_start_date.strftime('%d_%m')}"
-                
-                # Query per gare, voti e indisponibilità
-                week_content = []
-                
-                # Gare
-                gare_query = '''
-                    SELECT categoria, girone, data_gara
-                    FROM gare 
-                    WHERE cod_mecc = ? AND data_gara BETWEEN ? AND ?
-                '''
-                gare_df = pd.read_sql_query(gare_query, conn, params=[arbitro['cod_mecc'], week_start_date, week_end_date])
-                
-                if not gare_df.empty:
-                    for _, gara in gare_df.iterrows():
-                        if pd.notna(gara['categoria']) and pd.notna(gara['girone']):
-                            week_content.append(f"🏃‍♂️ {gara['categoria']} {gara['girone']}")
-                
-                # Voti
-                voti_query = '''
-                    SELECT v.voto_oa, v.voto_ot, ot.cognome_ot
-                    FROM voti v
-                    JOIN gare g ON v.numero_gara = g.numero_gara
-                    LEFT JOIN organi_tecnici ot ON v.numero_gara = ot.numero_gara
-                    WHERE g.cod_mecc = ? AND g.data_gara BETWEEN ? AND ?
-                '''
-                voti_df = pd.read_sql_query(voti_query, conn, params=[arbitro['cod_mecc'], week_start_date, week_end_date])
-                
-                if not voti_df.empty:
-                    for _, voto in voti_df.iterrows():
-                        voto_str = []
-                        if pd.notna(voto['voto_oa']):
-                            voto_str.append(f"OA:{voto['voto_oa']}")
-                        if pd.notna(voto['voto_ot']):
-                            ot_str = f"OT:{voto['voto_ot']}"
-                            if pd.notna(voto['cognome_ot']):
-                                ot_str += f" ({voto['cognome_ot']})"
-                            voto_str.append(ot_str)
-                        if voto_str:
-                            week_content.append(f"⭐ {' '.join(voto_str)}")
-                
-                # Indisponibilità
-                indisponibilita_query = '''
-                    SELECT i.motivo
-                    FROM indisponibilita i
-                    JOIN arbitri a ON (
-                        CAST(i.cod_mecc AS TEXT) = CAST(a.cod_mecc AS TEXT) OR
-                        CAST(SUBSTR(a.cod_mecc, -5) AS INTEGER) = CAST(i.cod_mecc AS INTEGER) OR
-                        CAST(SUBSTR(a.cod_mecc, -6) AS INTEGER) = CAST(i.cod_mecc AS INTEGER)
-                    )
-                    WHERE a.cod_mecc = ? AND i.data_indisponibilita BETWEEN ? AND ?
-                '''
-                indis_df = pd.read_sql_query(indisponibilita_query, conn, params=[arbitro['cod_mecc'], week_start_date, week_end_date])
-                
-                if not indis_df.empty:
-                    motivi = indis_df['motivo'].dropna().unique()
-                    if len(motivi) > 0:
-                        week_content.append(f"❌ {', '.join(motivi)}")
-                
-                row_data[week_label] = ' • '.join(week_content) if week_content else ''
+                row_data = {
+                    'Cod_Mecc': arbitro['cod_mecc'],
+                    'Arbitro': f"{arbitro['cognome']} {arbitro['nome']}",
+                    'Sezione': arbitro.get('sezione', ''),
+                    'Anzianità': anzianita_display
+                }
             
-            export_data.append(row_data)
+                export_data.append(row_data)
         
-        # Esporta programmazione settimanale
-        if export_data:
-            programmazione_df = pd.DataFrame(export_data)
-            programmazione_df.to_excel(writer, sheet_name='Programmazione_Settimanale', index=False)
+            # Esporta programmazione settimanale
+            if export_data:
+                # Celle delle settimane come nella Dashboard, lette dalla tabella referee_week
+                settimane_df = load_weekly_table(arbitri_df['cod_mecc'].tolist(), weeks, data_inizio, data_fine)
+                settimane_df.columns = [
+                    f"Settimana_{i}_{week_start.strftime('%d_%m')}" for i, (week_start, _) in enumerate(weeks, 1)
+                ]
+                programmazione_df = pd.concat([pd.DataFrame(export_data), settimane_df.reset_index(drop=True)], axis=1)
+                programmazione_df.to_excel(writer, sheet_name='Programmazione_Settimanale', index=False)
         
-        # Foglio 3: Tutte le gare del periodo con anzianità
-        gare_query = '''
-            SELECT g.numero_gara, g.categoria, g.girone, g.data_gara, g.ruolo,
-                   a.cognome, a.nome, a.sezione, a.anno_anzianita,
-                   CASE WHEN a.anno_anzianita IS NOT NULL THEN (2025 - a.anno_anzianita) ELSE 0 END as anzianita_display
-            FROM gare g
-            JOIN arbitri a ON g.cod_mecc = a.cod_mecc
-            WHERE g.data_gara BETWEEN ? AND ?
-            ORDER BY g.data_gara, g.numero_gara
-        '''
-        gare_complete = pd.read_sql_query(gare_query, conn, params=[data_inizio, data_fine])
-        if not gare_complete.empty:
-            gare_complete.columns = ['Numero_Gara', 'Categoria', 'Girone', 'Data', 'Ruolo', 'Cognome', 'Nome', 'Sezione', 'Anno_Inizio_OT', 'Anzianità']
-            gare_complete.to_excel(writer, sheet_name='Gare_Complete', index=False)
+            # Foglio 3: Tutte le gare del periodo con anzianità
+            gare_complete = pd.read_sql_query(EXPORT_GARE_PERIODO, conn, params=[data_inizio, data_fine])
+            if not gare_complete.empty:
+                gare_complete.columns = ['Numero_Gara', 'Categoria', 'Girone', 'Data', 'Ruolo', 'Cognome', 'Nome', 'Sezione', 'Anno_Inizio_OT', 'Anzianità']
+                gare_complete.to_excel(writer, sheet_name='Gare_Complete', index=False)
         
-        # Foglio 4: Tutti i voti del periodo con anzianità
-        voti_query = '''
-            SELECT v.numero_gara, v.voto_oa, v.voto_ot, g.data_gara, g.categoria, g.girone,
-                   a.cognome, a.nome, a.sezione, ot.cognome_ot, a.anno_anzianita,
-                   CASE WHEN a.anno_anzianita IS NOT NULL THEN (2025 - a.anno_anzianita) ELSE 0 END as anzianita_display
-            FROM voti v
-            JOIN gare g ON v.numero_gara = g.numero_gara
-            JOIN arbitri a ON g.cod_mecc = a.cod_mecc
-            LEFT JOIN organi_tecnici ot ON v.numero_gara = ot.numero_gara
-            WHERE g.data_gara BETWEEN ? AND ?
-            ORDER BY g.data_gara, v.numero_gara
-        '''
-        voti_complete = pd.read_sql_query(voti_query, conn, params=[data_inizio, data_fine])
-        if not voti_complete.empty:
-            voti_complete.columns = ['Numero_Gara', 'Voto_OA', 'Voto_OT', 'Data', 'Categoria', 'Girone', 'Cognome', 'Nome', 'Sezione', 'OT_Cognome', 'Anno_Inizio_OT', 'Anzianità']
-            voti_complete.to_excel(writer, sheet_name='Voti_Complete', index=False)
+            # Foglio 4: Tutti i voti del periodo con anzianità
+            voti_complete = pd.read_sql_query(EXPORT_VOTI_PERIODO, conn, params=[data_inizio, data_fine])
+            if not voti_complete.empty:
+                voti_complete.columns = ['Numero_Gara', 'Voto_OA', 'Voto_OT', 'Data', 'Categoria', 'Girone', 'Cognome', 'Nome', 'Sezione', 'OT_Cognome', 'Anno_Inizio_OT', 'Anzianità']
+                voti_complete.to_excel(writer, sheet_name='Voti_Complete', index=False)
         
-        conn.close()
         
         # Foglio 5: Statistiche del periodo
         arbitri_con_anzianita = len(arbitri_df[arbitri_df['anno_anzianita'].notna()]) if 'anno_anzianita' in arbitri_df.columns else 0
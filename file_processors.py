@@ -1,95 +1,276 @@
+import numpy as np
 import pandas as pd
 import re
 
-# Import pdfplumber with fallback
-try:
-    import pdfplumber
-    PDFPLUMBER_AVAILABLE = True
-except ImportError:
-    PDFPLUMBER_AVAILABLE = False
+# Estrazione PDF condivisa, disabilitata se pdfplumber non è installato
+from pdf_extraction import PDFPLUMBER_AVAILABLE, extract_pdf_pages, extract_pdf_table, iter_pdf_lines
+if not PDFPLUMBER_AVAILABLE:
     print("Warning: pdfplumber not available. PDF processing will be disabled.")
-from database import upsert_arbitro, upsert_gara, upsert_voto, upsert_indisponibilita, upsert_organo_tecnico
-from datetime import datetime, timedelta
-import io
-from typing import Dict, Any, Union
+from database import upsert_arbitri_bulk, rebuild_arbitri_alias, upsert_voti_bulk, begin_staging, stage_rows, publish_staging, discard_staging, get_ingest_run, record_ingest_run
+import hashlib
+import itertools
+import openpyxl
+from typing import Dict, Any, Iterator, Union
 
-def process_arbitri_file(file) -> Dict[str, Any]:
-    """Processa il file Excel degli arbitri"""
-    try:
-        # Leggi il file Excel con engine esplicito
-        df = pd.read_excel(file, engine='openpyxl')
-        
-        # Normalizza i nomi delle colonne (rimuovi spazi e converti in minuscolo)
-        df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_').str.replace('.', '_')
-        
-        # Mappatura possibili nomi colonne
-        column_mapping = {
+# Righe lette e scritte per blocco nei caricamenti Excel: la memoria usata non dipende dalla dimensione del file
+EXCEL_CHUNK_SIZE = 5000
+
+# Valori di cella che pd.read_excel interpreta come mancanti (na_values predefiniti di pandas)
+EXCEL_NA_VALUES = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+}
+
+def _excel_header(values) -> list:
+    """Nomi di colonna come in pd.read_excel: 'Unnamed: N' per le celle vuote, suffisso .1, .2 per i duplicati"""
+    columns = []
+    for position, value in enumerate(values):
+        name = f"Unnamed: {position}" if value is None else str(value)
+        candidate, counter = name, 0
+        while candidate in columns:
+            counter += 1
+            candidate = f"{name}.{counter}"
+        columns.append(candidate)
+    return columns
+
+def _excel_value(value):
+    """Valore di cella come in pd.read_excel: i float interi diventano int, le celle vuote NaN"""
+    if value is None or (isinstance(value, str) and value in EXCEL_NA_VALUES):
+        return float('nan')
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+# Formati dei file Excel, riconosciuti dalla sola riga di intestazione. Per ogni formato:
+# - columns: nomi accettati per ogni colonna, dopo la normalizzazione di _normalize_column
+#   (con 'contains' basta che il nome della colonna contenga uno dei nomi accettati)
+# - positional: colonne degli export con intestazioni generiche "ColumnN"
+# - required: colonne obbligatorie
+# - dtypes: tipo di ogni colonna ('text', 'date' o 'int'), applicato in lettura
+EXCEL_FORMATS = {
+    'cra01': {
+        'label': 'gare (CRA01)',
+        'columns': {
+            'numero_gara': ['numero_gara', 'num_gara', 'gara', 'n_gara', 'numero', 'n°_gara', 'num gara', 'n gara'],
+            'cod_mecc': ['cod_mecc', 'cod_mecc_', 'codice_meccanografico', 'cod__mecc', 'codmecc', 'arbitro', 'cod meccanografico', 'cod', 'codice'],
+            'data_gara': ['data_gara', 'data', 'date', 'giorno', 'data gara'],
+            'categoria': ['categoria', 'campionato', 'championship', 'serie', 'cat'],
+            'girone': ['girone', 'group', 'gruppo'],
+            'ruolo': ['ruolo', 'role', 'function', 'funzione'],
+            'cognome': ['cognome', 'surname', 'last_name'],
+            'squadra_casa': ['squadra_casa', 'casa', 'home', 'team_casa', 'squadra casa'],
+            'squadra_trasferta': ['squadra_trasferta', 'ospite', 'away', 'team_ospite', 'trasferta', 'squadra trasferta', 'squadra ospite']
+        },
+        'positional': {
+            'Column2': 'numero_gara',    # Numero_Gara - Colonna B
+            'Column18': 'cod_mecc',      # Cod_Mecc - Colonna R
+            'Column19': 'cognome',       # Cognome - Colonna S
+            'Column7': 'data_gara',      # Data_Gara - Colonna G
+            'Column3': 'categoria',      # Categoria - Colonna C
+            'Column4': 'girone',         # Girone - Colonna D
+            'Column17': 'ruolo'          # Ruolo - Colonna Q
+        },
+        'required': ['numero_gara', 'cod_mecc'],
+        'dtypes': {'data_gara': 'date'},
+    },
+    'indisponibilita': {
+        'label': 'indisponibilità',
+        'columns': {
+            'cod_mecc': ['cod_mecc', 'cod_mecc_', 'codice_meccanografico', 'cod__mecc', 'codmecc', 'arbitro', 'cod meccanografico', 'cod', 'codice'],
+            'data_inizio': ['inizio', 'data_inizio', 'start_date', 'data_indisponibilita', 'data', 'date'],
+            'data_fine': ['fine', 'data_fine', 'end_date', 'data_fine_indisponibilita'],
+            'motivo': ['motivo', 'reason', 'causa', 'note', 'motivazione', 'osservazioni'],
+            'qualifica': ['qualifica', 'qualification', 'qual', 'tipo', 'ruolo']
+        },
+        'positional': {
+            'Column1': 'cod_mecc',        # Cod_Mecc - Colonna A
+            'Column2': 'data_inizio',     # Data - Colonna B
+            'Column3': 'qualifica',       # Qualifica - Colonna C
+            'Column4': 'motivo'           # Motivo - Colonna D
+        },
+        'required': ['cod_mecc', 'data_inizio'],
+        'dtypes': {'data_inizio': 'date', 'data_fine': 'date'},
+    },
+    'anagrafica': {
+        'label': 'anagrafica arbitri',
+        'columns': {
             'cod_mecc': ['cod_mecc', 'cod_mecc_', 'codice_meccanografico', 'cod__mecc', 'codmecc', 'cod meccanografico', 'cod', 'codice'],
             'cognome': ['cognome', 'surname', 'last_name'],
             'nome': ['nome', 'name', 'first_name'],
             'sezione': ['sezione', 'section', 'sez'],
             'eta': ['eta', 'età', 'age', 'anni', 'years']
-        }
-        
-        # Trova le colonne effettive
-        actual_columns = {}
-        for standard_name, possible_names in column_mapping.items():
+        },
+        'required': ['cod_mecc', 'cognome', 'nome'],
+        'dtypes': {'eta': 'int'},
+    },
+    'anzianita': {
+        'label': 'anzianità',
+        'columns': {
+            'cognome': ['cognome', 'surname'],
+            'nome': ['nome', 'name'],
+            'anzianita': ['anzianita', 'anzianità', 'anno', 'year', 'esperienza']
+        },
+        'contains': True,
+        'required': ['cognome', 'anzianita'],
+        'dtypes': {'anzianita': 'int'},
+    },
+}
+
+def _normalize_column(name: str) -> str:
+    """Nome di colonna senza spazi laterali, minuscolo, con '_' al posto di spazi e punti"""
+    return name.strip().lower().replace(' ', '_').replace('.', '_')
+
+def match_excel_format(header, formato: str) -> Dict[str, int]:
+    """Posizione nell'intestazione di ogni colonna del formato presente nel file"""
+    spec = EXCEL_FORMATS[formato]
+    positions = {}
+    for position, name in enumerate(header):
+        standard_name = spec.get('positional', {}).get(name)
+        if standard_name and standard_name not in positions:
+            positions[standard_name] = position
+    
+    normalized = [_normalize_column(name) for name in header]
+    if spec.get('contains'):
+        # Ogni colonna viene assegnata al primo nome standard di cui contiene uno dei nomi accettati
+        for position, name in enumerate(normalized):
+            for standard_name, possible_names in spec['columns'].items():
+                if standard_name not in positions and any(possible_name in name for possible_name in possible_names):
+                    positions[standard_name] = position
+                    break
+    else:
+        for standard_name, possible_names in spec['columns'].items():
+            if standard_name in positions:
+                continue
             for possible_name in possible_names:
-                if possible_name in df.columns:
-                    actual_columns[standard_name] = possible_name
+                if possible_name in normalized:
+                    positions[standard_name] = normalized.index(possible_name)
                     break
+    return positions
+
+def detect_excel_format(header) -> Union[str, None]:
+    """Formato di EXCEL_FORMATS riconosciuto dalla riga di intestazione: tra i formati di cui sono
+    presenti tutte le colonne obbligatorie, quello con più colonne riconosciute. None se nessuno."""
+    best, best_count = None, 0
+    for formato, spec in EXCEL_FORMATS.items():
+        positions = match_excel_format(header, formato)
+        if all(col in positions for col in spec['required']) and len(positions) > best_count:
+            best, best_count = formato, len(positions)
+    return best
+
+def _apply_dtypes(df: pd.DataFrame, dtypes: Dict[str, str]) -> pd.DataFrame:
+    """Converte le colonne lette nei tipi del formato: testo pulito (None se vuoto), date, interi"""
+    for col in df.columns:
+        dtype = dtypes.get(col, 'text')
+        if dtype == 'date':
+            df[col] = _parse_date_column(df[col])
+        elif dtype == 'int':
+            df[col] = np.trunc(pd.to_numeric(df[col], errors='coerce')).astype('Int64')
+        else:
+            df[col] = _clean_text_column(df[col])
+    return df
+
+def _open_excel_sheet(file):
+    """Apre il primo foglio in sola lettura: restituisce workbook, intestazione, righe e righe totali"""
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        total = sheet.max_row - 1 if sheet.max_row else None
+        rows = sheet.iter_rows(values_only=True)
+        header = _excel_header(next(rows, ()))
+    except Exception:
+        workbook.close()
+        raise
+    return workbook, header, rows, total
+
+def _iter_excel_chunks(workbook, rows, columns, positions, chunk_size, progress, total) -> Iterator[pd.DataFrame]:
+    """Blocchi di chunk_size righe con i soli valori nelle posizioni indicate; chiude il workbook alla fine"""
+    try:
+        start = 0
+        while True:
+            chunk = [
+                tuple(_excel_value(row[position]) if position < len(row) else float('nan') for position in positions)
+                for row in itertools.islice(rows, chunk_size)
+            ]
+            if progress is not None:
+                progress(start + len(chunk), total)
+            if chunk or start == 0:
+                yield pd.DataFrame(chunk, columns=columns, index=range(start, start + len(chunk)), dtype=object)
+            if len(chunk) < chunk_size:
+                break
+            start += len(chunk)
+    finally:
+        workbook.close()
+
+def read_excel_chunks(file, chunk_size: int = EXCEL_CHUNK_SIZE, progress=None) -> Iterator[pd.DataFrame]:
+    """Legge il primo foglio di un file Excel a blocchi di chunk_size righe, con openpyxl in sola lettura.
+    Ogni blocco è un DataFrame di tipo object con le intestazioni della prima riga e l'indice
+    progressivo sull'intero foglio. Un foglio senza dati produce un unico blocco vuoto.
+    Se indicata, progress(righe_lette, righe_totali) viene chiamata prima di ogni blocco
+    (righe_totali è None se il file non dichiara le dimensioni del foglio)."""
+    workbook, header, rows, total = _open_excel_sheet(file)
+    return _iter_excel_chunks(workbook, rows, header, range(len(header)), chunk_size, progress, total)
+
+def read_excel_format(file, formato: str, chunk_size: int = EXCEL_CHUNK_SIZE, progress=None):
+    """Legge a blocchi un file Excel del formato indicato (chiave di EXCEL_FORMATS).
+    Il formato viene verificato sulla sola intestazione; dei blocchi si costruiscono soltanto le colonne
+    del formato, con i nomi standard e i tipi dichiarati (le colonne facoltative assenti restano vuote).
+    Restituisce (blocchi, None) oppure (None, messaggio) se il file non è del formato indicato."""
+    spec = EXCEL_FORMATS[formato]
+    workbook, header, rows, total = _open_excel_sheet(file)
+    positions = match_excel_format(header, formato)
+    
+    detected = detect_excel_format(header)
+    missing_columns = [col for col in spec['required'] if col not in positions]
+    if missing_columns:
+        workbook.close()
+        message = f"Colonne mancanti nel file: {', '.join(missing_columns)}. Colonne trovate: {', '.join(_normalize_column(name) for name in header)}"
+        if detected:
+            message += f". Il file sembra un file di {EXCEL_FORMATS[detected]['label']}"
+        return None, message
+    if detected != formato and any(name in spec.get('positional', {}) for name in header):
+        # Le intestazioni generiche "ColumnN" si abbinano per posizione a più formati: si accetta il file
+        # solo se è il formato che ne riconosce più colonne (es. un CRA01 caricato come indisponibilità)
+        workbook.close()
+        return None, f"Il file sembra un file di {EXCEL_FORMATS[detected]['label']}, non di {spec['label']}"
+    
+    columns = list(positions)
+    chunks = _iter_excel_chunks(workbook, rows, columns, list(positions.values()), chunk_size, progress, total)
+    
+    def typed_chunks():
+        try:
+            for df in chunks:
+                df = _apply_dtypes(df, spec['dtypes'])
+                for col in spec['columns']:
+                    if col not in df.columns:
+                        df[col] = pd.NaT if spec['dtypes'].get(col) == 'date' else None
+                yield df
+        finally:
+            chunks.close()
+    
+    return typed_chunks(), None
+
+def process_arbitri_file(file) -> Dict[str, Any]:
+    """Processa il file Excel degli arbitri, leggendolo e scrivendolo a blocchi"""
+    try:
+        chunks, error = read_excel_format(file, 'anagrafica')
+        if chunks is None:
+            return {'success': False, 'message': error}
         
-        # Verifica che le colonne essenziali siano presenti
-        required_columns = ['cod_mecc', 'cognome', 'nome']
-        missing_columns = [col for col in required_columns if col not in actual_columns]
-        
-        if missing_columns:
-            return {
-                'success': False,
-                'message': f"Colonne mancanti nel file: {', '.join(missing_columns)}. Colonne trovate: {', '.join(df.columns.tolist())}"
-            }
-        
-        # Processa ogni riga
+        # Processa ogni blocco di righe scrivendolo in un'unica transazione
         processed_count = 0
         errors = []
         
-        for idx, row in df.iterrows():
-            try:
-                cod_mecc_raw = str(row[actual_columns['cod_mecc']]).strip()
-                cognome = str(row[actual_columns['cognome']]).strip()
-                nome = str(row[actual_columns['nome']]).strip()
-                
-                # Verifica che i campi essenziali non siano vuoti
-                if not cod_mecc_raw or cod_mecc_raw == 'nan' or not cognome or cognome == 'nan' or not nome or nome == 'nan':
-                    continue
-                
-                # Usa il codice meccanografico completo per l'anagrafica
-                cod_mecc = cod_mecc_raw
-                
-                # Campi opzionali
-                sezione = None
-                if 'sezione' in actual_columns:
-                    sezione_val = str(row[actual_columns['sezione']]).strip()
-                    if sezione_val and sezione_val != 'nan':
-                        sezione = sezione_val
-                
-                eta = None
-                if 'eta' in actual_columns:
-                    try:
-                        eta_val = row[actual_columns['eta']]
-                        if pd.notna(eta_val):
-                            eta = int(float(eta_val))
-                    except (ValueError, TypeError):
-                        pass
-                
-                # Inserisci nel database
-                if upsert_arbitro(cod_mecc, cognome, nome, sezione, eta):
-                    processed_count += 1
-                else:
-                    errors.append(f"Errore nell'inserimento arbitro {cognome} {nome}")
-                    
-            except Exception as e:
-                errors.append(f"Errore alla riga {str(idx + 1)}: {str(e)}")
+        for arbitri in chunks:
+            # Verifica che i campi essenziali non siano vuoti. Si usa il codice meccanografico completo
+            arbitri = arbitri[arbitri['cod_mecc'].notna() & arbitri['cognome'].notna() & arbitri['nome'].notna()]
+            
+            written = upsert_arbitri_bulk(arbitri)
+            processed_count += written
+            if written < len(arbitri):
+                errors.append(f"Errore nell'inserimento di {len(arbitri) - written} arbitri")
+        
+        # Aggiorna la mappa dei codici abbreviati usata dall'ingestione di gare e indisponibilità
+        rebuild_arbitri_alias()
         
         if errors:
             error_msg = f"Elaborati {processed_count} arbitri con {len(errors)} errori"
@@ -102,423 +283,264 @@ def process_arbitri_file(file) -> Dict[str, Any]:
     except Exception as e:
         return {'success': False, 'message': f"Errore nella lettura del file: {str(e)}"}
 
-def process_gare_file(file) -> Dict[str, Any]:
-    """Processa il file Excel delle gare (CRA01)"""
+# Colonne della tabella voti lette dal PDF, riconosciute dalle etichette della riga di intestazione
+VOTI_PDF_COLUMNS = {
+    'numero_gara': re.compile(r'\bGARA\b', re.IGNORECASE),
+    'voto_oa': re.compile(r'\bOA\b', re.IGNORECASE),
+    'voto_ot': re.compile(r'\bOT\b', re.IGNORECASE),
+}
+
+# Numero gara di 3-4 cifre e voto con decimali separati da virgola o punto
+NUMERO_GARA_PATTERN = re.compile(r'\d{3,4}')
+VOTO_PATTERN = re.compile(r'\d+(?:[.,]\d+)?')
+
+# Righe del testo dei PDF senza intestazione riconoscibile: numero gara, dati, voto OA e voto OT opzionale
+VOTI_LINE_PATTERN = re.compile(r'(\d{3,4})\s+.*?([0-9,]+)(?:\s+([0-9,]+))?\s*$')
+VOTI_NUMBERS_PATTERN = re.compile(r'\b\d+(?:[.,]\d+)?\b')
+
+# Formati accettati per le date scritte come testo, provati in quest'ordine
+DATE_FORMATS = ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y']
+
+def _clean_text_column(series: pd.Series) -> pd.Series:
+    """Converte una colonna in testo senza spazi laterali; celle vuote o NaN diventano None"""
+    text = series.astype(str).str.strip()
+    return text.where((text != '') & (text != 'nan'), None)
+
+def _parse_date_column(series: pd.Series) -> pd.Series:
+    """Converte una colonna di date: il testo con i formati di DATE_FORMATS, gli altri valori
+    con pd.to_datetime. I valori non interpretabili diventano NaT."""
+    parsed = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    is_text = series.map(type).eq(str)
+    
+    if is_text.any():
+        text = series[is_text].str.strip()
+        for fmt in DATE_FORMATS:
+            parsed = parsed.fillna(pd.to_datetime(text, format=fmt, errors='coerce'))
+    
+    others = series[~is_text & series.notna()]
+    if not others.empty:
+        parsed.loc[others.index] = pd.to_datetime(others, errors='coerce')
+    return parsed
+
+def process_gare_file(file, progress=None) -> Dict[str, Any]:
+    """Processa il file Excel delle gare (CRA01), leggendolo e scrivendolo a blocchi"""
     try:
-        # Leggi il file Excel con engine esplicito
-        df = pd.read_excel(file, engine='openpyxl')
-        
-        # Gestisce colonne generiche del CRA01 con mappatura specifica
-        if any(col.startswith('Column') for col in df.columns):
-            # Mappatura specifica per file CRA01
-            cra01_mapping = {
-                'Column2': 'numero_gara',    # Numero_Gara - Colonna B
-                'Column18': 'cod_mecc',      # Cod_Mecc - Colonna R
-                'Column19': 'cognome',       # Cognome - Colonna S
-                'Column7': 'data_gara',      # Data_Gara - Colonna G
-                'Column3': 'categoria',      # Categoria - Colonna C
-                'Column4': 'girone',         # Girone - Colonna D
-                'Column17': 'ruolo'          # Ruolo - Colonna Q
-            }
-            
-            # Rinomina le colonne usando la mappatura CRA01
-            df = df.rename(columns=cra01_mapping)
-        
-        # Normalizza i nomi delle colonne
-        df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_').str.replace('.', '_')
-        
-        # Mappatura possibili nomi colonne
-        column_mapping = {
-            'numero_gara': ['numero_gara', 'num_gara', 'gara', 'n_gara', 'numero', 'n°_gara', 'num gara', 'n gara'],
-            'cod_mecc': ['cod_mecc', 'cod_mecc_', 'codice_meccanografico', 'cod__mecc', 'codmecc', 'arbitro', 'cod meccanografico', 'cod', 'codice'],
-            'data_gara': ['data_gara', 'data', 'date', 'giorno', 'data gara'],
-            'categoria': ['categoria', 'campionato', 'championship', 'serie', 'cat'],
-            'girone': ['girone', 'group', 'gruppo'],
-            'ruolo': ['ruolo', 'role', 'function', 'funzione'],
-            'cognome': ['cognome', 'surname', 'last_name'],
-            'squadra_casa': ['squadra_casa', 'casa', 'home', 'team_casa', 'squadra casa'],
-            'squadra_trasferta': ['squadra_trasferta', 'ospite', 'away', 'team_ospite', 'trasferta', 'squadra trasferta', 'squadra ospite']
-        }
-        
-        # Trova le colonne effettive
-        actual_columns = {}
-        for standard_name, possible_names in column_mapping.items():
-            for possible_name in possible_names:
-                if possible_name in df.columns:
-                    actual_columns[standard_name] = possible_name
-                    break
-        
-        # Verifica colonne essenziali
-        required_columns = ['numero_gara', 'cod_mecc']
-        missing_columns = [col for col in required_columns if col not in actual_columns]
+        # Intestazione verificata sul formato CRA01: si leggono solo le colonne usate
+        chunks, error = read_excel_format(file, 'cra01', progress=progress)
+        if chunks is None:
+            return {'success': False, 'message': error}
         
-        if missing_columns:
-            return {
-                'success': False,
-                'message': f"Colonne mancanti nel file: {', '.join(missing_columns)}. Colonne trovate: {', '.join(df.columns.tolist())}"
-            }
-        
-        # Processa ogni riga
-        processed_count = 0
+        # Elaborazione per colonne: ogni campo è già pulito e tipizzato sull'intero blocco
+        staged_count = 0
         errors = []
         
-        for idx, row in df.iterrows():
-            try:
-                numero_gara = str(row[actual_columns['numero_gara']]).strip()
-                cod_mecc_raw = str(row[actual_columns['cod_mecc']]).strip()
-                
-                # Verifica campi essenziali
-                if not numero_gara or numero_gara == 'nan' or not cod_mecc_raw or cod_mecc_raw == 'nan':
-                    continue
-                
-                # Per le gare CRA01, usa il codice meccanografico completo (no troncamento)
-                # Il matching con l'anagrafica verrà fatto nel database
-                cod_mecc = cod_mecc_raw
-                
-                # Campi opzionali
-                data_gara = None
-                if 'data_gara' in actual_columns:
-                    try:
-                        data_val = row[actual_columns['data_gara']]
-                        if pd.notna(data_val):
-                            if isinstance(data_val, str):
-                                # Prova diversi formati data
-                                for fmt in ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y']:
-                                    try:
-                                        data_gara = datetime.strptime(data_val.strip(), fmt).date()
-                                        break
-                                    except ValueError:
-                                        continue
-                            else:
-                                data_gara = pd.to_datetime(data_val).date()
-                    except:
-                        pass
-                
-                categoria = None
-                if 'categoria' in actual_columns:
-                    cat_val = str(row[actual_columns['categoria']]).strip()
-                    if cat_val and cat_val != 'nan':
-                        categoria = cat_val
-                
-                girone = None
-                if 'girone' in actual_columns:
-                    girone_val = str(row[actual_columns['girone']]).strip()
-                    if girone_val and girone_val != 'nan':
-                        girone = girone_val
+        staging = begin_staging()
+        try:
+            for gare in chunks:
+                # Verifica campi essenziali. Per le gare CRA01 si usa il codice meccanografico completo
+                # (no troncamento): il matching con l'anagrafica viene fatto nel database
+                gare = gare[gare['numero_gara'].notna() & gare['cod_mecc'].notna()]
+                gare = gare.rename(columns={'cognome': 'cognome_arbitro'})
                 
-                ruolo = None
-                if 'ruolo' in actual_columns:
-                    ruolo_val = str(row[actual_columns['ruolo']]).strip()
-                    if ruolo_val and ruolo_val != 'nan':
-                        ruolo = ruolo_val
+                # Ruoli numerici diversi da 0 con un cognome indicano un OT - salvati nella tabella organi_tecnici
+                ruolo = gare['ruolo'].fillna('')
+                ot_mask = ruolo.str.fullmatch(r'[0-9]+') & gare['cognome_arbitro'].notna()
+                ot_mask &= pd.to_numeric(ruolo.where(ot_mask), errors='coerce').fillna(0) != 0
+                organi_tecnici = gare.loc[ot_mask, ['numero_gara', 'ruolo', 'cognome_arbitro']]
+                organi_tecnici.columns = ['numero_gara', 'cod_ot', 'cognome_ot']
                 
-                cognome_arbitro = None
-                if 'cognome' in actual_columns:
-                    cognome_val = str(row[actual_columns['cognome']]).strip()
-                    if cognome_val and cognome_val != 'nan':
-                        cognome_arbitro = cognome_val
-                
-                squadra_casa = None
-                if 'squadra_casa' in actual_columns:
-                    casa_val = str(row[actual_columns['squadra_casa']]).strip()
-                    if casa_val and casa_val != 'nan':
-                        squadra_casa = casa_val
-                
-                squadra_trasferta = None
-                if 'squadra_trasferta' in actual_columns:
-                    trasferta_val = str(row[actual_columns['squadra_trasferta']]).strip()
-                    if trasferta_val and trasferta_val != 'nan':
-                        squadra_trasferta = trasferta_val
-                
-                # Inserisci nel database
-                if upsert_gara(numero_gara, cod_mecc, data_gara, categoria, squadra_casa, squadra_trasferta, girone, ruolo, cognome_arbitro):
-                    processed_count += 1
-                    
-                    # Se il ruolo non è 0 e abbiamo un cognome, potrebbe essere un OT - salva nella tabella organi_tecnici
-                    if ruolo and ruolo != '0' and cognome_arbitro and cognome_arbitro != 'nan':
-                        try:
-                            # Verifica se il codice del ruolo è numerico (indica che è un OT)
-                            if ruolo.isdigit() and int(ruolo) != 0:
-                                upsert_organo_tecnico(numero_gara, ruolo, cognome_arbitro)
-                        except (ValueError, TypeError):
-                            pass  # Ignora errori nel parsing del ruolo
-                else:
-                    errors.append(f"Errore nell'inserimento gara {numero_gara}")
-                    
-            except Exception as e:
-                errors.append(f"Errore alla riga {str(idx + 1)}: {str(e)}")
+                # Il blocco viene accumulato nelle tabelle di staging, senza toccare le tabelle live
+                staged_count += stage_rows(staging, 'gare', gare)
+                stage_rows(staging, 'organi_tecnici', organi_tecnici)
+            
+            # Validazione e pubblicazione dell'intero file: le letture vedono tutte le gare o nessuna
+            processed_count = publish_staging(staging)['gare']
+        finally:
+            discard_staging(staging)
+        
+        if processed_count < staged_count:
+            errors.append(f"{staged_count - processed_count} gare scartate dalla validazione")
         
         if errors:
             error_msg = f"Elaborate {processed_count} gare con {len(errors)} errori"
             if len(errors) <= 5:
                 error_msg += f": {'; '.join(errors)}"
-            return {'success': True, 'message': error_msg}
+            return {'success': True, 'message': error_msg, 'processed': processed_count}
         else:
-            return {'success': True, 'message': f"Elaborate con successo {processed_count} gare"}
+            return {'success': True, 'message': f"Elaborate con successo {processed_count} gare", 'processed': processed_count}
             
     except Exception as e:
         return {'success': False, 'message': f"Errore nella lettura del file: {str(e)}"}
 
-def process_voti_pdf(file) -> Dict[str, Any]:
+def _parse_voto(text) -> Any:
+    """Voto tra 0 e 10 letto da una cella o da un token di testo, None se assente o non valido"""
+    if not text or not VOTO_PATTERN.fullmatch(text):
+        return None
+    voto = float(text.replace(',', '.'))
+    return voto if 0 <= voto <= 10 else None
+
+def _parse_voti_table(table) -> list:
+    """Righe (numero_gara, voto_oa, voto_ot) dalle colonne ritagliate della tabella voti"""
+    voti_rows = []
+    for numero_gara, voto_oa, voto_ot in itertools.chain.from_iterable(table):
+        if not NUMERO_GARA_PATTERN.fullmatch(numero_gara):
+            continue  # Intestazioni ripetute e righe senza numero gara
+        voto_oa = _parse_voto(voto_oa)
+        # Inserisci solo se almeno OA è valido
+        if voto_oa is not None:
+            voti_rows.append((numero_gara, voto_oa, _parse_voto(voto_ot)))
+    return voti_rows
+
+def _parse_voti_text(pages) -> list:
+    """Righe (numero_gara, voto_oa, voto_ot) dal testo del PDF quando le colonne non sono riconoscibili.
+    Le righe del formato atteso e quelle del formato semplificato (numero gara seguito da due voti)
+    vengono raccolte nello stesso passaggio; le seconde si usano solo se mancano le prime."""
+    voti_rows = []
+    fallback_rows = []
+    found_matches = False
+    
+    for line in iter_pdf_lines(pages):
+        line = line.strip()
+        if not line:
+            continue
+        
+        # Righe che iniziano con numero di 3-4 cifre seguito da dati e voti alla fine
+        match = VOTI_LINE_PATTERN.match(line)
+        if match:
+            found_matches = True
+            voto_oa = _parse_voto(match.group(2))
+            if voto_oa is not None:
+                voti_rows.append((match.group(1), voto_oa, _parse_voto(match.group(3))))
+        elif not found_matches:
+            # Formato semplificato: almeno numero gara + 2 voti
+            numbers = VOTI_NUMBERS_PATTERN.findall(line)
+            if len(numbers) >= 3:
+                voto_oa = _parse_voto(numbers[1])
+                voto_ot = _parse_voto(numbers[2])
+                if voto_oa is not None and voto_ot is not None:
+                    fallback_rows.append((numbers[0], voto_oa, voto_ot))
+    
+    return voti_rows if found_matches else fallback_rows
+
+def process_voti_pdf(file, progress=None) -> Dict[str, Any]:
     """Processa il file PDF dei voti"""
     if not PDFPLUMBER_AVAILABLE:
         return {'success': False, 'message': "PDF processing non disponibile. Installa pdfplumber per elaborare i file PDF."}
     
     try:
-        processed_count = 0
         errors = []
+        pages = None
         
-        # Leggi il PDF
-        pdf_content = file.read()
-        pdf_file = io.BytesIO(pdf_content)
+        # Colonne individuate dall'intestazione della tabella: di ogni pagina si leggono solo
+        # numero gara, voto OA e voto OT, in parallelo sui documenti lunghi
+        table = extract_pdf_table(file, VOTI_PDF_COLUMNS, progress=progress)
+        voti_rows = _parse_voti_table(table) if table is not None else []
         
-        with pdfplumber.open(pdf_file) as pdf:
-            full_text = ""
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    full_text += page_text + "\n"
+        if not voti_rows:
+            # Intestazione non riconosciuta: testo completo delle pagine, riga per riga
+            pages = extract_pdf_pages(file, progress=progress)
+            if not any(page_text.strip() for page_text in pages):
+                return {'success': False, 'message': "Impossibile estrarre testo dal PDF"}
+            voti_rows = _parse_voti_text(pages)
         
-        if not full_text.strip():
-            return {'success': False, 'message': "Impossibile estrarre testo dal PDF"}
-        
-        # Processa riga per riga per estrarre i voti
-        lines = full_text.split('\n')
-        found_matches = False
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            # Pattern per righe con numero gara e voti
-            # Cerca righe che iniziano con numero di 3-4 cifre seguito da dati e voti alla fine
-            match = re.match(r'(\d{3,4})\s+.*?([0-9,]+)(?:\s+([0-9,]+))?\s*$', line)
-            
-            if match:
-                found_matches = True
-                try:
-                    numero_gara = match.group(1)
-                    voto_oa_str = match.group(2).replace(',', '.')
-                    voto_ot_str = match.group(3).replace(',', '.') if match.group(3) else None
-                    
-                    # Converti i voti in float
-                    voto_oa = None
-                    voto_ot = None
-                    
-                    try:
-                        voto_oa_val = float(voto_oa_str)
-                        if 0 <= voto_oa_val <= 10:  # Validazione range voto
-                            voto_oa = voto_oa_val
-                    except (ValueError, TypeError):
-                        continue  # Salta questa riga se il voto OA non è valido
-                    
-                    if voto_ot_str:
-                        try:
-                            voto_ot_val = float(voto_ot_str)
-                            if 0 <= voto_ot_val <= 10:  # Validazione range voto
-                                voto_ot = voto_ot_val
-                        except (ValueError, TypeError):
-                            pass  # OT può essere None se non valido
-                    
-                    # Inserisci solo se almeno OA è valido
-                    if voto_oa is not None:
-                        if upsert_voto(numero_gara, voto_oa, voto_ot):
-                            processed_count += 1
-                        else:
-                            errors.append(f"Errore nell'inserimento voto per gara {numero_gara}")
-                    
-                except Exception as e:
-                    errors.append(f"Errore nel processare riga: {str(e)}")
-        
-        if not found_matches:
-            # Fallback: cerca solo numeri che potrebbero essere voti
-            lines = full_text.split('\n')
-            for line_num, line in enumerate(lines):
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Cerca pattern più semplici
-                numbers = re.findall(r'\b\d+(?:[.,]\d+)?\b', line)
-                if len(numbers) >= 3:  # Almeno numero gara + 2 voti
-                    try:
-                        numero_gara = numbers[0]
-                        voto_oa = float(numbers[1].replace(',', '.'))
-                        voto_ot = float(numbers[2].replace(',', '.'))
-                        
-                        if 0 <= voto_oa <= 10 and 0 <= voto_ot <= 10:
-                            if upsert_voto(numero_gara, voto_oa, voto_ot):
-                                processed_count += 1
-                            found_matches = True
-                    except:
-                        continue
+        # Inserisci tutti i voti estratti in un'unica transazione
+        processed_count = upsert_voti_bulk(voti_rows)
+        if processed_count < len(voti_rows):
+            errors.append(f"Errore nell'inserimento di {len(voti_rows) - processed_count} voti")
         
         if processed_count == 0:
+            if pages is None:
+                pages = extract_pdf_pages(file)
+            preview = '\n'.join(page_text for page_text in pages if page_text)[:500]
             return {
                 'success': False, 
-                'message': f"Nessun voto estratto dal PDF. Testo estratto (primi 500 caratteri): {full_text[:500]}"
+                'message': f"Nessun voto estratto dal PDF. Testo estratto (primi 500 caratteri): {preview}"
             }
         
         if errors:
             error_msg = f"Elaborati {processed_count} voti con {len(errors)} errori"
             if len(errors) <= 3:
                 error_msg += f": {'; '.join(errors)}"
-            return {'success': True, 'message': error_msg}
+            return {'success': True, 'message': error_msg, 'processed': processed_count}
         else:
-            return {'success': True, 'message': f"Elaborati con successo {processed_count} voti"}
+            return {'success': True, 'message': f"Elaborati con successo {processed_count} voti", 'processed': processed_count}
             
     except Exception as e:
         return {'success': False, 'message': f"Errore nella lettura del PDF: {str(e)}"}
 
-def process_indisponibilita_file(file) -> Dict[str, Any]:
-    """Processa il file Excel delle indisponibilità"""
+def process_indisponibilita_file(file, progress=None) -> Dict[str, Any]:
+    """Processa il file Excel delle indisponibilità, leggendolo e scrivendolo a blocchi"""
     try:
-        # Leggi il file Excel con engine esplicito
-        df = pd.read_excel(file, engine='openpyxl')
-        
-        # Normalizza i nomi delle colonne
-        df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_').str.replace('.', '_')
-        
-        # Gestisce colonne generiche per file indisponibilità
-        if any(col.startswith('Column') for col in df.columns):
-            # Mappatura specifica per file indisponibilità
-            indisponibilita_mapping = {
-                'Column1': 'cod_mecc',        # Cod_Mecc - Colonna A
-                'Column2': 'data_inizio',     # Data - Colonna B  
-                'Column3': 'qualifica',       # Qualifica - Colonna C
-                'Column4': 'motivo'           # Motivo - Colonna D
-            }
-            # Rinomina le colonne usando la mappatura
-            df = df.rename(columns=indisponibilita_mapping)
-        
-        # Mappatura possibili nomi colonne
-        column_mapping = {
-            'cod_mecc': ['cod_mecc', 'cod_mecc_', 'codice_meccanografico', 'cod__mecc', 'codmecc', 'arbitro', 'cod meccanografico', 'cod', 'codice'],
-            'data_inizio': ['inizio', 'data_inizio', 'start_date', 'data_indisponibilita', 'data', 'date'],
-            'data_fine': ['fine', 'data_fine', 'end_date', 'data_fine_indisponibilita'],
-            'motivo': ['motivo', 'reason', 'causa', 'note', 'motivazione', 'osservazioni'],
-            'qualifica': ['qualifica', 'qualification', 'qual', 'tipo', 'ruolo']
-        }
-        
-        # Trova le colonne effettive
-        actual_columns = {}
-        for standard_name, possible_names in column_mapping.items():
-            for possible_name in possible_names:
-                if possible_name in df.columns:
-                    actual_columns[standard_name] = possible_name
-                    break
-        
-        # Verifica colonne essenziali
-        required_columns = ['cod_mecc', 'data_inizio']
-        missing_columns = [col for col in required_columns if col not in actual_columns]
-        
-        if missing_columns:
-            return {
-                'success': False,
-                'message': f"Colonne mancanti nel file: {', '.join(missing_columns)}. Colonne trovate: {', '.join(df.columns.tolist())}"
-            }
+        chunks, error = read_excel_format(file, 'indisponibilita', progress=progress)
+        if chunks is None:
+            return {'success': False, 'message': error}
         
-        # Processa ogni riga
-        processed_count = 0
+        # Processa ogni blocco di righe accumulando i periodi nelle tabelle di staging
+        staged_count = 0
         errors = []
         
-        for idx, row in df.iterrows():
-            try:
-                cod_mecc_raw = str(row[actual_columns['cod_mecc']]).strip()
-                
-                # Verifica campo essenziale
-                if not cod_mecc_raw or cod_mecc_raw == 'nan':
-                    continue
-                
-                # Usa il codice meccanografico completo per le indisponibilità
-                cod_mecc = cod_mecc_raw
-                
-                # Data inizio indisponibilità
-                data_inizio = None
-                try:
-                    data_val = row[actual_columns['data_inizio']]
-                    if pd.notna(data_val):
-                        if isinstance(data_val, str):
-                            # Prova diversi formati data
-                            for fmt in ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y']:
-                                try:
-                                    data_inizio = datetime.strptime(data_val.strip(), fmt).date()
-                                    break
-                                except ValueError:
-                                    continue
-                        else:
-                            data_inizio = pd.to_datetime(data_val).date()
-                except Exception:
-                    errors.append(f"Errore nel parsing della data inizio alla riga {str(idx + 1)}")
-                    continue
-                
-                if data_inizio is None:
-                    continue
-                
-                # Data fine indisponibilità (opzionale)
-                data_fine = None
-                if 'data_fine' in actual_columns:
-                    try:
-                        data_val = row[actual_columns['data_fine']]
-                        if pd.notna(data_val):
-                            if isinstance(data_val, str):
-                                # Prova diversi formati data
-                                for fmt in ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y']:
-                                    try:
-                                        data_fine = datetime.strptime(data_val.strip(), fmt).date()
-                                        break
-                                    except ValueError:
-                                        continue
-                            else:
-                                data_fine = pd.to_datetime(data_val).date()
-                    except:
-                        pass
-                
-                # Motivo (opzionale)
-                motivo = None
-                if 'motivo' in actual_columns:
-                    motivo_val = str(row[actual_columns['motivo']]).strip()
-                    if motivo_val and motivo_val != 'nan':
-                        motivo = motivo_val
-                
-                # Qualifica (opzionale)
-                qualifica = None
-                if 'qualifica' in actual_columns:
-                    qualifica_val = str(row[actual_columns['qualifica']]).strip()
-                    if qualifica_val and qualifica_val != 'nan':
-                        qualifica = qualifica_val
+        staging = begin_staging()
+        try:
+            for periodi in chunks:
+                # Verifica campi essenziali: codice meccanografico completo e data inizio valida
+                periodi = periodi[periodi['cod_mecc'].notna() & periodi['data_inizio'].notna()]
                 
-                # Se c'è una data fine, crea record per ogni giorno del periodo
-                # Altrimenti usa solo la data inizio
-                dates_to_insert = []
-                if data_fine and data_fine >= data_inizio:
-                    # Crea un record per ogni giorno del periodo
-                    current_date = data_inizio
-                    while current_date <= data_fine:
-                        dates_to_insert.append(current_date)
-                        # Aggiungi un giorno
-                        current_date = current_date + timedelta(days=1)
-                else:
-                    dates_to_insert.append(data_inizio)
+                # Il periodo viene salvato con i suoi estremi; senza una data fine valida
+                # l'indisponibilità riguarda solo la data inizio
+                data_fine = periodi['data_fine']
+                periodi = periodi.assign(data_fine=data_fine.where(data_fine >= periodi['data_inizio'], periodi['data_inizio']))
                 
-                # Inserisci nel database per ogni data
-                for date_to_insert in dates_to_insert:
-                    if upsert_indisponibilita(cod_mecc, date_to_insert, motivo, qualifica):
-                        processed_count += 1
-                    else:
-                        errors.append(f"Errore nell'inserimento indisponibilità per {cod_mecc} il {date_to_insert}")
-                    
-            except Exception as e:
-                errors.append(f"Errore alla riga {str(idx + 1)}: {str(e)}")
+                staged_count += stage_rows(staging, 'indisponibilita', periodi)
+            
+            # Validazione e pubblicazione dell'intero file in un'unica transazione
+            processed_count = publish_staging(staging)['indisponibilita']
+        finally:
+            discard_staging(staging)
+        
+        if processed_count < staged_count:
+            errors.append(f"{staged_count - processed_count} indisponibilità scartate dalla validazione")
         
         if errors:
             error_msg = f"Elaborate {processed_count} indisponibilità con {len(errors)} errori"
             if len(errors) <= 5:
                 error_msg += f": {'; '.join(errors)}"
-            return {'success': True, 'message': error_msg}
+            return {'success': True, 'message': error_msg, 'processed': processed_count}
         else:
-            return {'success': True, 'message': f"Elaborate con successo {processed_count} indisponibilità"}
+            return {'success': True, 'message': f"Elaborate con successo {processed_count} indisponibilità", 'processed': processed_count}
             
     except Exception as e:
-        return {'success': False, 'message': f"Errore nella lettura del file: {str(e)}"}
\ No newline at end of file
+        return {'success': False, 'message': f"Errore nella lettura del file: {str(e)}"}
+
+# Elaboratori dei file caricati dalla sidebar, per tipo di caricamento
+INGEST_PROCESSORS = {
+    'gare': process_gare_file,
+    'voti': process_voti_pdf,
+    'indisponibilita': process_indisponibilita_file,
+}
+
+def file_sha256(file) -> str:
+    """Hash SHA-256 del contenuto di un file caricato, lasciato con la posizione all'inizio"""
+    if hasattr(file, 'getbuffer'):
+        return hashlib.sha256(file.getbuffer()).hexdigest()
+    content = file.read()
+    file.seek(0)
+    return hashlib.sha256(content).hexdigest()
+
+def ingest_file(file, tipo: str, progress=None, sha256: str = None) -> Dict[str, Any]:
+    """Elabora un file caricato una sola volta per contenuto: se lo stesso file (hash SHA-256) è già
+    stato elaborato con successo restituisce l'esito registrato con 'skipped' a True.
+    progress(fatto, totale) riceve l'avanzamento dell'elaboratore."""
+    sha256 = sha256 or file_sha256(file)
+    run = get_ingest_run(tipo, sha256)
+    if run is not None:
+        return {
+            'success': True,
+            'skipped': True,
+            'processed': run['righe'],
+            'message': f"File già elaborato il {run['created_at']}: {run['messaggio']}"
+        }
+    
+    result = INGEST_PROCESSORS[tipo](file, progress=progress)
+    if result['success']:
+        record_ingest_run(tipo, sha256, getattr(file, 'name', None), result.get('processed'), result['message'])
+    return result
@@ -0,0 +1,102 @@
+"""
+Elaborazione in background dei file caricati dalla sidebar.
+
+Ogni caricamento diventa un job nella tabella ingest_jobs ed è elaborato da un pool di thread del
+server: la pagina Streamlit non resta bloccata, un refresh del browser non interrompe l'import e i
+caricamenti di gare, voti e indisponibilità procedono in parallelo (la pubblicazione finale nelle
+tabelle live resta serializzata dall'unica connessione in scrittura). Stato e avanzamento vengono
+scritti nel database e la sidebar li legge con get_ingest_job().
+"""
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+from database import (
+    create_ingest_job, update_ingest_job, get_active_ingest_job, get_ingest_run, fail_interrupted_ingest_jobs
+)
+from file_processors import ingest_file, file_sha256
+
+# Job elaborati contemporaneamente: uno per tipo di caricamento
+INGEST_WORKERS = 3
+
+# Intervallo minimo in secondi tra due aggiornamenti dell'avanzamento di un job
+PROGRESS_INTERVAL = 0.5
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Pool dei worker, creato al primo caricamento del processo. Alla creazione i job rimasti
+    aperti da un processo precedente vengono segnati come interrotti."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            fail_interrupted_ingest_jobs()
+            _executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix='ingest')
+        return _executor
+
+
+def _run_ingest_job(job_id, tipo, sha256, file_name, content):
+    """Esegue un job: elabora il file aggiornando l'avanzamento e registra l'esito"""
+    update_ingest_job(job_id, stato='in_corso', messaggio='Elaborazione in corso...')
+    ultimo_aggiornamento = 0.0
+
+    def progress(fatto, totale):
+        nonlocal ultimo_aggiornamento
+        adesso = time.monotonic()
+        if adesso - ultimo_aggiornamento < PROGRESS_INTERVAL:
+            return
+        ultimo_aggiornamento = adesso
+        # L'ultima quota è riservata a validazione e pubblicazione
+        progresso = min(fatto / totale, 1.0) * 0.9 if totale else None
+        messaggio = f"Elaborati {fatto} di {totale}" if totale else f"Elaborati {fatto}"
+        update_ingest_job(job_id, progresso=progresso, messaggio=messaggio)
+
+    try:
+        file = io.BytesIO(content)
+        file.name = file_name
+        result = ingest_file(file, tipo, progress=progress, sha256=sha256)
+    except Exception as e:
+        result = {'success': False, 'message': f"Errore nell'elaborazione del file: {str(e)}"}
+
+    update_ingest_job(
+        job_id,
+        stato='completato' if result['success'] else 'errore',
+        progresso=1.0,
+        messaggio=result['message'],
+        righe=result.get('processed'),
+    )
+
+
+def submit_ingest_job(file, tipo: str) -> Dict[str, Any]:
+    """Accoda in background l'elaborazione di un file caricato e restituisce l'identificativo del job.
+    Un contenuto già in elaborazione restituisce il job esistente; un contenuto già elaborato con
+    successo non viene accodato e restituisce l'esito registrato con 'skipped' a True."""
+    sha256 = file_sha256(file)
+
+    run = get_ingest_run(tipo, sha256)
+    if run is not None:
+        return {
+            'success': True,
+            'skipped': True,
+            'job_id': None,
+            'message': f"File già elaborato il {run['created_at']}: {run['messaggio']}"
+        }
+
+    executor = _get_executor()
+    with _executor_lock:
+        job = get_active_ingest_job(tipo, sha256)
+        if job is not None:
+            return {'success': True, 'skipped': False, 'job_id': job['id'], 'message': job['messaggio']}
+
+        file_name = getattr(file, 'name', None)
+        job_id = create_ingest_job(tipo, sha256, file_name)
+        if job_id is None:
+            return {'success': False, 'skipped': False, 'job_id': None, 'message': "Impossibile accodare il caricamento"}
+
+        file.seek(0)
+        executor.submit(_run_ingest_job, job_id, tipo, sha256, file_name, file.read())
+    return {'success': True, 'skipped': False, 'job_id': job_id, 'message': 'Caricamento in coda'}
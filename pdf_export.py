@@ -2,7 +2,11 @@
 Modulo per l'export HTML della Dashboard Arbitri (versione semplificata senza dipendenze PDF)
 """
 import pandas as pd
-import sqlite3
+from db_connection import get_read_connection
+from queries import (
+    HTML_DASHBOARD_ARBITRI, HTML_DASHBOARD_FILTRO_ARBITRO, HTML_DASHBOARD_FILTRO_DA,
+    HTML_DASHBOARD_FILTRO_A, HTML_DASHBOARD_RAGGRUPPAMENTO
+)
 from datetime import datetime
 import base64
 import os
@@ -65,47 +69,28 @@ def create_arbitri_dashboard_html(selected_arbitro=None, start_date=None, end_da
         html_content += f'<p style="text-align: center;"><strong>{period_text}</strong></p>'
         
         # Ottieni dati dal database
-        conn = sqlite3.connect('arbitri.db')
-        
         # Query per ottenere dati dashboard
-        dashboard_query = """
-            SELECT 
-                a.cognome || ' ' || a.nome as arbitro,
-                a.sezione,
-                COALESCE(a.eta, '') as eta,
-                COUNT(DISTINCT g.numero_gara) as totale_gare,
-                COUNT(DISTINCT CASE WHEN v.voto_oa IS NOT NULL THEN g.numero_gara END) as gare_con_voto_oa,
-                COUNT(DISTINCT CASE WHEN v.voto_ot IS NOT NULL THEN g.numero_gara END) as gare_con_voto_ot,
-                GROUP_CONCAT(DISTINCT COALESCE(g.categoria, '') || ' ' || COALESCE(g.girone, '')) as categorie
-            FROM arbitri a
-            LEFT JOIN gare g ON a.cod_mecc = g.cod_mecc
-            LEFT JOIN voti v ON g.numero_gara = v.numero_gara
-            WHERE 1=1
-        """
+        dashboard_query = HTML_DASHBOARD_ARBITRI
         
         params = []
         if selected_arbitro and selected_arbitro != "Tutti" and selected_arbitro != "Tutti gli arbitri":
-            dashboard_query += " AND (a.cognome || ' ' || a.nome LIKE ? OR a.cod_mecc LIKE ?)"
+            dashboard_query += HTML_DASHBOARD_FILTRO_ARBITRO
             search_term = f"%{selected_arbitro}%"
             params.extend([search_term, search_term])
         
         if start_date:
-            dashboard_query += " AND (g.data_gara IS NULL OR g.data_gara >= ?)" 
+            dashboard_query += HTML_DASHBOARD_FILTRO_DA
             params.append(start_date.strftime('%Y-%m-%d'))
             
         if end_date:
-            dashboard_query += " AND (g.data_gara IS NULL OR g.data_gara <= ?)"
+            dashboard_query += HTML_DASHBOARD_FILTRO_A
             params.append(end_date.strftime('%Y-%m-%d'))
         
-        dashboard_query += """
-            GROUP BY a.cod_mecc, a.cognome, a.nome, a.sezione, a.eta
-            HAVING COUNT(DISTINCT g.numero_gara) > 0 OR ? = 'Tutti'
-            ORDER BY totale_gare DESC, arbitro
-        """
+        dashboard_query += HTML_DASHBOARD_RAGGRUPPAMENTO
         params.append(selected_arbitro if selected_arbitro else 'Tutti')
         
-        df = pd.read_sql_query(dashboard_query, conn, params=params)
-        conn.close()
+        with get_read_connection() as conn:
+            df = pd.read_sql_query(dashboard_query, conn, params=params)
         
         if not df.empty:
             # Statistiche generali
@@ -0,0 +1,200 @@
+"""
+Estrazione del testo dai PDF caricati (voti e graduatorie).
+
+Le pagine vengono suddivise in intervalli contigui ed estratte in parallelo da un pool di processi;
+il testo torna pagina per pagina nell'ordine del documento e i parser lo leggono riga per riga
+con iter_pdf_lines(), senza concatenare l'intero documento in un'unica stringa. Per le tabelle
+extract_pdf_table() legge soltanto le colonne richieste, ritagliate dalla pagina.
+Il modulo importa solo pdfplumber, così i processi del pool si avviano rapidamente.
+"""
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Dict, Iterable, Iterator, List, Optional, Pattern
+
+try:
+    import pdfplumber
+    PDFPLUMBER_AVAILABLE = True
+except ImportError:
+    PDFPLUMBER_AVAILABLE = False
+
+# Processi usati per l'estrazione, configurabile da variabile d'ambiente (default: numero di CPU)
+PDF_WORKERS = int(os.environ.get('ARBITRI_PDF_WORKERS', str(os.cpu_count() or 1)))
+
+# Sotto questo numero di pagine l'avvio del pool costa più dell'estrazione: si resta nel processo corrente
+PDF_PARALLEL_MIN_PAGES = 8
+
+# Distanza verticale massima (punti) tra parole della stessa riga di una tabella
+ROW_TOLERANCE = 3
+
+# Distanza orizzontale massima (punti) tra parole della stessa etichetta di intestazione (es. "Voto OA")
+LABEL_GAP = 5
+
+
+def _read_pdf_bytes(source) -> bytes:
+    """Contenuto del PDF da percorso, bytes o file caricato"""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return f.read()
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return source.read()
+
+
+def _extract_page_range(pdf_content: bytes, start: int, stop: int, progress=None) -> List[str]:
+    """Estrae il testo delle pagine [start, stop) liberando la cache di ogni pagina dopo l'uso"""
+    texts = []
+    with pdfplumber.open(io.BytesIO(pdf_content)) as pdf:
+        for page in pdf.pages[start:stop]:
+            texts.append(page.extract_text() or '')
+            page.close()
+            if progress is not None:
+                progress(start + len(texts), stop)
+    return texts
+
+
+def _page_ranges(page_count: int, parts: int) -> List[tuple]:
+    """Divide le pagine in al più parts intervalli contigui di dimensione simile"""
+    size, extra = divmod(page_count, parts)
+    ranges, start = [], 0
+    for part in range(parts):
+        stop = start + size + (1 if part < extra else 0)
+        if stop > start:
+            ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def _run_page_ranges(pdf_content: bytes, page_count: int, extract, args: tuple = (), workers: int = None,
+                     progress=None) -> list:
+    """Applica extract(pdf_content, start, stop, *args) a tutte le pagine, in parallelo sui documenti lunghi,
+    e concatena i risultati nell'ordine del documento"""
+    workers = min(workers or PDF_WORKERS, page_count)
+    if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+        return extract(pdf_content, 0, page_count, *args, progress=progress)
+
+    ranges = _page_ranges(page_count, workers)
+    try:
+        # spawn: i processi non ereditano i thread e i lock del server Streamlit
+        with ProcessPoolExecutor(max_workers=len(ranges), mp_context=get_context('spawn')) as executor:
+            futures = [executor.submit(extract, pdf_content, start, stop, *args) for start, stop in ranges]
+            if progress is not None:
+                done = 0
+                for future in as_completed(futures):
+                    done += len(future.result())
+                    progress(done, page_count)
+            return [item for future in futures for item in future.result()]
+    except (OSError, BrokenProcessPool) as e:
+        print(f"Estrazione parallela non disponibile, estrazione sequenziale: {e}")
+        return extract(pdf_content, 0, page_count, *args, progress=progress)
+
+
+def extract_pdf_pages(source, workers: int = None, progress=None) -> List[str]:
+    """Restituisce il testo di ogni pagina del PDF, nell'ordine del documento ('' per le pagine senza testo).
+    I documenti lunghi vengono estratti in parallelo da workers processi (default PDF_WORKERS).
+    Se indicata, progress(pagine_estratte, pagine_totali) viene chiamata durante l'estrazione."""
+    pdf_content = _read_pdf_bytes(source)
+    with pdfplumber.open(io.BytesIO(pdf_content)) as pdf:
+        page_count = len(pdf.pages)
+    return _run_page_ranges(pdf_content, page_count, _extract_page_range, workers=workers, progress=progress)
+
+
+def _group_rows(words: List[dict]) -> List[List[dict]]:
+    """Raggruppa le parole in righe per posizione verticale, dall'alto verso il basso"""
+    rows = []
+    for word in sorted(words, key=lambda w: (w['top'], w['x0'])):
+        if rows and word['top'] - rows[-1][0]['top'] <= ROW_TOLERANCE:
+            rows[-1].append(word)
+        else:
+            rows.append([word])
+    return rows
+
+
+def _header_labels(row: List[dict]) -> List[tuple]:
+    """Etichette di una riga di intestazione come (testo, x0, x1): parole vicine formano un'unica etichetta"""
+    labels = []
+    for word in sorted(row, key=lambda w: w['x0']):
+        if labels and word['x0'] - labels[-1][2] <= LABEL_GAP:
+            text, x0, _ = labels[-1]
+            labels[-1] = (f"{text} {word['text']}", x0, word['x1'])
+        else:
+            labels.append((word['text'], word['x0'], word['x1']))
+    return labels
+
+
+def _find_table_columns(pdf, columns: Dict[str, Pattern], max_pages: int) -> Optional[List[tuple]]:
+    """Cerca la riga di intestazione in cui ogni pattern di columns riconosce un'etichetta diversa e
+    restituisce l'intervallo orizzontale (x0, x1) di ciascuna colonna, nell'ordine di columns.
+    I confini cadono a metà dello spazio tra etichette adiacenti, così i valori allineati a destra
+    o a sinistra restano nella colonna della loro intestazione."""
+    for page in pdf.pages[:max_pages]:
+        for row in _group_rows(page.extract_words()):
+            labels = _header_labels(row)
+            found = {}
+            for name, pattern in columns.items():
+                for index, (text, _, _) in enumerate(labels):
+                    if index not in found.values() and pattern.search(text):
+                        found[name] = index
+                        break
+            if len(found) < len(columns):
+                continue
+
+            bounds = []
+            for name in columns:
+                index = found[name]
+                x0 = (labels[index - 1][2] + labels[index][1]) / 2 if index > 0 else 0
+                x1 = (labels[index][2] + labels[index + 1][1]) / 2 if index + 1 < len(labels) else page.width
+                bounds.append((x0, x1))
+            return bounds
+    return None
+
+
+def _extract_columns_range(pdf_content: bytes, start: int, stop: int, bounds: List[tuple],
+                           progress=None) -> List[List[tuple]]:
+    """Per ogni pagina [start, stop) legge solo le regioni delle colonne indicate e restituisce le righe
+    come tuple con il testo di ciascuna colonna ('' se vuota)"""
+    pages = []
+    with pdfplumber.open(io.BytesIO(pdf_content)) as pdf:
+        for page in pdf.pages[start:stop]:
+            words = []
+            for column, (x0, x1) in enumerate(bounds):
+                for word in page.crop((x0, 0, x1, page.height)).extract_words():
+                    word['column'] = column
+                    words.append(word)
+            rows = []
+            for row in _group_rows(words):
+                cells = [''] * len(bounds)
+                for word in row:
+                    cells[word['column']] = f"{cells[word['column']]} {word['text']}".lstrip()
+                rows.append(tuple(cells))
+            pages.append(rows)
+            page.close()
+            if progress is not None:
+                progress(start + len(pages), stop)
+    return pages
+
+
+def extract_pdf_table(source, columns: Dict[str, Pattern], workers: int = None, progress=None,
+                      header_pages: int = 2) -> Optional[List[List[tuple]]]:
+    """Estrae dal PDF solo le colonne indicate di una tabella. Le posizioni delle colonne vengono
+    ricavate una sola volta dalla riga di intestazione (cercata nelle prime header_pages pagine),
+    in cui ogni pattern di columns deve riconoscere un'etichetta; ogni pagina viene poi letta
+    ritagliando soltanto quelle regioni. Restituisce per pagina la lista delle righe, tuple con il
+    testo delle colonne nell'ordine di columns, oppure None se l'intestazione non viene trovata."""
+    pdf_content = _read_pdf_bytes(source)
+    with pdfplumber.open(io.BytesIO(pdf_content)) as pdf:
+        page_count = len(pdf.pages)
+        bounds = _find_table_columns(pdf, columns, header_pages)
+    if bounds is None:
+        return None
+    return _run_page_ranges(pdf_content, page_count, _extract_columns_range, (bounds,), workers, progress)
+
+
+def iter_pdf_lines(pages: Iterable[str]) -> Iterator[str]:
+    """Genera le righe del testo estratto, pagina dopo pagina"""
+    for text in pages:
+        yield from text.split('\n')
@@ -2,10 +2,10 @@
 Script per popolare completamente il database con tutti i dati necessari
 """
 import pandas as pd
-import pdfplumber
 import re
-from database import init_database, upsert_arbitro, upsert_gara, upsert_voto, upsert_indisponibilita, update_arbitro_anzianita
+from database import init_database, upsert_arbitro, upsert_gara, upsert_voto, upsert_indisponibilita, update_arbitri_anzianita_bulk, rebuild_arbitri_alias
 from file_processors import process_gare_file, process_voti_pdf, process_indisponibilita_file
+from pdf_extraction import extract_pdf_pages, iter_pdf_lines
 
 def populate_complete_database():
     """Popola il database con tutti i dati necessari"""
@@ -42,18 +42,13 @@ def populate_complete_database():
 
 def populate_complete_database_if_empty():
     """Popola il database solo se è vuoto (per Streamlit Cloud)"""
-    import sqlite3
-    
-    conn = sqlite3.connect('arbitri.db')
-    cursor = conn.cursor()
+    from db_connection import get_read_connection
     
     try:
         # Controlla se il database ha dati
-        cursor.execute("SELECT COUNT(*) FROM arbitri")
-        arbitri_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM gare") 
-        gare_count = cursor.fetchone()[0]
+        with get_read_connection() as conn:
+            arbitri_count = conn.execute("SELECT COUNT(*) FROM arbitri").fetchone()[0]
+            gare_count = conn.execute("SELECT COUNT(*) FROM gare").fetchone()[0]
         
         # Se il database è vuoto, popolalo
         if arbitri_count == 0 or gare_count == 0:
@@ -67,8 +62,6 @@ def populate_complete_database_if_empty():
     except Exception as e:
         print(f"Errore controllo database: {e}")
         return {'success': False, 'message': f'Errore: {e}'}
-    finally:
-        conn.close()
 
 def load_arbitri_anagrafica():
     """Carica anagrafica arbitri dal file Excel"""
@@ -106,32 +99,67 @@ def load_arbitri_anagrafica():
                 print(f"Errore riga arbitro: {e}")
                 continue
         
+        rebuild_arbitri_alias()
         print(f"Caricati {count} arbitri dall'anagrafica")
         
     except Exception as e:
         print(f"Errore caricamento anagrafica: {e}")
 
+# Riga della graduatoria: pos nome_cognome sezione ... età anzianità
+GRADUATORIA_PATTERN = re.compile(r'^\s*(\d+)\s+([A-Z\'\s]+?)\s+([A-Z0-9]+)\s+.*?\s+(\d+)\s+(\d+)\s*$')
+GRADUATORIA_SKIP_WORDS = ['POS.', 'COGNOME E NOME', 'FEDERAZIONE', 'GRADUATORIA', 'PAGINA', 'DOCUMENTO']
+
+def build_name_index(arbitri_df):
+    """Indice in memoria dell'anagrafica per il matching dei nomi: cognome maiuscolo -> lista di
+    (token del nome, cod_mecc) nell'ordine di get_arbitri(), più l'elenco ordinato dei cognomi
+    per le ricerche parziali"""
+    by_cognome = {}
+    cognomi = []
+    for cod_mecc, cognome, nome in arbitri_df[['cod_mecc', 'cognome', 'nome']].itertuples(index=False, name=None):
+        cognome = str(cognome).upper()
+        if cognome not in by_cognome:
+            by_cognome[cognome] = []
+            cognomi.append(cognome)
+        by_cognome[cognome].append((set(str(nome).upper().split()), cod_mecc))
+    return {'by_cognome': by_cognome, 'cognomi': cognomi, 'parziali': {}}
+
+def resolve_name(index, cognome, nome):
+    """cod_mecc dell'arbitro con il cognome indicato (a parità di cognome quello con un token del nome
+    in comune); se il cognome non esiste, il primo cognome che contiene la sua prima parola. None se nessuno."""
+    candidati = index['by_cognome'].get(cognome.upper())
+    if candidati is None:
+        # Match parziale, calcolato una sola volta per parola
+        parola = cognome.split()[0]
+        if parola not in index['parziali']:
+            index['parziali'][parola] = next((c for c in index['cognomi'] if parola in c), None)
+        parziale = index['parziali'][parola]
+        if parziale is None:
+            return None
+        candidati = index['by_cognome'][parziale]
+    
+    token_nome = set(nome.upper().split())
+    for token, cod_mecc in candidati:
+        if token & token_nome:
+            return cod_mecc
+    return candidati[0][1]
+
 def load_anzianita_from_graduatoria():
     """Carica anzianità dal PDF graduatoria"""
     try:
-        with pdfplumber.open('attached_assets/Stampa_Graduatoria_1754169546859.pdf') as pdf:
-            full_text = ''
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    full_text += page_text + '\n'
+        from database import get_arbitri
+        
+        pages = extract_pdf_pages('attached_assets/Stampa_Graduatoria_1754169546859.pdf')
         
-        lines = full_text.split('\n')
-        updated_count = 0
+        # Anagrafica letta una sola volta e indicizzata per cognome
+        index = build_name_index(get_arbitri())
+        aggiornamenti = []
         
-        for line in lines:
+        for line in iter_pdf_lines(pages):
             line = line.strip()
-            if not line or any(word in line.upper() for word in ['POS.', 'COGNOME E NOME', 'FEDERAZIONE', 'GRADUATORIA', 'PAGINA', 'DOCUMENTO']):
+            if not line or any(word in line.upper() for word in GRADUATORIA_SKIP_WORDS):
                 continue
             
-            # Pattern per graduatoria: pos nome_cognome sezione ... età anzianità
-            pattern = r'^\s*(\d+)\s+([A-Z\'\s]+?)\s+([A-Z0-9]+)\s+.*?\s+(\d+)\s+(\d+)\s*$'
-            match = re.search(pattern, line)
+            match = GRADUATORIA_PATTERN.search(line)
             
             if match:
                 nome_cognome = match.group(2).strip()
@@ -147,33 +175,13 @@ def load_anzianita_from_graduatoria():
                     else:
                         cognome, nome = ' '.join(parts[:-1]), parts[-1]
                     
-                    try:
-                        anni_ot = int(anzianita)
-                        anno_inizio = 2025 - anni_ot
-                        
-                        # Trova arbitro nel database e aggiorna anzianità
-                        from database import get_arbitri
-                        arbitri_db = get_arbitri()
-                        
-                        # Match esatto prima
-                        match_exact = arbitri_db[arbitri_db['cognome'].str.upper() == cognome.upper()]
-                        
-                        # Se non trovato, match parziale
-                        if match_exact.empty:
-                            match_partial = arbitri_db[
-                                arbitri_db['cognome'].str.upper().str.contains(cognome.split()[0], regex=False, na=False)
-                            ]
-                            if not match_partial.empty:
-                                match_exact = match_partial
-                        
-                        if not match_exact.empty:
-                            cod_mecc = match_exact.iloc[0]['cod_mecc']
-                            if update_arbitro_anzianita(cod_mecc, anno_inizio):
-                                updated_count += 1
-                                
-                    except (ValueError, TypeError):
-                        continue
+                    anno_inizio = 2025 - int(anzianita)
+                    cod_mecc = resolve_name(index, cognome, nome)
+                    if cod_mecc is not None:
+                        aggiornamenti.append((cod_mecc, anno_inizio))
         
+        # Tutti gli aggiornamenti in un'unica transazione
+        updated_count = update_arbitri_anzianita_bulk(aggiornamenti)
         print(f"Aggiornata anzianità per {updated_count} arbitri")
         
     except Exception as e:
@@ -0,0 +1,548 @@
+"""
+Catalogo centralizzato delle query SQL usate da dashboard, export e analisi,
+con gli indici che le supportano e il controllo dei piani di esecuzione
+"""
+import re
+import sqlite3
+import sys
+from db_connection import get_read_connection
+
+# --- Dashboard (tab1) e tabella referee_week ---
+
+# Filtro facoltativo ({arbitri}) delle query sorgenti: arbitri passati come lista JSON
+FILTRO_ARBITRI_JSON = " AND {colonna} IN (SELECT value FROM json_each(?))"
+
+# Gare del periodo con categoria e girone - esclude ruolo QU (ordine dell'indice su data e ruolo)
+DASHBOARD_GARE = '''
+    SELECT cod_mecc, categoria, girone, data_gara
+    FROM gare
+    WHERE data_gara IS NOT NULL
+    AND data_gara BETWEEN ? AND ?
+    AND ruolo != 'QU'{arbitri}
+    ORDER BY data_gara, ruolo, id
+'''
+
+# Voti del periodo per assegnazione con cognome OT - esclude ruolo QU
+DASHBOARD_VOTI = '''
+    SELECT cod_mecc, voto_oa, voto_ot, cognome_ot, data_gara
+    FROM valutazioni
+    WHERE data_gara IS NOT NULL
+    AND data_gara BETWEEN ? AND ?
+    AND ruolo != 'QU'{arbitri}
+    ORDER BY data_gara, ruolo, numero_gara, cod_mecc
+'''
+
+# Periodi di indisponibilità con arbitro risolto che si sovrappongono al periodo (parametri: fine, inizio)
+DASHBOARD_INDISPONIBILITA = '''
+    SELECT arbitro_cod_mecc, data_inizio, data_fine, motivo
+    FROM indisponibilita_periodi
+    WHERE data_inizio <= ? AND data_fine >= ?
+    AND arbitro_cod_mecc IS NOT NULL{arbitri}
+    ORDER BY data_inizio, id
+'''
+
+# Note settimanali che si sovrappongono al periodo della dashboard, nell'ordine dell'indice
+# (cod_mecc, settimana_inizio, settimana_fine): per ogni settimana vale la prima nota dell'arbitro
+DASHBOARD_NOTE_PERIODO = '''
+    SELECT cod_mecc, nota, settimana_inizio, settimana_fine FROM note_settimanali
+    WHERE settimana_inizio <= ? AND settimana_fine >= ?{arbitri}
+    ORDER BY cod_mecc, settimana_inizio, settimana_fine
+'''
+
+# Celle già composte della tabella referee_week per le settimane con lunedì nell'intervallo
+REFEREE_WEEK_PERIODO = '''
+    SELECT cod_mecc, settimana_inizio, gare, voti, indisponibilita, nota
+    FROM referee_week
+    WHERE settimana_inizio BETWEEN ? AND ?{arbitri}
+'''
+
+# Intervalli (arbitro, inizio, fine) di tutte le righe sorgenti, per la ricostruzione completa di referee_week
+# (le valutazioni hanno arbitro e data della riga gare da cui derivano)
+REFEREE_WEEK_INTERVALLI = '''
+    SELECT cod_mecc, data_gara, data_gara FROM gare WHERE data_gara IS NOT NULL AND ruolo != 'QU'
+    UNION SELECT arbitro_cod_mecc, data_inizio, data_fine FROM indisponibilita_periodi WHERE arbitro_cod_mecc IS NOT NULL
+    UNION SELECT cod_mecc, settimana_inizio, settimana_fine FROM note_settimanali
+'''
+
+# Arbitri della Dashboard, con i filtri DASHBOARD_FILTRO_* e la pagina (DASHBOARD_PAGINA) aggiunti in coda
+DASHBOARD_ARBITRI = '''
+    SELECT cod_mecc, cognome, nome, sezione, eta, anno_anzianita
+    FROM arbitri
+    WHERE 1 = 1
+'''
+DASHBOARD_CONTEGGIO_ARBITRI = "SELECT COUNT(*) as count FROM arbitri WHERE 1 = 1"
+DASHBOARD_FILTRO_ARBITRO = " AND cognome || ' ' || nome = ?"
+DASHBOARD_FILTRO_SEZIONE = " AND sezione = ?"
+# Arbitri con almeno una gara della categoria nel periodo - esclude ruolo QU
+DASHBOARD_FILTRO_CATEGORIA = """
+    AND cod_mecc IN (
+        SELECT cod_mecc FROM gare
+        WHERE data_gara BETWEEN ? AND ? AND ruolo != 'QU' AND categoria = ?
+    )"""
+# Arbitri con attività: le condizioni DASHBOARD_ATTIVITA_* vengono unite in OR
+DASHBOARD_FILTRO_ATTIVITA = " AND ({condizioni})"
+# Una riga di referee_week in una delle settimane intere (lunedì passati come lista JSON)
+DASHBOARD_ATTIVITA_SETTIMANE = """cod_mecc IN (
+        SELECT cod_mecc FROM referee_week WHERE settimana_inizio IN (SELECT value FROM json_each(?))
+    )"""
+# Nel tratto di una settimana tagliata dal periodo contano le stesse righe che compongono le celle,
+# più la nota della settimana (parametri: lunedì, poi inizio e fine del tratto per gare, voti e
+# indisponibilità; per le indisponibilità fine e inizio)
+DASHBOARD_ATTIVITA_TRATTO = """cod_mecc IN (
+        SELECT cod_mecc FROM referee_week WHERE settimana_inizio = ? AND nota IS NOT NULL
+        UNION SELECT cod_mecc FROM gare
+        WHERE data_gara BETWEEN ? AND ? AND ruolo != 'QU' AND categoria != '' AND girone != ''
+        UNION SELECT cod_mecc FROM valutazioni
+        WHERE data_gara BETWEEN ? AND ? AND ruolo != 'QU' AND (voto_oa IS NOT NULL OR voto_ot IS NOT NULL)
+        UNION SELECT arbitro_cod_mecc FROM indisponibilita_periodi WHERE data_inizio <= ? AND data_fine >= ?
+    )"""
+DASHBOARD_PAGINA = " ORDER BY cognome, nome LIMIT ? OFFSET ?"
+
+# Categorie delle gare del periodo per il filtro della Dashboard - esclude ruolo QU
+DASHBOARD_CATEGORIE = '''
+    SELECT DISTINCT categoria FROM gare
+    WHERE data_gara BETWEEN ? AND ? AND ruolo != 'QU'
+    AND categoria IS NOT NULL AND categoria != ''
+    ORDER BY categoria
+'''
+
+# --- Statistiche (tab2) ---
+
+CONTEGGIO_GARE_AR = "SELECT COUNT(*) as count FROM gare WHERE ruolo = 'AR'"
+
+# I conteggi dei voti sono per assegnazione: una gara votata conta per ogni ruolo designato
+CONTEGGIO_VOTI_AR = """
+    SELECT COUNT(*) as count
+    FROM valutazioni
+    WHERE ruolo = 'AR' AND (voto_oa IS NOT NULL OR voto_ot IS NOT NULL)
+"""
+
+CONTEGGIO_VOTI_TOTALI = """
+    SELECT COUNT(*) as count
+    FROM valutazioni
+    WHERE (voto_oa IS NOT NULL OR voto_ot IS NOT NULL)
+    AND ruolo != 'QU'
+"""
+
+CONTEGGIO_VOTI_AR_OT = """
+    SELECT COUNT(*) as count
+    FROM valutazioni
+    WHERE voto_ot IS NOT NULL AND ruolo = 'AR'
+"""
+
+CONTEGGIO_VOTI_OA = """
+    SELECT COUNT(*) as count
+    FROM valutazioni
+    WHERE voto_oa IS NOT NULL AND ruolo != 'QU'
+"""
+
+CONTEGGIO_VOTI_OT = """
+    SELECT COUNT(*) as count
+    FROM valutazioni
+    WHERE voto_ot IS NOT NULL AND ruolo != 'QU'
+"""
+
+# --- Organi tecnici (tab4) ---
+
+# Cognomi OT estratti dalle gare con ruolo OT che hanno un voto OT. Raggruppa per posizione
+# perché valutazioni_gare ha già una colonna cognome_ot (l'OT risolto della gara)
+OT_GARE_PER_COGNOME = '''
+    SELECT
+        CASE
+            WHEN g.cognome_arbitro LIKE '%(%'
+            THEN TRIM(SUBSTR(g.cognome_arbitro, INSTR(g.cognome_arbitro, '(') + 1, INSTR(g.cognome_arbitro, ')') - INSTR(g.cognome_arbitro, '(') - 1))
+            ELSE g.cognome_arbitro
+        END as cognome_ot,
+        COUNT(*) as numero_gare
+    FROM valutazioni_gare g
+    WHERE g.voto_ot IS NOT NULL
+        AND g.cognome_arbitro IS NOT NULL
+        AND g.cognome_arbitro != ''
+        AND g.ruolo = 'OT'
+    GROUP BY 1
+    ORDER BY numero_gare DESC, 1
+'''
+
+# Voti OT ricevuti da ogni arbitro
+OT_VOTI_PER_ARBITRO = '''
+    SELECT
+        a.cognome as cognome,
+        a.nome as nome,
+        a.sezione as sezione,
+        COUNT(g.voto_ot) as numero_voti_ot
+    FROM valutazioni_gare g
+    JOIN arbitri a ON g.cod_mecc = a.cod_mecc
+    WHERE g.voto_ot IS NOT NULL
+        AND g.ruolo = 'AR'
+        AND g.cognome_arbitro IS NOT NULL
+        AND g.cognome_arbitro != ''
+    GROUP BY a.cognome, a.nome, a.sezione, g.cod_mecc
+    ORDER BY numero_voti_ot DESC, cognome, nome
+'''
+
+# --- Gestione partenze (tab5) ---
+
+ARBITRO_PER_CODICE = "SELECT * FROM arbitri WHERE cod_mecc = ?"
+
+AGGIORNA_REGIONI_ARBITRO = '''
+    UPDATE arbitri
+    SET regione_appartenenza = ?, regione_partenza = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE cod_mecc = ?
+'''
+
+REGIONI_APPARTENENZA = "SELECT DISTINCT regione_appartenenza FROM arbitri WHERE regione_appartenenza IS NOT NULL AND regione_appartenenza != ''"
+
+REGIONI_PARTENZA = "SELECT DISTINCT regione_partenza FROM arbitri WHERE regione_partenza IS NOT NULL AND regione_partenza != ''"
+
+# Arbitri con regione di partenza; i filtri opzionali si aggiungono in coda prima dell'ordinamento
+PARTENZE_ARBITRI = """
+    SELECT cognome, nome, sezione,
+           regione_appartenenza, regione_partenza
+    FROM arbitri
+    WHERE regione_partenza IS NOT NULL AND regione_partenza != ''
+"""
+PARTENZE_FILTRO_APPARTENENZA = " AND regione_appartenenza = ?"
+PARTENZE_FILTRO_PARTENZA = " AND regione_partenza = ?"
+PARTENZE_FILTRO_SEZIONE = " AND sezione = ?"
+PARTENZE_ORDINAMENTO = " ORDER BY cognome, nome"
+
+# --- Note settimanali (tab7) ---
+
+SALVA_NOTA_SETTIMANALE = '''
+    INSERT OR REPLACE INTO note_settimanali
+    (cod_mecc, settimana_inizio, settimana_fine, nota, data_modifica)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+ELIMINA_NOTA_SETTIMANALE = '''
+    DELETE FROM note_settimanali
+    WHERE cod_mecc = ? AND settimana_inizio = ? AND settimana_fine = ?
+'''
+
+NOTA_SETTIMANALE = '''
+    SELECT nota, data_modifica FROM note_settimanali
+    WHERE cod_mecc = ? AND settimana_inizio = ? AND settimana_fine = ?
+'''
+
+TUTTE_LE_NOTE = '''
+    SELECT n.cod_mecc, a.cognome, a.nome, n.settimana_inizio, n.settimana_fine,
+           n.nota, n.data_modifica
+    FROM note_settimanali n
+    JOIN arbitri a ON n.cod_mecc = a.cod_mecc
+    WHERE n.nota IS NOT NULL AND n.nota != ''
+    ORDER BY n.settimana_inizio DESC, a.cognome, a.nome
+'''
+
+# --- Export Excel ---
+
+# Gare AR con categoria e girone per le statistiche di arbitraggio - esclude QU
+STATISTICHE_GARE_AR = '''
+    SELECT g.cod_mecc, g.categoria, g.girone, g.numero_gara,
+           a.cognome, a.nome, a.sezione
+    FROM gare g
+    JOIN arbitri a ON g.cod_mecc = a.cod_mecc
+    WHERE g.categoria IS NOT NULL AND g.girone IS NOT NULL
+    AND g.ruolo = 'AR' AND g.ruolo != 'QU'
+    ORDER BY g.numero_gara
+'''
+
+EXPORT_GARE_PERIODO = '''
+    SELECT g.numero_gara, g.categoria, g.girone, g.data_gara, g.ruolo,
+           a.cognome, a.nome, a.sezione, a.anno_anzianita,
+           CASE WHEN a.anno_anzianita IS NOT NULL THEN (2025 - a.anno_anzianita) ELSE 0 END as anzianita_display
+    FROM gare g
+    JOIN arbitri a ON g.cod_mecc = a.cod_mecc
+    WHERE g.data_gara BETWEEN ? AND ?
+    ORDER BY g.data_gara, g.numero_gara
+'''
+
+EXPORT_VOTI_PERIODO = '''
+    SELECT g.numero_gara, g.voto_oa, g.voto_ot, g.data_gara, g.categoria, g.girone,
+           a.cognome, a.nome, a.sezione, g.cognome_ot, a.anno_anzianita,
+           CASE WHEN a.anno_anzianita IS NOT NULL THEN (2025 - a.anno_anzianita) ELSE 0 END as anzianita_display
+    FROM valutazioni_gare g
+    JOIN arbitri a ON g.cod_mecc = a.cod_mecc
+    WHERE g.data_gara BETWEEN ? AND ?
+    ORDER BY g.data_gara, g.numero_gara
+'''
+
+# --- Export HTML ---
+
+# Riepilogo per arbitro; i filtri opzionali si aggiungono prima di HTML_DASHBOARD_RAGGRUPPAMENTO
+HTML_DASHBOARD_ARBITRI = """
+    SELECT
+        a.cognome || ' ' || a.nome as arbitro,
+        a.sezione,
+        COALESCE(a.eta, '') as eta,
+        COUNT(g.numero_gara) as totale_gare,
+        COUNT(v.voto_oa) as gare_con_voto_oa,
+        COUNT(v.voto_ot) as gare_con_voto_ot,
+        GROUP_CONCAT(DISTINCT COALESCE(g.categoria, '') || ' ' || COALESCE(g.girone, '')) as categorie
+    FROM arbitri a
+    LEFT JOIN gare g ON a.cod_mecc = g.cod_mecc
+    LEFT JOIN valutazioni v ON v.numero_gara = g.numero_gara AND v.cod_mecc = g.cod_mecc
+    WHERE 1=1
+"""
+HTML_DASHBOARD_FILTRO_ARBITRO = " AND (a.cognome || ' ' || a.nome LIKE ? OR a.cod_mecc LIKE ?)"
+HTML_DASHBOARD_FILTRO_DA = " AND (g.data_gara IS NULL OR g.data_gara >= ?)"
+HTML_DASHBOARD_FILTRO_A = " AND (g.data_gara IS NULL OR g.data_gara <= ?)"
+HTML_DASHBOARD_RAGGRUPPAMENTO = """
+    GROUP BY a.cod_mecc, a.cognome, a.nome, a.sezione, a.eta
+    HAVING COUNT(g.numero_gara) > 0 OR ? = 'Tutti'
+    ORDER BY totale_gare DESC, arbitro
+"""
+
+# --- Timeline carriera ---
+
+CARRIERA_ARBITRO = """
+    SELECT a.cod_mecc, a.cognome, a.nome, a.sezione, a.eta, a.anno_anzianita
+    FROM arbitri a
+    WHERE a.cod_mecc = ?
+"""
+
+CARRIERA_GARE = """
+    SELECT g.numero_gara, g.data_gara, g.categoria, g.girone, g.ruolo,
+           g.squadra_casa, g.squadra_trasferta, g.campionato,
+           v.voto_oa, v.voto_ot
+    FROM gare g
+    LEFT JOIN valutazioni v ON v.numero_gara = g.numero_gara AND v.cod_mecc = g.cod_mecc
+    WHERE g.cod_mecc = ?
+    ORDER BY g.data_gara ASC
+"""
+
+# Giorni di indisponibilità di un arbitro, espandendo solo i suoi periodi
+CARRIERA_INDISPONIBILITA = """
+    WITH RECURSIVE giorni (data_indisponibilita, data_fine, motivo) AS (
+        SELECT data_inizio, data_fine, motivo
+        FROM indisponibilita_periodi
+        WHERE arbitro_cod_mecc = ?
+        UNION ALL
+        SELECT DATE(data_indisponibilita, '+1 day'), data_fine, motivo
+        FROM giorni
+        WHERE data_indisponibilita < data_fine
+    )
+    SELECT data_indisponibilita, motivo
+    FROM giorni
+    ORDER BY data_indisponibilita ASC
+"""
+
+# --- Analisi frequenza arbitraggio ---
+
+# Parametri: inizio e fine del periodo
+FREQUENZA_ARBITRI = """
+    SELECT
+        a.cognome,
+        a.nome,
+        a.cod_mecc,
+        COUNT(g.numero_gara) as numero_gare,
+        GROUP_CONCAT(DISTINCT g.categoria || ' ' || g.girone) as categorie_arbitrate,
+        MIN(g.data_gara) as prima_gara,
+        MAX(g.data_gara) as ultima_gara
+    FROM arbitri a
+    LEFT JOIN gare g ON a.cod_mecc = g.cod_mecc
+    WHERE g.data_gara BETWEEN ? AND ?
+    AND g.ruolo = 'AR'
+    GROUP BY a.cod_mecc, a.cognome, a.nome
+    ORDER BY numero_gare DESC, a.cognome
+"""
+
+# Parametri: inizio e fine del mese, ripetuti per la sottoquery e la query esterna
+FREQUENZA_MENSILE = """
+    SELECT
+        COUNT(DISTINCT g.cod_mecc) as arbitri_attivi,
+        COUNT(g.numero_gara) as totale_gare,
+        AVG(gare_per_arbitro.numero_gare) as media_gare_per_arbitro
+    FROM (
+        SELECT cod_mecc, COUNT(*) as numero_gare
+        FROM gare
+        WHERE data_gara BETWEEN ? AND ?
+        AND ruolo = 'AR'
+        GROUP BY cod_mecc
+    ) as gare_per_arbitro
+    JOIN gare g ON gare_per_arbitro.cod_mecc = g.cod_mecc
+    WHERE g.data_gara BETWEEN ? AND ?
+    AND g.ruolo = 'AR'
+"""
+
+# Parametri: inizio e fine del periodo
+FREQUENZA_DISTRIBUZIONE = """
+    SELECT
+        numero_gare,
+        COUNT(*) as num_arbitri
+    FROM (
+        SELECT cod_mecc, COUNT(*) as numero_gare
+        FROM gare
+        WHERE data_gara BETWEEN ? AND ?
+        AND ruolo = 'AR'
+        GROUP BY cod_mecc
+    )
+    GROUP BY numero_gare
+    ORDER BY numero_gare DESC
+"""
+
+# Indici composti e di copertura richiesti dalle query del catalogo
+QUERY_INDEXES = [
+    # Gare di un arbitro in un intervallo di date (export, timeline, frequenze)
+    'CREATE INDEX IF NOT EXISTS idx_gare_arbitro_data_ruolo ON gare (cod_mecc, data_gara, ruolo)',
+    # Gare in un intervallo di date filtrate per ruolo (dashboard, export del periodo)
+    'CREATE INDEX IF NOT EXISTS idx_gare_data_ruolo ON gare (data_gara, ruolo)',
+    # Conteggi e statistiche per ruolo, coperti senza accedere alla tabella
+    'CREATE INDEX IF NOT EXISTS idx_gare_ruolo ON gare (ruolo, numero_gara, cod_mecc)',
+]
+
+# Indici a colonna singola resi superflui da QUERY_INDEXES (ne sono un prefisso)
+OBSOLETE_INDEXES = ['idx_gare_cod_mecc', 'idx_gare_data']
+
+def create_query_indexes(conn):
+    """Crea gli indici del catalogo ed elimina quelli che sostituiscono"""
+    for statement in QUERY_INDEXES:
+        conn.execute(statement)
+    for name in OBSOLETE_INDEXES:
+        conn.execute(f'DROP INDEX IF EXISTS {name}')
+
+_DATE = ('2025-05-01', '2025-05-31')
+_SETTIMANA = ('2025-05-05', '2025-05-11')
+_ARBITRI = '["1", "2"]'
+_FILTRO_COD_MECC = FILTRO_ARBITRI_JSON.format(colonna='cod_mecc')
+
+# Query verificate da check_query_plans: nome -> (sql, parametri di esempio, tabelle lette per intero
+# di proposito). Le tabelle ammesse sono quelle di cui la query usa comunque tutte le righe.
+QUERY_CATALOG = {
+    'dashboard_gare': (DASHBOARD_GARE.format(arbitri=''), _DATE, ()),
+    'dashboard_gare_arbitri': (DASHBOARD_GARE.format(arbitri=_FILTRO_COD_MECC), _DATE + (_ARBITRI,), ()),
+    'dashboard_voti': (DASHBOARD_VOTI.format(arbitri=''), _DATE, ()),
+    'dashboard_voti_arbitri': (DASHBOARD_VOTI.format(arbitri=_FILTRO_COD_MECC), _DATE + (_ARBITRI,), ()),
+    'dashboard_indisponibilita': (DASHBOARD_INDISPONIBILITA.format(arbitri=''), _DATE[::-1], ()),
+    'dashboard_indisponibilita_arbitri': (
+        DASHBOARD_INDISPONIBILITA.format(arbitri=FILTRO_ARBITRI_JSON.format(colonna='arbitro_cod_mecc')),
+        _DATE[::-1] + (_ARBITRI,), ()
+    ),
+    # Le note sono poche e l'intervallo è su due colonne: basta una lettura dell'indice univoco
+    'dashboard_note_periodo': (DASHBOARD_NOTE_PERIODO.format(arbitri=''), _DATE[::-1], ('note_settimanali',)),
+    'dashboard_note_periodo_arbitri': (
+        DASHBOARD_NOTE_PERIODO.format(arbitri=_FILTRO_COD_MECC), _DATE[::-1] + (_ARBITRI,), ('note_settimanali',)
+    ),
+    'referee_week_periodo': (REFEREE_WEEK_PERIODO.format(arbitri=''), _DATE, ()),
+    'referee_week_periodo_arbitri': (REFEREE_WEEK_PERIODO.format(arbitri=_FILTRO_COD_MECC), _DATE + (_ARBITRI,), ()),
+    # L'anagrafica della Dashboard viene sempre letta per intero e ordinata
+    'dashboard_arbitri': (
+        DASHBOARD_ARBITRI + DASHBOARD_FILTRO_SEZIONE + DASHBOARD_FILTRO_CATEGORIA
+        + DASHBOARD_FILTRO_ATTIVITA.format(condizioni=' OR '.join([DASHBOARD_ATTIVITA_SETTIMANE, DASHBOARD_ATTIVITA_TRATTO]))
+        + DASHBOARD_PAGINA,
+        ('ROMA',) + _DATE + ('CND', '["2025-05-05"]', '2025-04-28', '2025-05-01', '2025-05-04',
+                             '2025-05-01', '2025-05-04', '2025-05-04', '2025-05-01', 50, 0),
+        ('arbitri',)
+    ),
+    'dashboard_conteggio_arbitri': (
+        DASHBOARD_CONTEGGIO_ARBITRI + DASHBOARD_FILTRO_ARBITRO + DASHBOARD_FILTRO_SEZIONE,
+        ('ROSSI MARIO', 'ROMA'), ('arbitri',)
+    ),
+    'dashboard_categorie': (DASHBOARD_CATEGORIE, _DATE, ()),
+    # Ricostruzione completa: legge per definizione tutte le righe sorgenti
+    'referee_week_intervalli': (
+        REFEREE_WEEK_INTERVALLI, (), ('gare', 'indisponibilita_periodi', 'note_settimanali')
+    ),
+    'conteggio_gare_ar': (CONTEGGIO_GARE_AR, (), ()),
+    'conteggio_voti_ar': (CONTEGGIO_VOTI_AR, (), ()),
+    'conteggio_voti_totali': (CONTEGGIO_VOTI_TOTALI, (), ('valutazioni',)),
+    'conteggio_voti_ar_ot': (CONTEGGIO_VOTI_AR_OT, (), ()),
+    'conteggio_voti_oa': (CONTEGGIO_VOTI_OA, (), ('valutazioni',)),
+    'conteggio_voti_ot': (CONTEGGIO_VOTI_OT, (), ('valutazioni',)),
+    'ot_gare_per_cognome': (OT_GARE_PER_COGNOME, (), ()),
+    'ot_voti_per_arbitro': (OT_VOTI_PER_ARBITRO, (), ()),
+    'arbitro_per_codice': (ARBITRO_PER_CODICE, ('1',), ()),
+    'aggiorna_regioni_arbitro': (AGGIORNA_REGIONI_ARBITRO, (None, None, '1'), ()),
+    'regioni_appartenenza': (REGIONI_APPARTENENZA, (), ('arbitri',)),
+    'regioni_partenza': (REGIONI_PARTENZA, (), ('arbitri',)),
+    'partenze_arbitri': (
+        PARTENZE_ARBITRI + PARTENZE_FILTRO_APPARTENENZA + PARTENZE_FILTRO_PARTENZA
+        + PARTENZE_FILTRO_SEZIONE + PARTENZE_ORDINAMENTO,
+        ('Lazio', 'Lazio', 'ROMA'), ('arbitri',)
+    ),
+    'salva_nota_settimanale': (SALVA_NOTA_SETTIMANALE, ('1',) + _SETTIMANA + ('', None), ()),
+    'elimina_nota_settimanale': (ELIMINA_NOTA_SETTIMANALE, ('1',) + _SETTIMANA, ()),
+    'nota_settimanale': (NOTA_SETTIMANALE, ('1',) + _SETTIMANA, ()),
+    'tutte_le_note': (TUTTE_LE_NOTE, (), ('note_settimanali',)),
+    'statistiche_gare_ar': (STATISTICHE_GARE_AR, (), ()),
+    'export_gare_periodo': (EXPORT_GARE_PERIODO, _DATE, ()),
+    'export_voti_periodo': (EXPORT_VOTI_PERIODO, _DATE, ()),
+    'html_dashboard_arbitri': (
+        HTML_DASHBOARD_ARBITRI + HTML_DASHBOARD_FILTRO_DA + HTML_DASHBOARD_FILTRO_A + HTML_DASHBOARD_RAGGRUPPAMENTO,
+        _DATE + ('Tutti',), ('arbitri',)
+    ),
+    'carriera_arbitro': (CARRIERA_ARBITRO, ('1',), ()),
+    'carriera_gare': (CARRIERA_GARE, ('1',), ()),
+    'carriera_indisponibilita': (CARRIERA_INDISPONIBILITA, ('1',), ()),
+    'frequenza_arbitri': (FREQUENZA_ARBITRI, _DATE, ()),
+    'frequenza_mensile': (FREQUENZA_MENSILE, _DATE * 2, ()),
+    'frequenza_distribuzione': (FREQUENZA_DISTRIBUZIONE, _DATE, ()),
+}
+
+# Righe del piano che indicano la lettura completa di una tabella ("SCAN g"), anche quando
+# l'indice usato serve solo per l'ordinamento ("SCAN a USING INDEX ...")
+_SCAN_PATTERN = re.compile(r'^SCAN (\w+)(?: USING (?:COVERING )?INDEX \w+)?$')
+
+# Tabelle e alias dopo FROM/JOIN, per ricondurre le righe del piano alle tabelle
+_TABLE_PATTERN = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+
+def get_query_plan(conn, sql, params=()):
+    """Restituisce le righe di EXPLAIN QUERY PLAN di una query"""
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+def _schema_connection():
+    """Connessione in memoria con lo schema del database ma senza dati né statistiche,
+    così i piani dipendono solo dagli indici disponibili e non dalla dimensione delle tabelle"""
+    memory = sqlite3.connect(':memory:')
+    with get_read_connection() as conn:
+        statements = [row[0] for row in conn.execute('''
+            SELECT sql FROM sqlite_master
+            WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+            ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 ELSE 2 END
+        ''')]
+    for statement in statements:
+        memory.execute(statement)
+    return memory
+
+def check_query_plans(conn=None):
+    """Verifica che nessuna query del catalogo legga per intero una tabella non ammessa.
+    Senza connessione usa lo schema del database configurato.
+    Restituisce la lista dei problemi trovati come tuple (nome query, riga del piano)."""
+    if conn is None:
+        conn = _schema_connection()
+
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    views = dict(conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'view'"))
+    problems = []
+    for name, (sql, params, allowed_scans) in QUERY_CATALOG.items():
+        # Il planner espande le viste: i loro alias compaiono nel piano come quelli della query
+        references = _TABLE_PATTERN.findall(sql)
+        for view in {table for table, _ in references if table in views}:
+            references += _TABLE_PATTERN.findall(views[view])
+        
+        aliases = {}
+        for table, alias in references:
+            if table in tables:
+                aliases[table] = table
+                if alias:
+                    aliases[alias] = table
+        
+        for detail in get_query_plan(conn, sql, params):
+            match = _SCAN_PATTERN.match(detail)
+            # Le scansioni di sottoquery e CTE non riguardano tabelle del database
+            table = aliases.get(match.group(1)) if match else None
+            if table and table not in allowed_scans:
+                problems.append((name, detail))
+    return problems
+
+if __name__ == "__main__":
+    # Lo schema da verificare è quello prodotto dalle migrazioni
+    from database import init_database
+    init_database()
+
+    problems = check_query_plans()
+    if problems:
+        print(f"❌ {len(problems)} query con scansione completa di tabella:")
+        for name, detail in problems:
+            print(f"  {name}: {detail}")
+        sys.exit(1)
+    print(f"✅ Piani di esecuzione verificati per {len(QUERY_CATALOG)} query")
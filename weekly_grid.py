@@ -0,0 +1,384 @@
+"""
+Costruzione della griglia settimanale della Dashboard: una riga per arbitro, una colonna per settimana.
+
+Ogni gara, voto, periodo di indisponibilità e nota viene assegnato una sola volta alla settimana (o alle
+settimane) in cui cade e i testi delle celle si ottengono con un unico groupby per (cod_mecc, settimana).
+I testi già composti sono salvati nella tabella referee_week, una riga per arbitro e lunedì con almeno
+una parte non vuota: le scritture ricalcolano solo le coppie arbitro/settimana che toccano
+(refresh_referee_week), mentre Dashboard ed export Excel leggono le righe delle settimane mostrate.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+from db_connection import get_read_connection
+from queries import (
+    FILTRO_ARBITRI_JSON, DASHBOARD_GARE, DASHBOARD_VOTI, DASHBOARD_INDISPONIBILITA, DASHBOARD_NOTE_PERIODO,
+    REFEREE_WEEK_PERIODO, REFEREE_WEEK_INTERVALLI, DASHBOARD_ARBITRI, DASHBOARD_CONTEGGIO_ARBITRI,
+    DASHBOARD_FILTRO_ARBITRO, DASHBOARD_FILTRO_SEZIONE, DASHBOARD_FILTRO_CATEGORIA, DASHBOARD_FILTRO_ATTIVITA,
+    DASHBOARD_ATTIVITA_SETTIMANE, DASHBOARD_ATTIVITA_TRATTO, DASHBOARD_PAGINA
+)
+
+# Separatore tra le parti di una cella e tra le gare della stessa settimana
+SEPARATORE = " • "
+
+# Anno di riferimento per il calcolo degli anni di anzianità
+ANNO_RIFERIMENTO = 2025
+
+# Parti di una cella nell'ordine di visualizzazione: colonna di referee_week -> prefisso
+PARTI = {
+    'gare': "🏃‍♂️ ",
+    'voti': "⭐ ",
+    'indisponibilita': "❌ ",
+    'nota': "📝 ",
+}
+
+
+def week_label(week_start, week_end):
+    """Etichetta della colonna di una settimana, es. '05/05 - 11/05'"""
+    return f"{week_start.strftime('%d/%m')} - {week_end.strftime('%d/%m')}"
+
+
+def _week_bounds(week_ranges):
+    """Inizio e fine (date) delle settimane come array datetime64 ordinati"""
+    starts = np.array([pd.Timestamp(start).normalize() for start, _ in week_ranges], dtype='datetime64[ns]')
+    ends = np.array([pd.Timestamp(end).normalize() for _, end in week_ranges], dtype='datetime64[ns]')
+    return starts, ends
+
+
+def assign_week(dates, week_ranges) -> np.ndarray:
+    """Indice della settimana di ogni data (-1 se fuori da tutte le settimane)"""
+    starts, ends = _week_bounds(week_ranges)
+    values = pd.to_datetime(pd.Series(dates)).to_numpy(dtype='datetime64[ns]')
+    week = np.searchsorted(starts, values, side='right') - 1
+    inside = (week >= 0) & (values <= ends[np.clip(week, 0, None)])
+    return np.where(inside, week, -1)
+
+
+def explode_weeks(periodi: pd.DataFrame, week_ranges, inizio='data_inizio', fine='data_fine') -> pd.DataFrame:
+    """Ripete ogni periodo [inizio, fine] per ciascuna settimana con cui si sovrappone,
+    aggiungendo la colonna 'settimana' con l'indice della settimana"""
+    starts, ends = _week_bounds(week_ranges)
+    data_inizio = pd.to_datetime(periodi[inizio]).to_numpy(dtype='datetime64[ns]')
+    data_fine = pd.to_datetime(periodi[fine]).to_numpy(dtype='datetime64[ns]')
+
+    # Prima settimana che finisce dopo l'inizio, ultima che comincia prima della fine
+    prima = np.searchsorted(ends, data_inizio, side='left')
+    ultima = np.searchsorted(starts, data_fine, side='right') - 1
+    conteggi = np.clip(ultima - prima + 1, 0, None)
+
+    righe = np.repeat(np.arange(len(periodi)), conteggi)
+    esploso = periodi.iloc[righe].copy()
+    esploso['settimana'] = np.repeat(prima, conteggi) + (np.arange(len(righe)) - np.repeat(np.cumsum(conteggi) - conteggi, conteggi))
+    return esploso
+
+
+def _gare_cells(gare_df: pd.DataFrame, week_ranges) -> pd.Series:
+    """'Categoria Girone gg/mm' di ogni gara con categoria e girone, unite per arbitro e settimana"""
+    if gare_df.empty:
+        return pd.Series(dtype=object)
+    gare = gare_df.assign(settimana=assign_week(gare_df['data_gara'], week_ranges))
+    gare = gare[(gare['settimana'] >= 0) & gare['categoria'].map(bool) & gare['girone'].map(bool)]
+    if gare.empty:
+        return pd.Series(dtype=object)
+
+    data = pd.to_datetime(gare['data_gara'])
+    testo = gare['categoria'].astype(str) + ' ' + gare['girone'].astype(str)
+    testo = testo.where(data.isna(), testo + ' ' + data.dt.strftime('%d/%m'))
+    return testo.groupby([gare['cod_mecc'], gare['settimana']], sort=False).agg(SEPARATORE.join)
+
+
+def _voti_cells(voti_df: pd.DataFrame, week_ranges) -> pd.Series:
+    """'OA:x OT:y (COGNOME)' di ogni voto, uniti con la virgola per arbitro e settimana"""
+    if voti_df.empty:
+        return pd.Series(dtype=object)
+    voti = voti_df.assign(settimana=assign_week(voti_df['data_gara'], week_ranges))
+    voti = voti[voti['settimana'] >= 0]
+
+    oa = voti['voto_oa'].map(lambda v: f"OA:{v}" if pd.notna(v) else '')
+    ot = voti['voto_ot'].map(lambda v: f"OT:{v}" if pd.notna(v) else '')
+    cognome_ot = voti['cognome_ot'].map(lambda c: f" ({c})" if pd.notna(c) else '')
+    ot = ot.where(ot == '', ot + cognome_ot)
+    testo = (oa + ' ' + ot).str.strip()
+
+    voti = voti[testo != '']
+    testo = testo[testo != '']
+    if voti.empty:
+        return pd.Series(dtype=object)
+    return testo.groupby([voti['cod_mecc'], voti['settimana']], sort=False).agg(', '.join)
+
+
+def _indisponibilita_cells(indisponibilita_df: pd.DataFrame, week_ranges) -> pd.Series:
+    """Motivi distinti dei periodi di indisponibilità di ogni settimana ('Indisponibile' se senza motivo)"""
+    if indisponibilita_df.empty:
+        return pd.Series(dtype=object)
+    periodi = explode_weeks(indisponibilita_df, week_ranges)
+    if periodi.empty:
+        return pd.Series(dtype=object)
+
+    def motivi(serie):
+        valori = serie.dropna().unique()
+        return ', '.join(valori) if len(valori) > 0 else "Indisponibile"
+
+    # Si usa il codice arbitro risolto in anagrafica invece del codice originale
+    celle = periodi['motivo'].groupby([periodi['arbitro_cod_mecc'], periodi['settimana']], sort=False).agg(motivi)
+    return celle.rename_axis(['cod_mecc', 'settimana'])
+
+
+def _note_cells(note_df: pd.DataFrame, week_ranges) -> pd.Series:
+    """Testo della prima nota di ogni arbitro che si sovrappone alla settimana (le note vuote non compaiono)"""
+    if note_df.empty:
+        return pd.Series(dtype=object)
+    note = explode_weeks(note_df, week_ranges, inizio='settimana_inizio', fine='settimana_fine')
+    note = note.drop_duplicates(['cod_mecc', 'settimana'], keep='first')
+
+    testo = note['nota'].fillna('').astype(str).str.strip()
+    note = note[testo != '']
+    testo = testo[testo != '']
+    if note.empty:
+        return pd.Series(dtype=object)
+    return testo.groupby([note['cod_mecc'], note['settimana']], sort=False).first()
+
+
+def _anzianita_display(anno_anzianita):
+    """Anni di anzianità come testo, '' se l'anno non è disponibile"""
+    if pd.isna(anno_anzianita) or str(anno_anzianita) == '':
+        return ""
+    try:
+        anni_esperienza = ANNO_RIFERIMENTO - int(anno_anzianita)
+    except (ValueError, TypeError):
+        return ""
+    return str(anni_esperienza) if anni_esperienza > 0 else "0"
+
+
+def _ymd(data):
+    """Data come testo 'YYYY-MM-DD', il formato usato nel database"""
+    return pd.Timestamp(data).strftime('%Y-%m-%d')
+
+
+def _full_weeks(week_ranges):
+    """Settimane complete dal lunedì alla domenica che contengono l'inizio di ogni settimana indicata"""
+    settimane = []
+    for week_start, _ in week_ranges:
+        giorno = pd.Timestamp(week_start).normalize()
+        lunedi = giorno - pd.Timedelta(days=giorno.weekday())
+        settimane.append((lunedi, lunedi + pd.Timedelta(days=6)))
+    return settimane
+
+
+def _read_sources(conn, data_inizio, data_fine, codici=None, note=True):
+    """Gare, voti, indisponibilità e (se note) note settimanali che cadono tra data_inizio e data_fine,
+    eventualmente dei soli arbitri in codici, nell'ordine in cui compongono i testi delle celle"""
+    inizio, fine = _ymd(data_inizio), _ymd(data_fine)
+
+    def leggi(sql, colonna, params):
+        if codici is None:
+            return pd.read_sql_query(sql.format(arbitri=''), conn, params=params)
+        filtro = FILTRO_ARBITRI_JSON.format(colonna=colonna)
+        return pd.read_sql_query(sql.format(arbitri=filtro), conn, params=params + [json.dumps(list(codici))])
+
+    gare_df = leggi(DASHBOARD_GARE, 'cod_mecc', [inizio, fine])
+    voti_df = leggi(DASHBOARD_VOTI, 'cod_mecc', [inizio, fine])
+    indisponibilita_df = leggi(DASHBOARD_INDISPONIBILITA, 'arbitro_cod_mecc', [fine, inizio])
+    note_df = leggi(DASHBOARD_NOTE_PERIODO, 'cod_mecc', [fine, inizio]) if note else pd.DataFrame()
+
+    # Le date contano solo come giorni
+    for df, colonne in ((gare_df, ['data_gara']), (voti_df, ['data_gara']),
+                        (indisponibilita_df, ['data_inizio', 'data_fine'])):
+        for colonna in colonne:
+            df[colonna] = pd.to_datetime(df[colonna]).dt.normalize()
+    return gare_df, voti_df, indisponibilita_df, note_df
+
+
+def _cell_parts(week_ranges, gare_df, voti_df, indisponibilita_df, note_df) -> pd.DataFrame:
+    """Testi delle parti delle celle, una colonna per parte (PARTI), indicizzati per (cod_mecc, settimana)"""
+    parti = {
+        'gare': _gare_cells(gare_df, week_ranges),
+        'voti': _voti_cells(voti_df, week_ranges),
+        'indisponibilita': _indisponibilita_cells(indisponibilita_df, week_ranges),
+        'nota': _note_cells(note_df, week_ranges),
+    }
+    parti = {nome: testi for nome, testi in parti.items() if not testi.empty}
+    if not parti:
+        indice = pd.MultiIndex.from_arrays([[], []], names=['cod_mecc', 'settimana'])
+        return pd.DataFrame(index=indice, columns=list(PARTI), dtype=object)
+    return pd.concat(parti, axis=1).reindex(columns=list(PARTI))
+
+
+def combine_parts(parti: pd.DataFrame) -> pd.Series:
+    """Testo delle celle: le parti presenti con il loro prefisso, nell'ordine gare, voti, indisponibilità, nota"""
+    celle = pd.Series('', index=parti.index, dtype=object)
+    for nome, prefisso in PARTI.items():
+        testi = parti[nome].astype(object)
+        testi = prefisso + testi.where(testi.notna() & (testi != ''))
+        celle = celle.where(testi.isna(), celle.where(celle == '', celle + SEPARATORE) + testi)
+    return celle
+
+
+def referee_week_keys(intervalli):
+    """Coppie (cod_mecc, lunedì 'YYYY-MM-DD') delle settimane toccate dagli intervalli (cod_mecc, inizio, fine)"""
+    periodi = pd.DataFrame(list(intervalli), columns=['cod_mecc', 'inizio', 'fine'])
+    periodi['inizio'] = pd.to_datetime(periodi['inizio'], errors='coerce').dt.normalize()
+    periodi['fine'] = pd.to_datetime(periodi['fine'], errors='coerce').dt.normalize()
+    periodi = periodi.dropna()
+    if periodi.empty:
+        return set()
+
+    # Una chiave per ogni lunedì dalla settimana dell'inizio a quella della fine
+    primo = periodi['inizio'] - pd.to_timedelta(periodi['inizio'].dt.weekday, unit='D')
+    conteggi = ((periodi['fine'] - primo).dt.days // 7 + 1).clip(lower=1).to_numpy()
+    righe = np.repeat(np.arange(len(periodi)), conteggi)
+    scarto = np.arange(len(righe)) - np.repeat(np.cumsum(conteggi) - conteggi, conteggi)
+    lunedi = pd.DatetimeIndex(primo.to_numpy()[righe] + scarto * np.timedelta64(7, 'D'))
+    return set(zip(periodi['cod_mecc'].to_numpy()[righe], lunedi.strftime('%Y-%m-%d')))
+
+
+def refresh_referee_week(conn, chiavi=None):
+    """Ricalcola le righe di referee_week delle coppie (cod_mecc, lunedì 'YYYY-MM-DD') indicate, o di tutte
+    se chiavi è None, e restituisce il numero di righe scritte. Va chiamata nella stessa transazione che
+    modifica gare, valutazioni, indisponibilità o note, con le chiavi toccate prima e dopo la modifica."""
+    if chiavi is None:
+        conn.execute('DELETE FROM referee_week')
+        chiavi = referee_week_keys(conn.execute(REFEREE_WEEK_INTERVALLI).fetchall())
+    else:
+        chiavi = set(chiavi)
+        conn.executemany('DELETE FROM referee_week WHERE cod_mecc = ? AND settimana_inizio = ?', chiavi)
+    if not chiavi:
+        return 0
+
+    # Sorgenti degli arbitri coinvolti tra la prima e l'ultima settimana coinvolta
+    lunedi = sorted({settimana for _, settimana in chiavi})
+    week_ranges = _full_weeks([(settimana, None) for settimana in lunedi])
+    codici = sorted({cod_mecc for cod_mecc, _ in chiavi})
+    parti = _cell_parts(week_ranges, *_read_sources(conn, week_ranges[0][0], week_ranges[-1][1], codici))
+
+    # Solo le coppie richieste: le altre settimane degli stessi arbitri non sono cambiate
+    righe = parti.reset_index()
+    righe['settimana'] = np.array(lunedi, dtype=object)[righe['settimana'].to_numpy(dtype=int)]
+    richieste = np.array([chiave in chiavi for chiave in zip(righe['cod_mecc'], righe['settimana'])], dtype=bool)
+    righe = righe[richieste]
+    righe = righe.astype(object).where(righe.notna(), None)
+    conn.executemany(
+        'INSERT INTO referee_week (cod_mecc, settimana_inizio, gare, voti, indisponibilita, nota) VALUES (?, ?, ?, ?, ?, ?)',
+        righe[['cod_mecc', 'settimana'] + list(PARTI)].itertuples(index=False, name=None)
+    )
+    return len(righe)
+
+
+def load_weekly_cells(week_ranges, data_inizio, data_fine, codici=None) -> pd.Series:
+    """Testi delle celle indicizzati per (cod_mecc, indice della settimana in week_ranges), per le settimane
+    dal lunedì alla domenica che contengono l'inizio di ogni settimana di week_ranges e per i soli arbitri
+    in codici se indicati.
+    Le celle delle settimane comprese nel periodo vengono lette da referee_week; per quelle tagliate da
+    data_inizio o data_fine gare, voti e indisponibilità sono ricalcolati sul solo tratto compreso nel
+    periodo, mentre la nota resta quella della settimana."""
+    settimane = _full_weeks(week_ranges)
+    if not settimane or (codici is not None and len(codici) == 0):
+        return pd.Series(dtype=object)
+    indice = {_ymd(inizio): i for i, (inizio, _) in enumerate(settimane)}
+    periodo_inizio, periodo_fine = pd.Timestamp(data_inizio).normalize(), pd.Timestamp(data_fine).normalize()
+
+    sql, params = REFEREE_WEEK_PERIODO.format(arbitri=''), [min(indice), max(indice)]
+    if codici is not None:
+        sql = REFEREE_WEEK_PERIODO.format(arbitri=FILTRO_ARBITRI_JSON.format(colonna='cod_mecc'))
+        params.append(json.dumps(list(codici)))
+
+    with get_read_connection() as conn:
+        righe = pd.read_sql_query(sql, conn, params=params)
+        righe['settimana'] = righe['settimana_inizio'].map(indice)
+        righe = righe.dropna(subset=['settimana']).astype({'settimana': int})
+        parti = righe.set_index(['cod_mecc', 'settimana'])[list(PARTI)]
+
+        for i, (inizio, fine) in enumerate(settimane):
+            if inizio >= periodo_inizio and fine <= periodo_fine:
+                continue
+            tagliata = parti.index.get_level_values('settimana') == i
+            parti.loc[tagliata, ['gare', 'voti', 'indisponibilita']] = None
+            sorgenti = _read_sources(conn, max(inizio, periodo_inizio), min(fine, periodo_fine), codici, note=False)
+            parziali = _cell_parts([(inizio, fine)], *sorgenti).drop(columns='nota')
+            parti = parziali.rename(index={0: i}, level='settimana').combine_first(parti)
+
+    return combine_parts(parti.reindex(columns=list(PARTI)))
+
+
+def load_weekly_table(codici, week_ranges, data_inizio, data_fine) -> pd.DataFrame:
+    """Testi delle celle come tabella: una riga per ogni codice di codici (nell'ordine dato), una colonna
+    per ogni settimana di week_ranges (indici 0..n-1), '' dove l'arbitro non ha niente da mostrare"""
+    celle = load_weekly_cells(week_ranges, data_inizio, data_fine, codici)
+    settimane = range(len(week_ranges))
+    if celle.empty:
+        return pd.DataFrame('', index=codici, columns=settimane)
+    return celle.unstack().reindex(index=codici, columns=settimane).fillna('')
+
+
+def load_weekly_grid(arbitri_df: pd.DataFrame, week_ranges, data_inizio, data_fine) -> pd.DataFrame:
+    """Griglia della Dashboard Settimanale: colonne Arbitro, Sez., Età, Anz. e una colonna per ogni
+    settimana di week_ranges con gare (🏃‍♂️), voti (⭐), indisponibilità (❌) e nota (📝) dell'arbitro.
+    Le righe seguono l'ordine di arbitri_df."""
+    griglia = load_weekly_table(arbitri_df['cod_mecc'].tolist(), week_ranges, data_inizio, data_fine)
+    griglia.columns = [week_label(week_start, week_end) for week_start, week_end in week_ranges]
+
+    anagrafica = pd.DataFrame({
+        'Arbitro': (arbitri_df['cognome'].astype(str) + ' ' + arbitri_df['nome'].astype(str)).tolist(),
+        'Sez.': arbitri_df['sezione'].tolist() if 'sezione' in arbitri_df else '',
+        'Età': arbitri_df['eta'].tolist() if 'eta' in arbitri_df else '',
+        'Anz.': arbitri_df['anno_anzianita'].map(_anzianita_display).tolist() if 'anno_anzianita' in arbitri_df else '',
+    })
+    return pd.concat([anagrafica, griglia.reset_index(drop=True)], axis=1)
+
+
+def _dashboard_filters(week_ranges, data_inizio, data_fine, arbitro=None, sezione=None, categoria=None, solo_attivi=False):
+    """Condizioni SQL da aggiungere a DASHBOARD_ARBITRI e relativi parametri per i filtri della Dashboard:
+    etichetta 'Cognome Nome' dell'arbitro, sezione, categoria di almeno una gara del periodo e, con
+    solo_attivi, almeno una cella non vuota nelle settimane di week_ranges"""
+    sql, params = '', []
+    if arbitro:
+        sql += DASHBOARD_FILTRO_ARBITRO
+        params.append(arbitro)
+    if sezione:
+        sql += DASHBOARD_FILTRO_SEZIONE
+        params.append(sezione)
+    if categoria:
+        sql += DASHBOARD_FILTRO_CATEGORIA
+        params += [_ymd(data_inizio), _ymd(data_fine), categoria]
+
+    if solo_attivi and week_ranges:
+        # Le settimane intere hanno attività se hanno una riga in referee_week; per quelle tagliate
+        # dal periodo si controllano le righe sorgenti del solo tratto compreso, come in load_weekly_cells
+        periodo_inizio, periodo_fine = pd.Timestamp(data_inizio).normalize(), pd.Timestamp(data_fine).normalize()
+        settimane = _full_weeks(week_ranges)
+        intere = [_ymd(inizio) for inizio, fine in settimane if inizio >= periodo_inizio and fine <= periodo_fine]
+        condizioni = [(DASHBOARD_ATTIVITA_SETTIMANE, [json.dumps(intere)])] if intere else []
+        for inizio, fine in settimane:
+            if inizio >= periodo_inizio and fine <= periodo_fine:
+                continue
+            tratto_inizio, tratto_fine = _ymd(max(inizio, periodo_inizio)), _ymd(min(fine, periodo_fine))
+            condizioni.append((DASHBOARD_ATTIVITA_TRATTO, [
+                _ymd(inizio), tratto_inizio, tratto_fine, tratto_inizio, tratto_fine, tratto_fine, tratto_inizio
+            ]))
+        sql += DASHBOARD_FILTRO_ATTIVITA.format(condizioni=' OR '.join(condizione for condizione, _ in condizioni))
+        for _, valori in condizioni:
+            params += valori
+    return sql, params
+
+
+def count_dashboard_arbitri(week_ranges, data_inizio, data_fine, arbitro=None, sezione=None, categoria=None,
+                            solo_attivi=False) -> int:
+    """Numero di arbitri della Dashboard che soddisfano i filtri (vedi _dashboard_filters)"""
+    sql, params = _dashboard_filters(week_ranges, data_inizio, data_fine, arbitro, sezione, categoria, solo_attivi)
+    with get_read_connection() as conn:
+        return conn.execute(DASHBOARD_CONTEGGIO_ARBITRI + sql, params).fetchone()[0]
+
+
+def load_weekly_page(week_ranges, data_inizio, data_fine, pagina=1, per_pagina=50, arbitro=None, sezione=None,
+                     categoria=None, solo_attivi=False) -> pd.DataFrame:
+    """Griglia della Dashboard (load_weekly_grid) per la pagina indicata (da 1) degli arbitri che soddisfano
+    i filtri, in ordine di cognome e nome: filtri e pagina sono applicati nella query degli arbitri e le celle
+    vengono lette e composte solo per gli arbitri della pagina"""
+    sql, params = _dashboard_filters(week_ranges, data_inizio, data_fine, arbitro, sezione, categoria, solo_attivi)
+    with get_read_connection() as conn:
+        arbitri_df = pd.read_sql_query(
+            DASHBOARD_ARBITRI + sql + DASHBOARD_PAGINA, conn, params=params + [per_pagina, (pagina - 1) * per_pagina]
+        )
+    return load_weekly_grid(arbitri_df, week_ranges, data_inizio, data_fine)